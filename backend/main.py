@@ -1,26 +1,41 @@
 
+import asyncio
+import json
 import os
-import threading
 from datetime import datetime
 from http.client import HTTPException
 from os import listdir
 from pathlib import Path
 
 from fastapi import Form
-from fastapi import FastAPI, UploadFile, File, APIRouter
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, APIRouter, Body, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
 
 import subprocess
-import requests
 
-from src.stitcher_step1.main import OPENCV_DIR_NAME
+from src.stitcher_step1.main import CLUSTER_MANIFEST_NAME, OPENCV_DIR_NAME
 from src.file_query import get_uuid_by_name
-from src.process import run_coroutine_in_thread, request_odm_stitch
+from src.file_response import conditional_file_response
+from src.odm_archive import ARCHIVE_FILE_NAME, get_archive_info, get_archive_path, get_checksum_headers, odm_archive
+from src.odm_client import odm_client
+from src.odm_poller import odm_poller
+from src.job_queue import JobScheduler, JOB_STATUS
+from src.process import run_stitch_job, run_odm_stitch_job
 from src.server_info import SERVER_INFO_FILE, SERVER_INFO, DATA_DIR
+from src.state import DATA_STATUS, get_state, update_state
 from src.status import get_data_status_step1, get_data_status_step2
-from src.stitcher_step1.main import stitch_run
+from src.thumbnail import MAX_THUMBNAIL_PAGE_SIZE, THUMBNAIL_KINDS, THUMBNAIL_PAGE_SIZE, THUMBNAIL_SIZE, clamp_size, \
+    get_thumbnail, get_thumbnails, list_thumbnail_images
+from src.upload import SESSION_CHUNK_SIZE, SessionFinalizedError, UploadSession, start_session_sweeper, write_upload
+from src.zip_stream import iter_zip
+from src.stitcher_step1.src.cluster import CLUSTER_METHODS, DEFAULT_CLUSTER_METHOD
+from src.stitcher_step1.src.feature_cache import add_feature_profiles, schedule_features
+from src.stitcher_step1.src.matching import DEFAULT_MATCHING_MODE, MATCHING_MODES
+from src.stitcher_step1.src.preview import PREVIEW_FILE_NAME, PREVIEW_INFO_FILE_NAME, get_preview_dir, make_preview
+from src.stitcher_step1.src.profile import DEFAULT_PROFILE, PROFILES
+from src.stitcher_step1.src.tiles import TILE_FORMAT, ensure_tiles, get_dzi_path, get_tiles_dir
+from src.stitcher_step1.src.metadata.index import INDEX_FILE_NAME, update_index
 
 import time
 
@@ -35,6 +50,7 @@ INIT_OPTIONS = {
 
 app = FastAPI()
 router = APIRouter()
+job_scheduler = JobScheduler({1: run_stitch_job, 2: run_odm_stitch_job})
 origins = [
     "http://localhost:5173",
     "http://localhost:8080",
@@ -101,32 +117,107 @@ async def post_server_info(info: dict):
 async def stitch(option: dict):
     step = option["step"]
     id = option["id"]
+    priority = int(option.get("priority", 0))
     size = DIVIDE_THRESHOLD
     if step == 1:
         size = option["size"]
         scan = option["scan"]
+        profile = option.get("profile", DEFAULT_PROFILE)
+        if profile not in PROFILES:
+            return JSONResponse(content={"error": f"Invalid profile, available : {list(PROFILES.keys())}"},
+                                status_code=400)
+        cluster_method = option.get("cluster", DEFAULT_CLUSTER_METHOD)
+        if cluster_method not in CLUSTER_METHODS:
+            return JSONResponse(
+                content={"error": f"Invalid cluster method, available : {list(CLUSTER_METHODS.keys())}"},
+                status_code=400)
+        matching = option.get("matching", DEFAULT_MATCHING_MODE)
+        if matching not in MATCHING_MODES:
+            return JSONResponse(content={"error": f"Invalid matching mode, available : {list(MATCHING_MODES.keys())}"},
+                                status_code=400)
     print(f"step: {step}, id: {id}, size: {size}")
     if step == 1:
-        input_path = Path(DATA_DIR) / id
-        print(f"input_path: {input_path}")
-        thread = threading.Thread(target=run_coroutine_in_thread, args=(stitch_run, input_path, size, scan))
-        thread.start()
-        return JSONResponse(content={"message": f"Task {id} is added to queue"}, status_code=200)
+        args = {"divide_threshold": size, "scans": scan, "profile": profile}
+        # 클러스터 정합 프로세스 수와 프로세스당 OpenCV 스레드 수 (선택)
+        if "workers" in option:
+            args["stitch_workers"] = int(option["workers"])
+        if "cv_threads" in option:
+            args["cv_threads"] = int(option["cv_threads"])
+        # 클러스터 분할 방법과 이웃 클러스터가 공유할 경계 폭(미터) (선택)
+        if "cluster" in option:
+            args["cluster_method"] = cluster_method
+        if "overlap" in option:
+            args["overlap"] = float(option["overlap"])
+        # GPS 좌표상 이웃한 이미지와만 특징점 매칭 (선택), knn은 neighbors, radius는 radius(미터)를 사용
+        if "matching" in option:
+            args["matching"] = matching
+        if "neighbors" in option:
+            args["neighbors"] = int(option["neighbors"])
+        if "radius" in option:
+            args["radius"] = float(option["radius"])
+        # 특징점 캐시와 디코딩 이미지 캐시 사용 여부 (선택, 기본값 사용)
+        if "feature_cache" in option:
+            args["feature_cache"] = bool(option["feature_cache"])
+        if "image_cache" in option:
+            args["image_cache"] = bool(option["image_cache"])
+        # 정합 결과의 타일 피라미드를 미리 만들지 여부 (선택, 만들지 않으면 처음 요청될 때 만듦)
+        if "tiles" in option:
+            args["tiles"] = bool(option["tiles"])
+        # 이후 업로드되는 이미지는 요청된 프로파일의 특징점도 미리 계산함
+        if (Path(DATA_DIR) / id).exists():
+            await asyncio.to_thread(add_feature_profiles, str(Path(DATA_DIR) / id), [profile])
+        job, created = job_scheduler.submit(1, id, args, priority)
+        message = f"Task {id} is added to queue" if created else f"Task {id} is already in queue"
+        return JSONResponse(content={"message": message, "jobId": job["jobId"]}, status_code=200)
     elif step == 2:
-        uuid = get_uuid_by_name(id)
-        print(f"uuid: {uuid}")
-        thread = threading.Thread(target=run_coroutine_in_thread, args=(request_odm_stitch, uuid, id))
-        thread.start()
-        return JSONResponse(content={"message": "Task is created"}, status_code=200)
+        if not (Path(DATA_DIR) / id).exists():
+            return JSONResponse(content={"error": "Data not found"}, status_code=404)
+        # 상태 조회는 ODM 작업을 만들지 않으므로 작업이 없으면 여기서 만듦
+        if await ensure_odm_task(id) is None:
+            return JSONResponse(content={"error": "Cannot create ODM task"}, status_code=500)
+        job, created = job_scheduler.submit(2, id, {}, priority)
+        message = "Task is created" if created else "Task is already in queue"
+        return JSONResponse(content={"message": message, "jobId": job["jobId"]}, status_code=200)
     else:
         return JSONResponse(content={"error": "Invalid step"}, status_code=400)
 
 
+@router.get("/jobs")
+async def get_jobs(status: str = None, id: str = None):
+    return JSONResponse(content={"jobs": job_scheduler.list_jobs(status=status, data_id=id)}, status_code=200)
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_scheduler.get(job_id)
+    if job is None:
+        return JSONResponse(content={"error": "Job not found"}, status_code=404)
+    return JSONResponse(content=job, status_code=200)
+
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = job_scheduler.cancel(job_id)
+    if job is None:
+        return JSONResponse(content={"error": "Job not found"}, status_code=404)
+    if job["status"] != JOB_STATUS["CANCELED"]:
+        return JSONResponse(content={"error": f"Job is {job['status']}"}, status_code=409)
+    return JSONResponse(content=job, status_code=200)
+
+
+@router.get("/stitch/profiles")
+async def get_stitch_profiles():
+    return JSONResponse(content={"default": DEFAULT_PROFILE, "profiles": PROFILES,
+                                 "defaultClusterMethod": DEFAULT_CLUSTER_METHOD, "clusterMethods": CLUSTER_METHODS,
+                                 "defaultMatchingMode": DEFAULT_MATCHING_MODE, "matchingModes": MATCHING_MODES},
+                        status_code=200)
+
+
 @router.delete("/delete/{id}")
 async def delete_data(id: str):
     try:
         uuid = get_uuid_by_name(id)
-        requests.post(f"{SERVER_INFO['ODM_URL']}/task/remove", json={"uuid": uuid})
+        await odm_client.task_remove_async(uuid)
         data_path = Path(DATA_DIR) / id
         if data_path.exists():
             subprocess.run(['rm', '-rf', str(data_path)])
@@ -139,11 +230,11 @@ async def delete_data(id: str):
 
 @router.post("/reset/{id}")
 async def reset_data(id: str):
-    # 해당 폴더의 images와 uuid_로 시작하지 않는 파일 삭제
+    # 해당 폴더의 images와 uuid_로 시작하지 않는 파일 삭제 (메타데이터 인덱스는 유지)
     data_path = Path(DATA_DIR) / id
     if data_path.exists():
         for file in listdir(data_path):
-            if file.startswith("uuid_") or os.path.isdir(data_path / file):
+            if file.startswith("uuid_") or file == INDEX_FILE_NAME or os.path.isdir(data_path / file):
                 continue
             (data_path / file).unlink()
 
@@ -151,49 +242,231 @@ async def reset_data(id: str):
     if opencv_dir.exists():
         subprocess.run(['rm', '-rf', str(opencv_dir)])
 
-    response = requests.post(f"{SERVER_INFO['ODM_URL']}/task/new/init", files=INIT_OPTIONS)
+    response = await odm_client.task_new_init_async(files=INIT_OPTIONS)
     print(f"response: {response.json()}")
     if response.status_code == 200:
         uuid = response.json()["uuid"]
         # 기존에 생성된 uuid 파일이 있다면 uuid를 얻음
         old_uuid = get_uuid_by_name(id)
         if old_uuid:
-            requests.post(f"{SERVER_INFO['ODM_URL']}/task/remove", json={"uuid": old_uuid})
+            await odm_client.task_remove_async(old_uuid)
         uuid_files = [file for file in listdir(Path(DATA_DIR) / id) if file.startswith("uuid_")]
         for file in uuid_files:
             (Path(DATA_DIR) / id / file).unlink()
         with open(Path(DATA_DIR) / id / f"uuid_{uuid}.txt", "w") as f:
             f.write(f"Task is created in {datetime.now()}")
+        odm_poller.register(uuid)
         return JSONResponse(content={"message": "Task is reset"}, status_code=200)
     else:
         return JSONResponse(content={"error": "Cannot reset task"}, status_code=500)
 
 
 @router.get("/stitched_image/{id}/{step}")
-async def stitched_image(id: str, step: int):
+async def stitched_image(id: str, step: int, request: Request):
     if step == 1:
         image_dir = Path(DATA_DIR) / id / OPENCV_DIR_NAME
         if not image_dir.exists():
             raise HTTPException(status_code=404, detail="Image directory not found")
         image_files = [file.name for file in image_dir.iterdir() if
                        file.is_file() and file.suffix.lower() in ['.jpg', '.jpeg', '.png']]
-        return JSONResponse(content={"url": image_files}, status_code=200)
+        # GPS 미리보기가 있으면 함께 알려줌 (/preview/{id}로 받음)
+        has_preview = (Path(get_preview_dir(str(Path(DATA_DIR) / id))) / PREVIEW_FILE_NAME).exists()
+        return JSONResponse(content={"url": image_files, "preview": PREVIEW_FILE_NAME if has_preview else None},
+                            status_code=200)
 
     elif step == 2:
+        # 결과가 서버에 저장되어 있으면 ODM 서버 대신 저장된 파일의 주소를 반환함
+        info = await asyncio.to_thread(get_archive_info, id)
+        if info is not None:
+            download_path = str(request.url_for("download_odm_archive", id=id))
+            return JSONResponse(content={"url": download_path, "cached": True, "sha256": info["sha256"]},
+                                status_code=200)
         download_path = SERVER_INFO["ODM_URL"] + "/task/" + get_uuid_by_name(id) + "/download/all.zip"
-        return JSONResponse(content={"url": download_path}, status_code=200)
+        return JSONResponse(content={"url": download_path, "cached": False}, status_code=200)
     else:
         return JSONResponse(content={"stitchedImage": "Invalid step"}, status_code=400)
 
 
+@router.get("/stitched_image/{id}/{step}/zip")
+async def download_stitched_images_zip(id: str, step: int, manifest: bool = False):
+    """
+    Stream zip of Step 1 outputs (mosaics, clustered.png, logs and report), built on the fly without temporary file
+    manifest=true also includes the cluster manifest
+    """
+    if step != 1:
+        return JSONResponse(content={"error": "Invalid step"}, status_code=400)
+    output_dir = Path(DATA_DIR) / id / OPENCV_DIR_NAME
+    if not output_dir.exists():
+        return JSONResponse(content={"error": "Image directory not found"}, status_code=404)
+    files = [(file.name, str(file)) for file in sorted(output_dir.iterdir()) if
+             file.is_file() and file.suffix.lower() in ['.jpg', '.jpeg', '.png', '.json', '.txt'] and
+             (manifest or file.name != CLUSTER_MANIFEST_NAME)]
+    # 동기 generator이므로 파일 읽기는 스레드 풀에서 실행됨
+    return StreamingResponse(iter_zip(files), media_type="application/zip",
+                             headers={"Content-Disposition": f'attachment; filename="{id}_step1.zip"'})
+
+
 @router.get("/stitched_image/download/{data_name}/{file_name}")
-async def download_stitched_image(data_name: str, file_name: str):
+async def download_stitched_image(data_name: str, file_name: str, request: Request):
     print(f"path = {Path(DATA_DIR) / data_name / OPENCV_DIR_NAME / file_name}")
+    # ETag/Last-Modified로 변경되지 않은 파일은 304, Range 요청은 이어받기로 처리함
+    response = conditional_file_response(request, str(Path(DATA_DIR) / data_name / OPENCV_DIR_NAME / file_name),
+                                         media_type="image/jpeg", filename=file_name)
+    if response is None:
+        return JSONResponse(content={"error": "Image not found"}, status_code=404)
+    return response
+
+
+@router.get("/stitched_image/tiles/{data_name}/{name}.dzi")
+async def get_stitched_image_dzi(data_name: str, name: str, request: Request):
+    """
+    Deep Zoom descriptor of the stitched image {name}.jpg, tiles are built if they do not exist
+    """
+    image_path = str(Path(DATA_DIR) / data_name / OPENCV_DIR_NAME / f"{name}.jpg")
+    if not await asyncio.to_thread(ensure_tiles, image_path):
+        return JSONResponse(content={"error": "Image not found"}, status_code=404)
+    response = conditional_file_response(request, get_dzi_path(image_path), media_type="application/xml")
+    if response is None:
+        return JSONResponse(content={"error": "Image not found"}, status_code=404)
+    return response
+
+
+@router.get("/stitched_image/tiles/{data_name}/{name}_files/{level}/{tile}")
+async def get_stitched_image_tile(data_name: str, name: str, level: int, tile: str, request: Request):
+    """
+    Tile {col}_{row}.jpg of the level of the stitched image {name}.jpg
+    """
+    col_row, _, extension = tile.partition(".")
+    col, _, row = col_row.partition("_")
+    if extension != TILE_FORMAT or not col.isdigit() or not row.isdigit():
+        return JSONResponse(content={"error": "Invalid tile"}, status_code=400)
+    image_path = str(Path(DATA_DIR) / data_name / OPENCV_DIR_NAME / f"{name}.jpg")
+    if not await asyncio.to_thread(ensure_tiles, image_path):
+        return JSONResponse(content={"error": "Image not found"}, status_code=404)
+    tile_path = Path(get_tiles_dir(image_path)) / str(level) / f"{int(col)}_{int(row)}.{TILE_FORMAT}"
+    response = conditional_file_response(request, str(tile_path), media_type="image/jpeg")
+    if response is None:
+        return JSONResponse(content={"error": "Tile not found"}, status_code=404)
+    return response
+
+
+@router.get("/odm_result/{id}")
+async def get_odm_archive_status(id: str):
+    """
+    Status of the ODM result archive stored in the server (ready, downloading or missing)
+    """
+    if not (Path(DATA_DIR) / id).exists():
+        return JSONResponse(content={"error": "Data not found"}, status_code=404)
+    return JSONResponse(content=await asyncio.to_thread(odm_archive.status, id), status_code=200)
+
+
+@router.post("/odm_result/{id}")
+async def fetch_odm_archive(id: str):
+    """
+    Download the ODM result archive of the completed task into the server in background
+    """
+    if not (Path(DATA_DIR) / id).exists():
+        return JSONResponse(content={"error": "Data not found"}, status_code=404)
+    uuid = get_uuid_by_name(id)
+    status = await asyncio.to_thread(get_data_status_step2, id)
+    if uuid is None or status["status"] != DATA_STATUS["DONE"]:
+        return JSONResponse(content={"error": "ODM task is not completed"}, status_code=409)
+    # 자동으로 다시 받지 않는 실패한 작업도 요청하면 다시 받음
+    started = await asyncio.to_thread(odm_archive.schedule, id, uuid, True)
+    return JSONResponse(content={"started": started, **odm_archive.status(id)}, status_code=202)
+
+
+@router.get("/odm_result/{id}/" + ARCHIVE_FILE_NAME, name="download_odm_archive")
+async def download_odm_archive(id: str, request: Request):
+    """
+    ODM result archive stored in the server, with Range/ETag support and sha256 checksum headers
+    """
+    info = await asyncio.to_thread(get_archive_info, id)
+    response = conditional_file_response(request, get_archive_path(id), media_type="application/zip",
+                                         filename=f"{id}_{ARCHIVE_FILE_NAME}",
+                                         headers=get_checksum_headers(info)) if info is not None else None
+    if response is None:
+        return JSONResponse(content={"error": "Archive is not downloaded", **odm_archive.status(id)},
+                            status_code=404)
+    return response
+
+
+@router.post("/preview/{id}")
+async def create_preview(id: str, option: dict = Body(default={})):
+    """
+    Build coarse mosaic from GPS footprints without feature matching
+    option (all optional): fov, heading_offset, ground_altitude, max_size
+    ground_altitude is the altitude of the ground above sea level, estimated from the GPS altitudes if omitted
+    """
+    data_path = Path(DATA_DIR) / id
+    if not (data_path / "images").exists():
+        return JSONResponse(content={"error": "Data not found"}, status_code=404)
+    args = {}
+    for key, cast in (("fov", float), ("heading_offset", float), ("ground_altitude", float), ("max_size", int)):
+        if key in option:
+            args[key] = cast(option[key])
     try:
-        return FileResponse(Path(DATA_DIR) / data_name / OPENCV_DIR_NAME / file_name, filename=file_name,
-                            media_type="image/jpeg")
-    except FileNotFoundError:
-        raise HTTPException(status_code=404, detail="Image directory not found")
+        info = await asyncio.to_thread(make_preview, str(data_path), **args)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    return JSONResponse(content={**info, "url": PREVIEW_FILE_NAME}, status_code=200)
+
+
+@router.get("/preview/{id}")
+async def get_preview(id: str, request: Request):
+    preview_path = Path(get_preview_dir(str(Path(DATA_DIR) / id))) / PREVIEW_FILE_NAME
+    response = conditional_file_response(request, str(preview_path), media_type="image/jpeg",
+                                         filename=f"{id}_{PREVIEW_FILE_NAME}")
+    if response is None:
+        return JSONResponse(content={"error": "Preview not found"}, status_code=404)
+    return response
+
+
+@router.get("/preview/{id}/info")
+async def get_preview_info(id: str):
+    info_path = Path(get_preview_dir(str(Path(DATA_DIR) / id))) / PREVIEW_INFO_FILE_NAME
+    if not info_path.exists():
+        return JSONResponse(content={"error": "Preview not found"}, status_code=404)
+    with open(info_path, "r") as f:
+        return JSONResponse(content=json.load(f), status_code=200)
+
+
+@router.get("/thumbnails/{id}")
+async def get_thumbnail_page(id: str, kind: str = "images", page: int = 0, page_size: int = THUMBNAIL_PAGE_SIZE,
+                             size: int = THUMBNAIL_SIZE, inline: bool = False):
+    """
+    Thumbnails of a page of input images (kind=images) or stitched outputs (kind=outputs), sorted by name
+    inline=true includes base64 encoded thumbnails so a page is loaded in one request
+    """
+    if kind not in THUMBNAIL_KINDS:
+        return JSONResponse(content={"error": f"Invalid kind, available : {list(THUMBNAIL_KINDS.keys())}"},
+                            status_code=400)
+    if page < 0 or not 1 <= page_size <= MAX_THUMBNAIL_PAGE_SIZE:
+        return JSONResponse(content={"error": f"page should be >= 0 and page_size between 1 and "
+                                              f"{MAX_THUMBNAIL_PAGE_SIZE}"}, status_code=400)
+    size = clamp_size(size)
+    image_paths = await asyncio.to_thread(list_thumbnail_images, str(Path(DATA_DIR) / id), kind)
+    page_paths = image_paths[page * page_size:(page + 1) * page_size]
+    items = await asyncio.to_thread(get_thumbnails, page_paths, size, inline)
+    for item in items:
+        item["url"] = f"/api/thumbnail/{id}/{kind}/{item['name']}?size={size}"
+    return JSONResponse(content={"kind": kind, "page": page, "pageSize": page_size, "size": size,
+                                 "total": len(image_paths), "nPages": -(-len(image_paths) // page_size),
+                                 "items": items}, status_code=200)
+
+
+@router.get("/thumbnail/{id}/{kind}/{file_name}")
+async def get_thumbnail_image(id: str, kind: str, file_name: str, request: Request, size: int = THUMBNAIL_SIZE):
+    if kind not in THUMBNAIL_KINDS:
+        return JSONResponse(content={"error": f"Invalid kind, available : {list(THUMBNAIL_KINDS.keys())}"},
+                            status_code=400)
+    image_path = str(Path(DATA_DIR) / id / THUMBNAIL_KINDS[kind] / file_name)
+    thumbnail_path = await asyncio.to_thread(get_thumbnail, image_path, clamp_size(size))
+    response = conditional_file_response(request, thumbnail_path, media_type="image/jpeg") \
+        if thumbnail_path is not None else None
+    if response is None:
+        return JSONResponse(content={"error": "Image not found"}, status_code=404)
+    return response
 
 
 @router.get("/error_log/{id}/{step}")
@@ -207,7 +480,7 @@ async def get_status(id: str, step: int):
 
         return JSONResponse(content={"errorLog": error_log}, status_code=200)
     elif step == 2:
-        status = get_data_status_step2(id)
+        status = await asyncio.to_thread(get_data_status_step2, id)
         return JSONResponse(content={"errorLog": status["data"]["errorLog"]}, status_code=200)
     else:
         return JSONResponse(content={"errorLog": "Invalid step"}, status_code=400)
@@ -223,25 +496,10 @@ async def get_data_list():
         # DATA_DIR 내의 폴더 목록을 가져옴
         folder_names = [name for name in os.listdir(DATA_DIR) if os.path.isdir(os.path.join(DATA_DIR, name))]
 
-        results = []
-        name = ""
-        for folder_name in folder_names:
-            # print(folder_name)
-            if not os.listdir(os.path.join(DATA_DIR, folder_name)):
-                continue
-            uploaded_time, n_image, status_1 = get_data_status_step1(folder_name)
-            print(f"status_1: {status_1}")
-            status_2 = get_data_status_step2(folder_name)
-            print(f"status_2: {status_2}")
-            if name != "":
-                folder_name = name
-            results.append({
-                "name": folder_name,
-                "time": uploaded_time,
-                "size": n_image,
-                "status_1": status_1,
-                "status_2": status_2
-            })
+        folder_names = [folder_name for folder_name in folder_names
+                        if os.listdir(os.path.join(DATA_DIR, folder_name))]
+        # 폴더별 상태 조회는 파일을 읽으므로 스레드에서 동시에 실행함
+        results = await asyncio.gather(*[get_data_summary(folder_name) for folder_name in folder_names])
         return JSONResponse(content={"data": results}, status_code=200)
 
     except FileNotFoundError:
@@ -250,6 +508,21 @@ async def get_data_list():
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
 
+async def get_data_summary(folder_name: str) -> dict:
+    (uploaded_time, n_image, status_1), status_2 = await asyncio.gather(
+        asyncio.to_thread(get_data_status_step1, folder_name),
+        asyncio.to_thread(get_data_status_step2, folder_name))
+    print(f"status_1: {status_1}")
+    print(f"status_2: {status_2}")
+    return {
+        "name": folder_name,
+        "time": uploaded_time,
+        "size": n_image,
+        "status_1": status_1,
+        "status_2": status_2
+    }
+
+
 # 허용된 파일인지 확인하는 함수
 def allowed_file(filename: str) -> bool:
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -275,35 +548,216 @@ async def upload_file(id: str, files: list[UploadFile] = File(...), total: int =
     return await save_file(files, id, total)
 
 
+@router.post("/upload_session/{id}")
+async def create_upload_session(id: str, option: dict):
+    """
+    Create resumable upload session
+    option: {"files": [{"name": "a.jpg", "size": 15000000, "sha256": "..."}], "chunkSize": 4194304, "total": 120,
+             "profiles": ["balanced"]}
+    chunkSize, total and profiles are optional. total is the number of images expected in the dataset,
+    default is the number of images already uploaded plus new files of the session.
+    profiles are stitching profiles whose features are precomputed in addition to the default profile
+    """
+    if not all([c.isalnum() or c in ['-', '_'] for c in id]):
+        return JSONResponse(content={"error": "ID should contain only alphabets, numbers, - and _"}, status_code=422)
+    upload_path = await prepare_upload(id)
+    data_path = Path(DATA_DIR) / id
+    files = option.get("files") or []
+    try:
+        await asyncio.to_thread(add_feature_profiles, str(data_path), list(option.get("profiles") or []))
+        session = await asyncio.to_thread(UploadSession.create, str(data_path), id, files,
+                                          int(option.get("chunkSize", SESSION_CHUNK_SIZE)))
+    except (ValueError, AttributeError, TypeError) as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+
+    if "total" in option:
+        total = int(option["total"])
+    else:
+        state = await asyncio.to_thread(get_state, data_path)
+        total = state["upload"]["nImages"] + len([file for file in files if not (upload_path / file["name"]).exists()])
+    await start_upload(data_path, total)
+    return JSONResponse(content=session.progress(), status_code=200)
+
+
+@router.get("/upload_session/{id}/{session_id}")
+async def get_upload_session(id: str, session_id: str):
+    session = await asyncio.to_thread(UploadSession.load, str(Path(DATA_DIR) / id), session_id)
+    if session is None:
+        return JSONResponse(content={"error": "Session not found"}, status_code=404)
+    return JSONResponse(content=session.progress(), status_code=200)
+
+
+@router.put("/upload_session/{id}/{session_id}/{file_name}")
+async def upload_session_chunk(id: str, session_id: str, file_name: str, offset: int, request: Request):
+    """
+    Upload one chunk of the file, request body is raw bytes of the chunk
+    """
+    session = await asyncio.to_thread(UploadSession.load, str(Path(DATA_DIR) / id), session_id)
+    if session is None:
+        return JSONResponse(content={"error": "Session not found"}, status_code=404)
+    data = bytearray()
+    async for chunk in request.stream():
+        data.extend(chunk)
+        if len(data) > session.session["chunkSize"]:
+            return JSONResponse(content={"error": "Chunk is larger than chunkSize"}, status_code=413)
+    try:
+        progress = await asyncio.to_thread(session.write_chunk, file_name, offset, bytes(data))
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    except FileNotFoundError:
+        return JSONResponse(content={"error": "Session not found"}, status_code=404)
+    except SessionFinalizedError:
+        return JSONResponse(content={"error": "Session is already finalized"}, status_code=409)
+    return JSONResponse(content=progress, status_code=200)
+
+
+@router.post("/upload_session/{id}/{session_id}/finalize")
+async def finalize_upload_session(id: str, session_id: str, option: dict = Body(default=None)):
+    """
+    Verify checksums and move files of the session to images folder
+    option: {"checksums": {"a.jpg": "sha256 hex"}}, optional, overrides sha256 given when the session is created
+    """
+    data_path = Path(DATA_DIR) / id
+    session = await asyncio.to_thread(UploadSession.load, str(data_path), session_id)
+    if session is None:
+        return JSONResponse(content={"error": "Session not found"}, status_code=404)
+    checksums = (option or {}).get("checksums")
+    upload_path = data_path / "images"
+    try:
+        names, new_names, errors = await asyncio.to_thread(session.finalize, str(upload_path), checksums)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    except FileNotFoundError:
+        return JSONResponse(content={"error": "Session not found"}, status_code=404)
+    except SessionFinalizedError:
+        # 이전 완료 요청의 응답을 받지 못하고 다시 요청한 경우, 파일은 이미 images 폴더에 있음
+        return JSONResponse(content={"error": "Session is already finalized", **session.progress()},
+                            status_code=409)
+    if errors:
+        return JSONResponse(content={"error": "Upload is not complete", "errors": errors, **session.progress()},
+                            status_code=409)
+
+    await asyncio.to_thread(update_index, str(upload_path), names)
+    schedule_features([upload_path / name for name in names])
+    state = await finish_upload(data_path, len(new_names))
+    return JSONResponse(content={"message": "Upload session is finalized", "files": names,
+                                 "nImages": state["upload"]["nImages"], "total": state["upload"]["total"]},
+                        status_code=200)
+
+
+@router.delete("/upload_session/{id}/{session_id}")
+async def delete_upload_session(id: str, session_id: str):
+    """
+    Cancel upload session and remove its received chunks, files already moved by finalize are kept
+    """
+    session = await asyncio.to_thread(UploadSession.load, str(Path(DATA_DIR) / id), session_id)
+    if session is None:
+        return JSONResponse(content={"error": "Session not found"}, status_code=404)
+    await asyncio.to_thread(session.delete)
+    return JSONResponse(content={"message": "Upload session is deleted", "sessionId": session_id}, status_code=200)
+
+
 async def save_file(files, id, total):
     print(f"files: {files}, id: {id}, total: {total}")
     # id가 -과 _외의 특수문자와 공백을 포함하고 있을 경우, 422 에러 반환
     if not all([c.isalnum() or c in ['-', '_'] for c in id]):
         raise HTTPException(status_code=422, detail="ID should contain only alphabets, numbers, - and _")
 
+    upload_path = await prepare_upload(id)
+    data_path = Path(DATA_DIR) / id
+    await start_upload(data_path, total)
+    n_new_files = 0
+    for file in files:
+        # chunk 단위로 임시 파일에 쓴 뒤 images 폴더로 옮김, 이벤트 루프를 막지 않도록 스레드에서 실행
+        if await asyncio.to_thread(write_upload, file.file, str(upload_path / file.filename)):
+            n_new_files += 1
+        await file.close()
+    # 업로드된 이미지의 EXIF를 메타데이터 인덱스에 추가
+    await asyncio.to_thread(update_index, str(upload_path), [file.filename for file in files])
+    # 정합 때 바로 사용할 수 있도록 특징점을 백그라운드에서 미리 계산
+    schedule_features([upload_path / file.filename for file in files])
+    await finish_upload(data_path, n_new_files)
+    return {"info": f"file is saved on {str(upload_path)}"}
+
+
+async def prepare_upload(id: str) -> Path:
+    """
+    Make images folder of the dataset and create ODM task if the dataset does not have one
+    :return: images folder
+    """
     upload_path = Path(DATA_DIR) / id / "images"
     upload_path.mkdir(parents=True, exist_ok=True)
+    await ensure_odm_task(id)
+    return upload_path
+
+
+async def ensure_odm_task(id: str) -> str | None:
+    """
+    Create ODM task if the dataset does not have one
+    :return: uuid of the task, None if the task cannot be created
+    """
+    uuid = get_uuid_by_name(id)
+    if uuid is not None:
+        return uuid
     # 만약 os.path.join(DATA_DIR, id)에 uuid_로 시작하는 파일이 없다면, 새로운 task 생성
-    if not any([file_name.startswith("uuid_") for file_name in listdir(Path(DATA_DIR) / id)]):
-
-        response = requests.post(f"{SERVER_INFO['ODM_URL']}/task/new/init", files=INIT_OPTIONS)
-        if response.status_code == 200:
-            uuid = response.json()["uuid"]
-            with open(Path(DATA_DIR) / id / f"uuid_{uuid}.txt", "w") as f:
-                f.write(f"Task is created in {datetime.now()}")
-    for file in files:
-        file_location = upload_path / file.filename
-        with open(file_location, "wb") as f:
-            f.write(await file.read())
-    current_files = len(list(upload_path.iterdir()))
-    if current_files < total:
-        with open(Path(DATA_DIR) / id / "uploading.txt", "w") as f:
+    try:
+        response = await odm_client.task_new_init_async(files=INIT_OPTIONS)
+    except Exception as e:
+        print(f"Cannot create ODM task: {id} | {e}")
+        return None
+    if response.status_code != 200:
+        return None
+    uuid = response.json()["uuid"]
+    with open(Path(DATA_DIR) / id / f"uuid_{uuid}.txt", "w") as f:
+        f.write(f"Task is created in {datetime.now()}")
+    odm_poller.register(uuid)
+    return uuid
+
+
+async def start_upload(data_path: Path, total: int):
+    """
+    Mark the dataset as uploading, total is the number of images expected in the dataset
+    """
+    def update_upload(state):
+        upload = state["upload"]
+        upload.update(total=total, uploading=True)
+        if upload["startedAt"] is None or upload["finishedAt"] is not None:
+            upload["startedAt"], upload["finishedAt"] = time.time(), None
+
+    # 이미지 수는 state의 카운터로 관리함 (state가 없으면 이 시점의 images 폴더로부터 만들어짐)
+    await asyncio.to_thread(update_state, data_path, updater=update_upload)
+
+
+async def finish_upload(data_path: Path, n_new_files: int) -> dict:
+    """
+    Add newly saved images to the counter, the upload is finished when the counter reaches total
+    :return: updated state
+    """
+    def update_upload(state):
+        upload = state["upload"]
+        upload["nImages"] += n_new_files
+        upload["uploading"] = upload["nImages"] < upload["total"]
+        if not upload["uploading"]:
+            upload["finishedAt"] = time.time()
+
+    state = await asyncio.to_thread(update_state, data_path, updater=update_upload)
+    uploading_file = data_path / "uploading.txt"
+    if state["upload"]["uploading"]:
+        with open(uploading_file, "w") as f:
             f.write("Uploading in progress")
-    if current_files == total:
-        uploading_file = Path(DATA_DIR) / id / "uploading.txt"
-        if uploading_file.exists():
-            uploading_file.unlink()
-    return {"info": f"file is saved on {str(upload_path)}"}
+    elif uploading_file.exists():
+        uploading_file.unlink()
+    return state
+
+
+@app.on_event("startup")
+async def start_background_workers():
+    job_scheduler.start()
+    # 완료된 ODM 작업의 결과는 백그라운드에서 서버에 저장함
+    odm_poller.completed_hook = odm_archive.on_task_completed
+    odm_poller.start()
+    # 만료된 업로드 세션을 주기적으로 삭제함
+    start_session_sweeper(DATA_DIR)
 
 
 app.include_router(router, prefix="/api")
@@ -0,0 +1,202 @@
+import argparse
+import json
+import socket
+import threading
+import time
+import uuid as uuid_lib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ODM_STUB_PORT = 3000
+# 결과 다운로드(all.zip)로 반환하는 바이트 수
+ODM_STUB_DOWNLOAD_SIZE = 1024 * 1024
+
+"""
+    로컬 개발과 점검에 사용하는 NodeODM 대역 서버입니다. (http.server, 표준 라이브러리만 사용)
+    task/new/init, task/new/upload, task/new/commit, task/{uuid}/info, task/{uuid}/download, task/remove, task/restart를
+    메모리의 작업 목록으로 흉내 내며, 실제 처리는 하지 않고 commit 직후 완료(status 40)로 응답합니다.
+    장애 주입
+    - --fail N: 처음 N개의 요청에 503으로 응답함
+    - --delay S: 모든 응답을 S초 늦게 보냄 (read timeout)
+    --check로 실행하면 임의의 포트에 서버를 띄우고 ODMClient의 재시도와 timeout을 점검합니다.
+    1. 503 응답 후 재시도하여 성공하는지
+    2. read timeout이 재시도 후 requests.Timeout으로 올라오는지
+    3. 서버가 없는 포트(연결 거부)가 재시도 후 requests.ConnectionError로 올라오는지
+    실행: cd backend && python odm_stub.py --port 3000 (server_info.txt의 ODM_URL을 http://localhost:3000으로 지정)
+"""
+
+
+class ODMStubState:
+    def __init__(self, fail: int = 0, delay: float = 0.0):
+        """
+        :param fail: number of requests answered with 503
+        :param delay: seconds to wait before every response
+        """
+        self.fail = fail
+        self.delay = delay
+        self.tasks = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def next_failure(self) -> bool:
+        with self.lock:
+            if self.fail > 0:
+                self.fail -= 1
+                return True
+            return False
+
+
+class ODMStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: ODMStubState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _intercept(self) -> bool:
+        with self.state.lock:
+            self.state.requests += 1
+        if self.state.delay > 0:
+            time.sleep(self.state.delay)
+        if self.state.next_failure():
+            self._send_json(503, {"error": "Service unavailable"})
+            return True
+        return False
+
+    def do_GET(self):
+        if self._intercept():
+            return
+        parts = self.path.strip("/").split("/")
+        if len(parts) < 3 or parts[0] != "task" or parts[1] not in self.state.tasks:
+            return self._send_json(200, {"error": "Task not found"})
+        task = self.state.tasks[parts[1]]
+        if parts[2] == "info":
+            return self._send_json(200, task)
+        if parts[2] == "download":
+            data = b"\0" * ODM_STUB_DOWNLOAD_SIZE
+            self.send_response(200)
+            self.send_header("Content-Type", "application/zip")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        body = self._read_body()
+        if self._intercept():
+            return
+        if self.path == "/task/new/init":
+            task_uuid = str(uuid_lib.uuid4())
+            self.state.tasks[task_uuid] = {"uuid": task_uuid, "status": {"code": 10}, "progress": 0,
+                                           "dateCreated": int(time.time() * 1000), "processingTime": 0}
+            return self._send_json(200, {"uuid": task_uuid})
+        if self.path.startswith("/task/new/upload/"):
+            return self._send_json(200, {"success": True})
+        if self.path.startswith("/task/new/commit/"):
+            task_uuid = self.path.rsplit("/", 1)[-1]
+            if task_uuid in self.state.tasks:
+                self.state.tasks[task_uuid].update(status={"code": 40}, progress=100)
+            return self._send_json(200, {"uuid": task_uuid})
+        if self.path in ("/task/remove", "/task/restart"):
+            task_uuid = json.loads(body or b"{}").get("uuid")
+            if self.path == "/task/remove":
+                self.state.tasks.pop(task_uuid, None)
+            return self._send_json(200, {"success": True})
+        self._send_json(404, {"error": "Not found"})
+
+
+class ODMStubServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # timeout으로 클라이언트가 먼저 끊은 연결은 무시함
+        pass
+
+
+def serve(port: int, state: ODMStubState) -> ThreadingHTTPServer:
+    """
+    Start the stub server in a background thread
+    :param port: port to listen, 0 for any free port
+    :param state: shared state of the stub
+    :return: running server, server.server_address[1] is the port
+    """
+    handler = type("Handler", (ODMStubHandler,), {"state": state})
+    server = ODMStubServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def check():
+    """
+    Check retries and timeouts of ODMClient against the stub
+    """
+    import requests
+
+    from src.odm_client import ODMClient
+
+    state = ODMStubState()
+    server = serve(0, state)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    client = ODMClient(base_url=base_url, retries=2, backoff=0.1, timeout=(1, 1))
+
+    # 1. 503 후 재시도
+    state.fail, state.requests = 2, 0
+    response = client.task_new_init()
+    assert response.status_code == 200 and state.requests == 3, (response.status_code, state.requests)
+    print(f"503 retry: OK ({state.requests} requests)")
+
+    # 2. read timeout
+    state.delay, state.requests = 1.5, 0
+    try:
+        client.task_info(response.json()["uuid"])
+        raise AssertionError("read timeout was not raised")
+    except requests.Timeout:
+        pass
+    state.delay = 0.0
+    assert state.requests == 3, state.requests
+    print(f"read timeout: OK ({state.requests} requests)")
+
+    # 3. 연결 거부
+    refused = ODMClient(base_url=f"http://127.0.0.1:{get_free_port()}", retries=2, backoff=0.1, timeout=(1, 1))
+    try:
+        refused.task_info("none")
+        raise AssertionError("connection error was not raised")
+    except requests.ConnectionError:
+        pass
+    print("refused connection: OK")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='NodeODM stub server')
+    parser.add_argument('--port', type=int, default=ODM_STUB_PORT, help='port to listen')
+    parser.add_argument('--fail', type=int, default=0, help='answer first N requests with 503')
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds to wait before every response')
+    parser.add_argument('--check', action='store_true', help='check retries and timeouts of ODMClient')
+    args = parser.parse_args()
+
+    if args.check:
+        check()
+    else:
+        stub_server = serve(args.port, ODMStubState(fail=args.fail, delay=args.delay))
+        print(f"NodeODM stub is listening on port {args.port}")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            stub_server.shutdown()
@@ -0,0 +1,113 @@
+import hashlib
+import os
+import threading
+import time
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+"""
+    여러 캐시(특징점, 썸네일, 메타데이터 인덱스)가 함께 사용하는 함수들을 정의합니다.
+    get_content_hash는 파일 내용의 sha256을 계산하며, (경로, 크기, 수정 시각)이 같으면 메모리에 저장된 값을 다시 사용하므로
+    같은 프로세스에서는 파일마다 한 번만 읽습니다.
+    정합 워커처럼 새로 만들어지는 프로세스는 메타데이터 인덱스에 저장된 sha256을 넘겨받아 사용합니다.
+    CacheDirectory는 전체 크기가 budget을 넘으면 가장 오래 사용하지 않은 파일부터 삭제하는 캐시 폴더입니다.
+    마지막 사용 시각은 기본적으로 수정 시각(mtime)이며, 수정 시각을 다른 용도로 쓰는 캐시는 접근 시각(atime)을 사용합니다.
+"""
+
+_hashes = {}
+_hashes_lock = threading.Lock()
+
+
+def get_content_hash(path: str) -> str:
+    """
+    sha256 of the file content, memoized by (path, size, mtime)
+    :param path: file path
+    :return: hex digest
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _hashes_lock:
+        if key in _hashes:
+            return _hashes[key]
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    with _hashes_lock:
+        _hashes[key] = sha256.hexdigest()
+    return _hashes[key]
+
+
+class CacheDirectory:
+    """
+    Directory of cache files limited by total size, least recently used files are removed first
+    """
+
+    def __init__(self, cache_dir: str, budget: int, suffix: str, use_atime: bool = False):
+        """
+        :param cache_dir: directory of cache files
+        :param budget: maximum total bytes of cache files
+        :param suffix: suffix of cache files, other files (temporary files) are ignored
+        :param use_atime: use access time as the last used time and keep modification time (used as ETag)
+        """
+        self.cache_dir = cache_dir
+        self.budget = budget
+        self.suffix = suffix
+        self.use_atime = use_atime
+        self.lock = threading.Lock()
+        self.total_bytes = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def touch(self, path: str) -> bool:
+        """
+        Update last used time of the cache file
+        :return: False if the file does not exist
+        """
+        try:
+            if self.use_atime:
+                os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+            else:
+                os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def scan(self) -> list[tuple[float, int, str]]:
+        """
+        :return: list of (last used time, size, path)
+        """
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.cache_dir, file_name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_atime if self.use_atime else stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def add_bytes(self, n_bytes: int):
+        """
+        Record a new cache file of n_bytes and remove least recently used files if the budget is exceeded
+        """
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = sum(size for _, size, _ in self.scan())
+            else:
+                self.total_bytes += n_bytes
+            if self.total_bytes <= self.budget:
+                return
+            # 다른 프로세스도 캐시를 사용하므로 삭제할 때는 폴더를 다시 확인함
+            entries = sorted(self.scan())
+            self.total_bytes = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if self.total_bytes <= self.budget:
+                    break
+                try:
+                    # 이미 memory map으로 열린 파일은 삭제해도 닫힐 때까지 유효함
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self.total_bytes -= size
@@ -0,0 +1,61 @@
+import hashlib
+import os
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+
+# 결과 파일은 같은 이름으로 다시 만들어질 수 있으므로 매번 검증(304)하도록 함
+FILE_CACHE_CONTROL = "no-cache"
+
+"""
+    정합 결과, 타일, 미리보기 파일을 조건부 요청과 범위 요청을 지원하여 전송합니다.
+    ETag와 Last-Modified는 파일의 수정 시각과 크기로 만들며, starlette FileResponse가 계산하는 값과 같으므로
+    If-Range를 포함한 Range 요청(이어받기)은 FileResponse가 그대로 처리합니다.
+    If-None-Match 또는 If-Modified-Since가 현재 파일과 일치하면 본문 없이 304를 반환합니다.
+"""
+
+
+def get_etag(stat_result: os.stat_result) -> str:
+    etag_base = f"{stat_result.st_mtime}-{stat_result.st_size}"
+    return f'"{hashlib.md5(etag_base.encode(), usedforsecurity=False).hexdigest()}"'
+
+
+def is_not_modified(request: Request, etag: str, stat_result: os.stat_result) -> bool:
+    """
+    Check conditional headers of the request, If-None-Match takes precedence over If-Modified-Since
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            return int(stat_result.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def conditional_file_response(request: Request, path: str, media_type: str = None, filename: str = None,
+                              headers: dict = None) -> Response | None:
+    """
+    FileResponse with validators, 304 if the client already has the file
+    :param request: request with conditional and range headers
+    :param path: file path
+    :param media_type: media type of the file
+    :param filename: file name of Content-Disposition, None to omit it
+    :param headers: additional headers, e.g. checksum
+    :return: response, None if the file does not exist
+    """
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        return None
+    etag = get_etag(stat_result)
+    headers = {**(headers or {}), "etag": etag, "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+               "cache-control": FILE_CACHE_CONTROL}
+    if is_not_modified(request, etag, stat_result):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, filename=filename, headers=headers, stat_result=stat_result)
@@ -0,0 +1,203 @@
+import json
+import os
+import threading
+import time
+import traceback
+import uuid as uuid_lib
+
+JOB_FILE = "./jobs.json"
+
+# 동시에 실행할 수 있는 작업 수 (전체, step별)
+MAX_RUNNING_JOBS = 2
+MAX_RUNNING_JOBS_PER_STEP = {
+    1: 1,
+    2: 2,
+}
+# 완료된 작업은 최근 것만 보관함
+MAX_FINISHED_JOBS = 200
+
+JOB_STATUS = {
+    "PENDING": "pending",
+    "RUNNING": "running",
+    "DONE": "done",
+    "FAILED": "failed",
+    "CANCELED": "canceled",
+}
+
+"""
+    정합 작업 큐를 정의합니다.
+    작업은 JOB_FILE에 저장되어 서버가 재시작되어도 유지되며, 재시작 시 실행 중이던 작업은 다시 대기 상태가 됩니다.
+    작업은 다음과 같은 형식으로 저장됩니다.
+    {
+        "jobId": "...", "step": 1, "id": "데이터 이름", "args": {...}, "priority": 0,
+        "status": "pending", "createdAt": ..., "startedAt": ..., "finishedAt": ..., "error": None
+    }
+    - 같은 step, 데이터, 인자를 가진 대기/실행 중인 작업이 있으면 새 작업을 만들지 않고 기존 작업을 반환합니다.
+    - 같은 데이터의 같은 step 작업은 동시에 실행되지 않습니다.
+    - priority가 높은 작업부터, 같으면 먼저 들어온 작업부터 실행합니다.
+"""
+
+
+class JobScheduler:
+    def __init__(self, handlers: dict, job_file: str = JOB_FILE, max_running: int = MAX_RUNNING_JOBS,
+                 max_running_per_step: dict = None):
+        """
+        :param handlers: dict of {step: function(job)} which runs the job synchronously
+        :param job_file: path of the file where jobs are persisted
+        :param max_running: maximum number of running jobs
+        :param max_running_per_step: dict of {step: maximum number of running jobs of the step}
+        """
+        self.handlers = handlers
+        self.job_file = job_file
+        self.max_running = max_running
+        self.max_running_per_step = max_running_per_step or MAX_RUNNING_JOBS_PER_STEP
+        self.condition = threading.Condition()
+        self.jobs = {}
+        self.dispatcher = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.job_file, "r") as f:
+                jobs = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            jobs = []
+        for job in jobs:
+            # 서버 종료로 중단된 작업은 다시 실행함
+            if job["status"] == JOB_STATUS["RUNNING"]:
+                job["status"] = JOB_STATUS["PENDING"]
+                job["startedAt"] = None
+            self.jobs[job["jobId"]] = job
+
+    def _save(self):
+        finished = [job for job in self.jobs.values() if job["status"] not in
+                    (JOB_STATUS["PENDING"], JOB_STATUS["RUNNING"])]
+        finished.sort(key=lambda job: job["finishedAt"] or 0)
+        for job in finished[:-MAX_FINISHED_JOBS]:
+            del self.jobs[job["jobId"]]
+
+        tmp_path = f"{self.job_file}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(list(self.jobs.values()), f)
+        os.replace(tmp_path, self.job_file)
+
+    def submit(self, step: int, data_id: str, args: dict = None, priority: int = 0) -> tuple[dict, bool]:
+        """
+        Add job to the queue. If an identical job is pending or running, return it instead
+        :param step: stitching step
+        :param data_id: name of the data
+        :param args: arguments of the job, must be JSON serializable
+        :param priority: higher priority runs first
+        :return: job, True if the job is newly created
+        """
+        if step not in self.handlers:
+            raise ValueError(f"Invalid step : {step}")
+        args = args or {}
+        with self.condition:
+            for job in self.jobs.values():
+                if job["status"] in (JOB_STATUS["PENDING"], JOB_STATUS["RUNNING"]) and job["step"] == step \
+                        and job["id"] == data_id and job["args"] == args:
+                    if job["status"] == JOB_STATUS["PENDING"] and priority > job["priority"]:
+                        job["priority"] = priority
+                        self._save()
+                    return dict(job), False
+
+            job = {
+                "jobId": str(uuid_lib.uuid4()),
+                "step": step,
+                "id": data_id,
+                "args": args,
+                "priority": priority,
+                "status": JOB_STATUS["PENDING"],
+                "createdAt": time.time(),
+                "startedAt": None,
+                "finishedAt": None,
+                "error": None,
+            }
+            self.jobs[job["jobId"]] = job
+            self._save()
+            self.condition.notify_all()
+            return dict(job), True
+
+    def cancel(self, job_id: str) -> dict or None:
+        """
+        Cancel pending job. running job cannot be canceled
+        :param job_id: job id
+        :return: job, None if the job does not exist
+        """
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] == JOB_STATUS["PENDING"]:
+                job["status"] = JOB_STATUS["CANCELED"]
+                job["finishedAt"] = time.time()
+                self._save()
+            return dict(job)
+
+    def get(self, job_id: str) -> dict or None:
+        with self.condition:
+            job = self.jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def list_jobs(self, status: str = None, data_id: str = None) -> list[dict]:
+        with self.condition:
+            jobs = [dict(job) for job in self.jobs.values()
+                    if (status is None or job["status"] == status) and (data_id is None or job["id"] == data_id)]
+        jobs.sort(key=lambda job: job["createdAt"])
+        return jobs
+
+    def _is_runnable(self, job: dict, running: list[dict]) -> bool:
+        if len(running) >= self.max_running:
+            return False
+        n_running_step = len([r for r in running if r["step"] == job["step"]])
+        if n_running_step >= self.max_running_per_step.get(job["step"], self.max_running):
+            return False
+        # 같은 데이터의 같은 step 작업은 동시에 실행하지 않음
+        return not any(r["step"] == job["step"] and r["id"] == job["id"] for r in running)
+
+    def _next_job(self) -> dict or None:
+        running = [job for job in self.jobs.values() if job["status"] == JOB_STATUS["RUNNING"]]
+        pending = [job for job in self.jobs.values() if job["status"] == JOB_STATUS["PENDING"]]
+        pending.sort(key=lambda job: (-job["priority"], job["createdAt"]))
+        for job in pending:
+            if self._is_runnable(job, running):
+                return job
+        return None
+
+    def _run(self, job: dict):
+        error = None
+        try:
+            self.handlers[job["step"]](dict(job))
+        except Exception as e:
+            print(f"Job {job['jobId']} failed: {e}")
+            print(traceback.format_exc())
+            error = str(e)
+        with self.condition:
+            job["status"] = JOB_STATUS["DONE"] if error is None else JOB_STATUS["FAILED"]
+            job["error"] = error
+            job["finishedAt"] = time.time()
+            self._save()
+            self.condition.notify_all()
+
+    def _dispatch_loop(self):
+        while True:
+            with self.condition:
+                job = self._next_job()
+                while job is None:
+                    self.condition.wait()
+                    job = self._next_job()
+                job["status"] = JOB_STATUS["RUNNING"]
+                job["startedAt"] = time.time()
+                self._save()
+            threading.Thread(target=self._run, args=(job,), daemon=True).start()
+
+    def start(self):
+        """
+        Start dispatcher thread which runs pending jobs
+        """
+        with self.condition:
+            if self.dispatcher is not None:
+                return
+            self.dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True)
+            self.dispatcher.start()
@@ -0,0 +1,232 @@
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from src.file_query import DATA_PATH
+from src.odm_client import odm_client
+
+ARCHIVE_DIR_NAME = "odm_output"
+ARCHIVE_FILE_NAME = "all.zip"
+ARCHIVE_INFO_FILE_NAME = "archive.json"
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+# ODM 서버의 부하를 줄이기 위해 결과는 한 번에 하나씩 받음
+ARCHIVE_WORKERS = 1
+# 받는 도중 연결이 끊기면 받은 곳부터 다시 요청하는 횟수
+ARCHIVE_RESUME_RETRIES = 3
+# 받기에 이 횟수만큼 실패한 작업은 ODM 작업 조회 때 다시 받지 않음 (POST /odm_result로 다시 요청할 수 있음)
+ARCHIVE_MAX_FAILURES = 3
+
+"""
+    ODM 작업이 완료되면 결과(all.zip)를 백그라운드에서 한 번 받아서 {데이터 폴더}/odm_output/all.zip에 저장합니다.
+    이후 다운로드는 ODM 서버 대신 저장된 파일을 Range/ETag를 지원하여 전송하므로, 처리 중인 ODM 서버에 부하를 주지 않고
+    /api/reset으로 ODM 작업이 삭제되어도 마지막 결과를 받을 수 있습니다. (/api/delete는 데이터 폴더와 함께 삭제합니다)
+    받는 중인 파일은 all.zip.{uuid}.part이며, 연결이 끊기거나 본문이 Content-Length보다 짧게 끝나면
+    받은 곳부터 Range 요청으로 이어받습니다.
+    받기가 끝나면 크기와 zip 형식을 확인한 뒤 all.zip으로 바꾸고, sha256을 archive.json에 기록합니다.
+    {"uuid": "...", "size": 123456789, "sha256": "...", "downloadedAt": 1700000000.0}
+"""
+
+
+def get_archive_dir(data_name: str) -> str:
+    return os.path.join(DATA_PATH, data_name, ARCHIVE_DIR_NAME)
+
+
+def get_archive_path(data_name: str) -> str:
+    return os.path.join(get_archive_dir(data_name), ARCHIVE_FILE_NAME)
+
+
+def get_archive_info(data_name: str) -> dict | None:
+    """
+    Info of the downloaded archive
+    :return: archive.json, None if the archive is not downloaded
+    """
+    try:
+        with open(os.path.join(get_archive_dir(data_name), ARCHIVE_INFO_FILE_NAME), "r") as f:
+            info = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if not os.path.exists(get_archive_path(data_name)):
+        return None
+    return info
+
+
+def get_checksum_headers(info: dict) -> dict:
+    """
+    Checksum headers of the archive, Digest (RFC 3230) and hex sha256
+    """
+    digest = base64.b64encode(bytes.fromhex(info["sha256"])).decode()
+    return {"digest": f"sha-256={digest}", "x-checksum-sha256": info["sha256"]}
+
+
+def find_data_name(uuid: str) -> str | None:
+    """
+    Find the data folder which has uuid_{uuid}.txt
+    """
+    if not os.path.exists(DATA_PATH):
+        return None
+    for data_name in os.listdir(DATA_PATH):
+        if os.path.exists(os.path.join(DATA_PATH, data_name, f"uuid_{uuid}.txt")):
+            return data_name
+    return None
+
+
+class ODMArchiveCache:
+    def __init__(self, workers: int = ARCHIVE_WORKERS):
+        self.lock = threading.Lock()
+        # 받는 중인 데이터 이름별 진행 상황
+        self.downloading = {}
+        # 마지막으로 실패한 데이터 이름별 에러
+        self.errors = {}
+        # 데이터 이름별 (uuid, 연속 실패 횟수)
+        self.failures = {}
+        self.workers = workers
+        self.executor = None
+
+    def status(self, data_name: str) -> dict:
+        """
+        :return: {"status": "ready" | "downloading" | "missing", ...}
+        """
+        with self.lock:
+            if data_name in self.downloading:
+                return {"status": "downloading", **self.downloading[data_name]}
+            error = self.errors.get(data_name)
+            _, n_failures = self.failures.get(data_name, (None, 0))
+        info = get_archive_info(data_name)
+        if info is not None:
+            return {"status": "ready", **info}
+        return {"status": "missing", "error": error, "failures": n_failures}
+
+    def schedule(self, data_name: str, uuid: str, force: bool = False) -> bool:
+        """
+        Download archive of the task in background if it is not downloaded yet
+        :param force: download even if it failed ARCHIVE_MAX_FAILURES times
+        :return: True if a download is started
+        """
+        info = get_archive_info(data_name)
+        if info is not None and info["uuid"] == uuid:
+            return False
+        with self.lock:
+            if data_name in self.downloading:
+                return False
+            failed_uuid, n_failures = self.failures.get(data_name, (None, 0))
+            if not force and failed_uuid == uuid and n_failures >= ARCHIVE_MAX_FAILURES:
+                return False
+            self.downloading[data_name] = {"uuid": uuid, "receivedBytes": 0, "totalBytes": None,
+                                           "startedAt": time.time()}
+            self.errors.pop(data_name, None)
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="odm-archive")
+        self.executor.submit(self._download_safe, data_name, uuid)
+        return True
+
+    def on_task_completed(self, uuid: str):
+        """
+        Hook of the ODM poller, called for completed tasks
+        """
+        data_name = find_data_name(uuid)
+        if data_name is not None:
+            self.schedule(data_name, uuid)
+
+    def _download_safe(self, data_name: str, uuid: str):
+        try:
+            self._download(data_name, uuid)
+            with self.lock:
+                self.failures.pop(data_name, None)
+        except Exception as e:
+            print(f"ODM archive download failed: {data_name} ({uuid}) | {e}")
+            with self.lock:
+                self.errors[data_name] = str(e)
+                failed_uuid, n_failures = self.failures.get(data_name, (None, 0))
+                self.failures[data_name] = (uuid, n_failures + 1 if failed_uuid == uuid else 1)
+        finally:
+            with self.lock:
+                self.downloading.pop(data_name, None)
+
+    def _set_progress(self, data_name: str, received: int, total: int | None):
+        with self.lock:
+            if data_name in self.downloading:
+                self.downloading[data_name].update({"receivedBytes": received, "totalBytes": total})
+
+    def _download(self, data_name: str, uuid: str):
+        archive_dir = get_archive_dir(data_name)
+        os.makedirs(archive_dir, exist_ok=True)
+        part_path = os.path.join(archive_dir, f"{ARCHIVE_FILE_NAME}.{uuid}.part")
+        # 다른 작업의 받다 만 파일은 삭제함
+        for file_name in os.listdir(archive_dir):
+            if file_name.endswith(".part") and os.path.join(archive_dir, file_name) != part_path:
+                os.remove(os.path.join(archive_dir, file_name))
+
+        for attempt in range(ARCHIVE_RESUME_RETRIES + 1):
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            try:
+                total = self._receive(data_name, uuid, part_path, offset)
+                # 연결이 끊겨도 예외 없이 본문이 짧게 끝날 수 있으므로 받은 크기를 확인하고, 짧으면 이어받음
+                size = os.path.getsize(part_path)
+                if total is not None and size != total:
+                    if size > total:
+                        # 다른 파일의 일부이므로 처음부터 받음
+                        os.remove(part_path)
+                    raise ValueError(f"Size mismatch : {size} / {total}")
+                break
+            except (OSError, ValueError) as e:
+                if attempt == ARCHIVE_RESUME_RETRIES:
+                    raise
+                print(f"ODM archive download interrupted, resume {attempt + 1}/{ARCHIVE_RESUME_RETRIES}: "
+                      f"{data_name} | {e}")
+
+        if not zipfile.is_zipfile(part_path):
+            os.remove(part_path)
+            raise ValueError("Downloaded file is not a zip archive")
+
+        sha256 = hashlib.sha256()
+        with open(part_path, "rb") as f:
+            for chunk in iter(lambda: f.read(ARCHIVE_CHUNK_SIZE), b""):
+                sha256.update(chunk)
+        os.replace(part_path, get_archive_path(data_name))
+        info_path = os.path.join(archive_dir, ARCHIVE_INFO_FILE_NAME)
+        with open(f"{info_path}.tmp", "w") as f:
+            json.dump({"uuid": uuid, "size": size, "sha256": sha256.hexdigest(), "downloadedAt": time.time()}, f)
+        os.replace(f"{info_path}.tmp", info_path)
+        print(f"ODM archive downloaded: {data_name} ({uuid}) {size} bytes")
+
+    def _receive(self, data_name: str, uuid: str, part_path: str, offset: int) -> int | None:
+        """
+        Receive archive from offset and append it to part_path
+        :return: total size of the archive, None if unknown
+        """
+        response = odm_client.task_download(uuid, offset=offset)
+        with response:
+            if response.status_code == 416:
+                # 이미 끝까지 받은 경우, 전체 크기는 Content-Range(bytes */전체 크기)로 확인함
+                content_range = re.match(r"bytes \*/(\d+)", response.headers.get("Content-Range", ""))
+                return int(content_range.group(1)) if content_range is not None else offset
+            if response.status_code == 200:
+                # Range를 지원하지 않으면 처음부터 받음
+                offset = 0
+            elif response.status_code != 206:
+                raise RuntimeError(f"ODM responded {response.status_code}")
+            total = None
+            content_range = re.match(r"bytes \d+-\d+/(\d+)", response.headers.get("Content-Range", ""))
+            if content_range is not None:
+                total = int(content_range.group(1))
+            elif "Content-Length" in response.headers:
+                total = offset + int(response.headers["Content-Length"])
+
+            received = offset
+            with open(part_path, "r+b" if offset > 0 else "wb") as f:
+                f.seek(offset)
+                f.truncate()
+                for chunk in response.iter_content(ARCHIVE_CHUNK_SIZE):
+                    f.write(chunk)
+                    received += len(chunk)
+                    self._set_progress(data_name, received, total)
+        return total
+
+
+odm_archive = ODMArchiveCache()
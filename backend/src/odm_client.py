@@ -0,0 +1,144 @@
+import asyncio
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from src.server_info import SERVER_INFO
+
+# (connect, read) timeout, 이미지 업로드와 결과 다운로드는 read timeout을 길게 잡음
+ODM_TIMEOUT = (5, 30)
+ODM_UPLOAD_TIMEOUT = (5, 300)
+ODM_DOWNLOAD_TIMEOUT = (5, 300)
+ODM_RETRIES = 3
+ODM_BACKOFF = 0.5
+ODM_POOL_SIZE = 16
+RETRY_STATUS = {502, 503, 504}
+
+"""
+    NodeODM 서버와 통신하는 클라이언트를 정의합니다.
+    하나의 requests.Session을 공유하여 keep-alive 연결을 재사용하며, 모든 요청에는 timeout이 걸려 있습니다.
+    연결 실패, timeout, 502/503/504 응답은 지수 백오프로 ODM_RETRIES번까지 재시도합니다.
+    단, GET이 아닌 요청은 서버에 요청이 전달되지 않았음이 확실한 연결 실패만 재시도합니다.
+    FastAPI 핸들러에서는 이벤트 루프를 막지 않도록 *_async 메서드를 사용합니다.
+"""
+
+
+class ODMClient:
+    def __init__(self, base_url: str = None, pool_size: int = ODM_POOL_SIZE, retries: int = ODM_RETRIES,
+                 backoff: float = ODM_BACKOFF, timeout: tuple = ODM_TIMEOUT):
+        """
+        :param base_url: NodeODM url, SERVER_INFO['ODM_URL'] if None
+        :param pool_size: maximum number of kept-alive connections
+        :param retries: maximum number of retries
+        :param backoff: base seconds of exponential backoff
+        :param timeout: default (connect, read) timeout
+        """
+        self._base_url = base_url
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @property
+    def base_url(self) -> str:
+        return self._base_url or SERVER_INFO['ODM_URL']
+
+    def _is_retryable(self, method: str, error: Exception) -> bool:
+        if method == "GET":
+            return isinstance(error, (requests.ConnectionError, requests.Timeout))
+        # 연결 자체가 맺어지지 않은 경우에만 재시도함
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(error, requests.ConnectTimeout) or isinstance(reason, NewConnectionError)
+
+    def request(self, method: str, path: str, timeout: tuple = None, files_factory=None,
+                **kwargs) -> requests.Response:
+        """
+        Send request to NodeODM with timeout and retries
+        :param method: HTTP method
+        :param path: path of NodeODM api, e.g. /task/{uuid}/info
+        :param timeout: (connect, read) timeout, default timeout if None
+        :param files_factory: function which returns (files, list of opened file objects) for each attempt
+        :param kwargs: other arguments of requests
+        :return: response
+        """
+        url = f"{self.base_url}{path}"
+        for attempt in range(self.retries + 1):
+            opened = []
+            if files_factory is not None:
+                kwargs["files"], opened = files_factory()
+            try:
+                response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.retries or not self._is_retryable(method, e):
+                    raise
+                print(f"ODM request failed, retry {attempt + 1}/{self.retries}: {method} {url} | {e}")
+            else:
+                if response.status_code not in RETRY_STATUS or attempt == self.retries:
+                    return response
+                print(f"ODM responded {response.status_code}, retry {attempt + 1}/{self.retries}: {method} {url}")
+                # stream 응답은 닫지 않으면 연결이 pool로 돌아가지 않음
+                response.close()
+            finally:
+                for file in opened:
+                    file.close()
+            time.sleep(self.backoff * (2 ** attempt))
+
+    async def request_async(self, method: str, path: str, **kwargs) -> requests.Response:
+        return await asyncio.to_thread(self.request, method, path, **kwargs)
+
+    def task_new_init(self, files: dict = None) -> requests.Response:
+        return self.request("POST", "/task/new/init", files=files)
+
+    def task_upload(self, uuid: str, file_path: str) -> requests.Response:
+        def files_factory():
+            file = open(file_path, "rb")
+            return {"images": file}, [file]
+
+        return self.request("POST", f"/task/new/upload/{uuid}", timeout=ODM_UPLOAD_TIMEOUT,
+                            files_factory=files_factory)
+
+    def task_commit(self, uuid: str) -> requests.Response:
+        return self.request("POST", f"/task/new/commit/{uuid}")
+
+    def task_restart(self, uuid: str, options: list = None) -> requests.Response:
+        return self.request("POST", "/task/restart", json={"uuid": uuid, "options": options})
+
+    def task_remove(self, uuid: str) -> requests.Response:
+        return self.request("POST", "/task/remove", json={"uuid": uuid})
+
+    def task_download(self, uuid: str, asset: str = "all.zip", offset: int = 0) -> requests.Response:
+        """
+        Download result of the task as a stream, from offset if it is not 0
+        """
+        headers = {"Range": f"bytes={offset}-"} if offset > 0 else {}
+        return self.request("GET", f"/task/{uuid}/download/{asset}", timeout=ODM_DOWNLOAD_TIMEOUT, stream=True,
+                            headers=headers)
+
+    def task_info(self, uuid: str) -> requests.Response:
+        return self.request("GET", f"/task/{uuid}/info")
+
+    async def task_new_init_async(self, files: dict = None) -> requests.Response:
+        return await asyncio.to_thread(self.task_new_init, files)
+
+    async def task_upload_async(self, uuid: str, file_path: str) -> requests.Response:
+        return await asyncio.to_thread(self.task_upload, uuid, file_path)
+
+    async def task_commit_async(self, uuid: str) -> requests.Response:
+        return await asyncio.to_thread(self.task_commit, uuid)
+
+    async def task_restart_async(self, uuid: str, options: list = None) -> requests.Response:
+        return await asyncio.to_thread(self.task_restart, uuid, options)
+
+    async def task_remove_async(self, uuid: str) -> requests.Response:
+        return await asyncio.to_thread(self.task_remove, uuid)
+
+    async def task_info_async(self, uuid: str) -> requests.Response:
+        return await asyncio.to_thread(self.task_info, uuid)
+
+
+odm_client = ODMClient()
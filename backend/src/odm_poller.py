@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.file_query import DATA_PATH, get_uuid_by_name
+from src.odm_client import odm_client
+
+# ODM 작업 상태 코드별 조회 주기(초), 끝난 작업은 드물게 조회함
+POLL_INTERVALS = {
+    10: 10,  # QUEUED
+    20: 3,  # RUNNING
+    30: 300,  # FAILED
+    40: 300,  # COMPLETED
+    50: 300,  # CANCELED
+}
+DEFAULT_POLL_INTERVAL = 10
+COMPLETED_STATUS_CODE = 40
+MAX_ERROR_BACKOFF = 120
+# 데이터 폴더에서 새 uuid를 찾는 주기(초)
+DISCOVERY_INTERVAL = 30
+POLL_TICK = 1.0
+POLL_WORKERS = 8
+
+"""
+    NodeODM 작업 상태를 백그라운드에서 주기적으로 조회하여 메모리 테이블에 저장합니다.
+    /api/data는 ODM 서버에 직접 요청하지 않고 이 테이블을 읽습니다.
+    테이블은 uuid마다 다음과 같은 값을 가집니다.
+    {
+        "statusCode": HTTP 응답 코드 (조회 실패 시 None),
+        "info": /task/{uuid}/info 응답,
+        "updatedAt": 마지막으로 조회에 성공한 시각,
+        "nextPollAt": 다음 조회 시각,
+        "errors": 연속 조회 실패 횟수
+    }
+    completed_hook을 설정하면 완료된 작업을 조회할 때마다 uuid로 호출합니다. (결과 저장 등에 사용)
+"""
+
+
+class ODMTaskPoller:
+    def __init__(self, workers: int = POLL_WORKERS):
+        self.lock = threading.Lock()
+        self.table = {}
+        self.workers = workers
+        self.thread = None
+        self.wakeup = threading.Event()
+        self.last_discovery = 0.0
+        self.completed_hook = None
+
+    def register(self, uuid: str):
+        """
+        Add uuid to the table and poll it as soon as possible
+        """
+        with self.lock:
+            if uuid not in self.table:
+                self.table[uuid] = {"statusCode": None, "info": None, "updatedAt": None, "nextPollAt": 0.0,
+                                    "errors": 0}
+        self.wakeup.set()
+
+    def refresh(self, uuid: str):
+        """
+        Poll uuid as soon as possible, e.g. after the task is committed
+        """
+        with self.lock:
+            if uuid in self.table:
+                self.table[uuid]["nextPollAt"] = 0.0
+        self.register(uuid)
+
+    def get(self, uuid: str) -> dict or None:
+        """
+        Get table entry of uuid. entry is None if uuid is not polled yet
+        """
+        with self.lock:
+            entry = self.table.get(uuid)
+            if entry is None or entry["updatedAt"] is None:
+                return None
+            return dict(entry)
+
+    def _discover(self):
+        uuids = set()
+        if os.path.exists(DATA_PATH):
+            for dir_name in os.listdir(DATA_PATH):
+                if not os.path.isdir(os.path.join(DATA_PATH, dir_name)):
+                    continue
+                uuid = get_uuid_by_name(dir_name)
+                if uuid is not None:
+                    uuids.add(uuid)
+        with self.lock:
+            for uuid in list(self.table.keys()):
+                if uuid not in uuids:
+                    del self.table[uuid]
+        for uuid in uuids:
+            self.register(uuid)
+        self.last_discovery = time.time()
+
+    def _poll(self, uuid: str):
+        try:
+            response = odm_client.task_info(uuid)
+            status_code, info = response.status_code, response.json()
+        except Exception as e:
+            print(f"ODM poll failed: {uuid} | {e}")
+            with self.lock:
+                entry = self.table.get(uuid)
+                if entry is not None:
+                    entry["errors"] += 1
+                    entry["nextPollAt"] = time.time() + min(MAX_ERROR_BACKOFF,
+                                                            DEFAULT_POLL_INTERVAL * (2 ** entry["errors"]))
+            return
+
+        interval = DEFAULT_POLL_INTERVAL
+        if status_code == 200 and "status" in info:
+            interval = POLL_INTERVALS.get(info["status"]["code"], DEFAULT_POLL_INTERVAL)
+        with self.lock:
+            entry = self.table.get(uuid)
+            if entry is not None:
+                entry.update({"statusCode": status_code, "info": info, "updatedAt": time.time(),
+                              "nextPollAt": time.time() + interval, "errors": 0})
+        if self.completed_hook is not None and status_code == 200 and \
+                info.get("status", {}).get("code") == COMPLETED_STATUS_CODE:
+            try:
+                self.completed_hook(uuid)
+            except Exception as e:
+                print(f"ODM completed hook failed: {uuid} | {e}")
+
+    def _loop(self):
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                try:
+                    if time.time() - self.last_discovery > DISCOVERY_INTERVAL:
+                        self._discover()
+                    now = time.time()
+                    with self.lock:
+                        due = [uuid for uuid, entry in self.table.items() if entry["nextPollAt"] <= now]
+                    list(executor.map(self._poll, due))
+                except Exception as e:
+                    print(f"ODM poller error: {e}")
+                self.wakeup.wait(POLL_TICK)
+                self.wakeup.clear()
+
+    def start(self):
+        """
+        Start background polling thread
+        """
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self._loop, daemon=True)
+            self.thread.start()
+
+
+odm_poller = ODMTaskPoller()
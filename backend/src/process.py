@@ -1,9 +1,13 @@
 import asyncio
+import time
 from os import listdir
 from pathlib import Path
 
-from src.server_info import DATA_DIR, SERVER_INFO
-import requests
+from src.file_query import get_uuid_by_name
+from src.odm_client import odm_client
+from src.odm_poller import odm_poller
+from src.server_info import DATA_DIR
+from src.state import update_state
 
 RESTART_OPTIONS = [
     {
@@ -13,8 +17,26 @@ RESTART_OPTIONS = [
 ]
 
 
-def run_coroutine_in_thread(coroutine, *args):
-    asyncio.run(coroutine(*args))
+def run_coroutine_in_thread(coroutine, *args, **kwargs):
+    asyncio.run(coroutine(*args, **kwargs))
+
+
+def run_stitch_job(job: dict):
+    """
+    Job handler of step 1, job["args"] are keyword arguments of stitch_run
+    """
+    from src.stitcher_step1.main import stitch_run
+    run_coroutine_in_thread(stitch_run, Path(DATA_DIR) / job["id"], **job["args"])
+
+
+def run_odm_stitch_job(job: dict):
+    """
+    Job handler of step 2, uuid is read when the job starts because it can be changed by reset
+    """
+    uuid = get_uuid_by_name(job["id"])
+    if uuid is None:
+        raise Exception(f"uuid of {job['id']} is not found")
+    run_coroutine_in_thread(request_odm_stitch, uuid, job["id"])
 
 
 async def request_odm_stitch(uuid, id):
@@ -22,17 +44,22 @@ async def request_odm_stitch(uuid, id):
     # Path(DATA_DIR) / id / 에 flag생성
     with open(Path(DATA_DIR) / id / "step2_uploading", "w") as f:
         f.write("Stitching in progress")
+    update_state(Path(DATA_DIR) / id, "step2", uploading=True, startedAt=time.time())
 
     uploading_file = Path(DATA_DIR) / id / "step2_uploading"
 
     for file_name in listdir(Path(DATA_DIR) / id / "images"):
         file_path = Path(DATA_DIR) / id / "images" / file_name
         print(f"uploading {file_path}")
-        response = requests.post(f"{SERVER_INFO['ODM_URL']}/task/new/upload/{uuid}",
-                                 files={"images": open(file_path, "rb")})
+        try:
+            response = await odm_client.task_upload_async(uuid, str(file_path))
+        except Exception as e:
+            print(f"upload failed: {file_path} | {e}")
+            await delete_flag(uploading_file)
+            raise
         print(f"upload_response: {response.json()}")
         if 'error' in response.json() and response.json()['error'].startswith("Invalid uuid"):
-            response = requests.post(f"{SERVER_INFO['ODM_URL']}/task/restart", json={"uuid": uuid, "options": RESTART_OPTIONS})
+            response = await odm_client.task_restart_async(uuid, RESTART_OPTIONS)
             await delete_flag(uploading_file)
             return response.json()
         if response.status_code != 200:
@@ -41,11 +68,12 @@ async def request_odm_stitch(uuid, id):
             return
     # Path(DATA_DIR) / id / 에 flag삭제
     await delete_flag(uploading_file)
-    # print(f"{SERVER_INFO['ODM_URL']}/task/new/commit/{uuid}")
+    # print(f"{odm_client.base_url}/task/new/commit/{uuid}")
     # form data로 post 요청
 
 
-    response = requests.post(f"{SERVER_INFO['ODM_URL']}/task/new/commit/{uuid}")
+    response = await odm_client.task_commit_async(uuid)
+    odm_poller.refresh(uuid)
 
     # print(f"commit_response: {response}")
     print(f"{response.json()}")
@@ -56,3 +84,4 @@ async def request_odm_stitch(uuid, id):
 async def delete_flag(uploading_file):
     if uploading_file.exists():
         uploading_file.unlink()
+    update_state(uploading_file.parent, "step2", uploading=False)
@@ -0,0 +1,185 @@
+import json
+import os
+import threading
+import time
+
+from src.stitcher_step1.src.metadata.index import count_indexed_images
+
+STATE_FILE_NAME = "state.json"
+STATE_VERSION = 1
+
+DATA_STATUS = {
+    "UPLOADING": 0,
+    "READY": 1,
+    "ONPROGRESS": 2,
+    "DONE": 3,
+    "ERROR": 4,
+    "QUEUED": 5
+}
+
+_state_locks = {}
+_state_locks_guard = threading.Lock()
+
+"""
+    데이터셋의 상태를 하나의 파일({데이터 폴더}/state.json)에 기록합니다.
+    업로드 핸들러, stitch_run, stitch, request_odm_stitch가 상태를 갱신하고, 상태 조회는 이 파일 하나만 읽습니다.
+    파일은 임시 파일에 쓴 뒤 교체하여 항상 완전한 내용만 읽히도록 합니다.
+    {
+        "version": 1,
+        "createdAt": 1700000000.0, "updatedAt": 1700000000.0,
+        "upload": {"uploading": false, "nImages": 120, "total": 120, "startedAt": ..., "finishedAt": ...},
+        "step1": {"status": 3, "nCluster": 2, "nCompleted": 2, "currentCluster": 1, "errorLog": null,
+                  "startedAt": ..., "finishedAt": ...},
+        "step2": {"uploading": false, "startedAt": ...}
+    }
+"""
+
+
+def get_state_path(data_path: str) -> str:
+    return os.path.join(data_path, STATE_FILE_NAME)
+
+
+def _get_lock(state_path: str) -> threading.Lock:
+    with _state_locks_guard:
+        if state_path not in _state_locks:
+            _state_locks[state_path] = threading.Lock()
+        return _state_locks[state_path]
+
+
+def make_state(created_at: float = None) -> dict:
+    """
+    Make initial state of a dataset
+    :param created_at: creation time of the dataset, now if None
+    :return: state
+    """
+    now = time.time()
+    return {
+        "version": STATE_VERSION,
+        "createdAt": created_at or now,
+        "updatedAt": now,
+        "upload": {"uploading": False, "nImages": 0, "total": 0, "startedAt": None, "finishedAt": None},
+        "step1": {"status": DATA_STATUS["READY"], "nCluster": 0, "nCompleted": 0, "currentCluster": 0,
+                  "errorLog": None, "startedAt": None, "finishedAt": None},
+        "step2": {"uploading": False, "startedAt": None},
+    }
+
+
+def read_state(data_path: str) -> dict or None:
+    """
+    Read state of the dataset
+    :param data_path: path of the dataset
+    :return: state, None if the state does not exist
+    """
+    try:
+        with open(get_state_path(data_path), "r") as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if state.get("version") != STATE_VERSION:
+        return None
+    return state
+
+
+def write_state(data_path: str, state: dict) -> None:
+    """
+    Write state atomically
+    :param data_path: path of the dataset
+    :param state: state
+    """
+    state_path = get_state_path(data_path)
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+
+def build_legacy_state(data_path: str) -> dict:
+    """
+    Build state from marker files (uploading.txt, c_N.txt, opencv_*.jpg, flag.txt, error.txt, step2_uploading)
+    for datasets created before state.json existed
+    :param data_path: path of the dataset
+    :return: state
+    """
+    state = make_state(os.path.getctime(data_path))
+    files = os.listdir(data_path)
+
+    image_path = os.path.join(data_path, "images")
+    n_images = 0
+    if os.path.exists(image_path):
+        n_images = count_indexed_images(image_path)
+        if n_images is None:
+            n_images = len(os.listdir(image_path))
+    uploading = "uploading.txt" in files
+    state["upload"].update(uploading=uploading, nImages=n_images, total=n_images,
+                           startedAt=os.path.getctime(data_path) if uploading else None)
+
+    if "step2_uploading" in files:
+        state["step2"].update(uploading=True, startedAt=os.path.getctime(os.path.join(data_path, "step2_uploading")))
+
+    opencv_path = os.path.join(data_path, "opencv_output")
+    if not os.path.exists(opencv_path):
+        return state
+
+    step1 = state["step1"]
+    step1["startedAt"] = os.path.getctime(opencv_path)
+    opencv_files = os.listdir(opencv_path)
+    if "error.txt" in opencv_files:
+        with open(os.path.join(opencv_path, "error.txt"), "r") as f:
+            step1.update(status=DATA_STATUS["ERROR"], errorLog=f.read())
+        return state
+
+    n_cluster, n_completed, current_cluster = 0, 0, 0
+    for opencv_file in opencv_files:
+        if opencv_file.startswith("c_"):
+            n_cluster = int(opencv_file.split('_')[1].split('.')[0])
+        # 타일(.dzi, _files)과 쓰는 중인 임시 파일은 세지 않음
+        if opencv_file.startswith("opencv_") and opencv_file.endswith(".jpg"):
+            n_completed += 1
+            current_cluster = max(current_cluster, int(opencv_file.split('_')[1].split('.')[0]))
+    step1.update(nCluster=n_cluster, nCompleted=n_completed, currentCluster=current_cluster)
+    if n_cluster != 0 and (n_completed == n_cluster or "flag.txt" in opencv_files):
+        step1["status"] = DATA_STATUS["DONE"]
+    else:
+        step1["status"] = DATA_STATUS["ONPROGRESS"]
+    return state
+
+
+def get_state(data_path: str) -> dict:
+    """
+    Read state of the dataset, migrate from marker files if the state does not exist
+    :param data_path: path of the dataset
+    :return: state
+    """
+    data_path = str(data_path)
+    state = read_state(data_path)
+    if state is not None:
+        return state
+    with _get_lock(get_state_path(data_path)):
+        state = read_state(data_path)
+        if state is None:
+            state = build_legacy_state(data_path)
+            write_state(data_path, state)
+        return state
+
+
+def update_state(data_path: str, section: str = None, updater=None, **values) -> dict:
+    """
+    Update state of the dataset, create the state if it does not exist
+    :param data_path: path of the dataset
+    :param section: "upload", "step1" or "step2", values are updated in this section
+    :param updater: function(state) which modifies state in place, called after values are applied
+    :param values: values to update
+    :return: updated state
+    """
+    data_path = str(data_path)
+    with _get_lock(get_state_path(data_path)):
+        state = read_state(data_path)
+        if state is None:
+            state = build_legacy_state(data_path)
+        if section is not None:
+            state[section].update(values)
+        if updater is not None:
+            updater(state)
+        state["updatedAt"] = time.time()
+        write_state(data_path, state)
+        return state
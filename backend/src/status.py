@@ -1,22 +1,13 @@
 import os
+import time
 from datetime import datetime
-import requests
-
-from src.server_info import SERVER_INFO
+from src.odm_poller import odm_poller
 
 from src.file_query import DATA_PATH, get_uuid_by_name
 
+from src.state import DATA_STATUS, get_state
 from src.utils import convert_time
 
-DATA_STATUS = {
-    "UPLOADING": 0,
-    "READY": 1,
-    "ONPROGRESS": 2,
-    "DONE": 3,
-    "ERROR": 4,
-    "QUEUED": 5
-}
-
 ODM_STATUS = {
     "QUEUED": 10,
     "RUNNING": 20,
@@ -38,6 +29,9 @@ ODM_STATUS = {
     {데이터 이름};{UUID}
     예를 들어, 데이터 이름이 test이고 UUID가 1234인 경우
     test;1234
+
+    상태는 데이터 폴더의 state.json 하나만 읽어서 판단합니다. (src/state.py 참고)
+    state.json이 없는 기존 데이터는 처음 조회할 때 마커 파일로부터 state.json을 만듭니다.
 """
 
 
@@ -52,16 +46,6 @@ def get_data_status_step1(dir_name: str) -> tuple[str, int, dict]:
     :return:
     """
 
-    # 업로드 중인 데이터
-    if "uploading.txt" in os.listdir(os.path.join(DATA_PATH, dir_name)):
-        uploaded_time = os.path.getctime(os.path.join(DATA_PATH, dir_name))
-        uploaded_time = datetime.fromtimestamp(uploaded_time)
-        n_image = len(os.listdir(os.path.join(DATA_PATH, dir_name, "images")))
-        return convert_time(uploaded_time), n_image, {
-            "status": DATA_STATUS["UPLOADING"],
-            "data": {"startedAt": convert_time(uploaded_time)}
-        }
-
     # 존재하지 않는 파일
     if dir_name is None:
         print(f"Error: {dir_name} is not found")
@@ -71,118 +55,118 @@ def get_data_status_step1(dir_name: str) -> tuple[str, int, dict]:
         }
 
     data_path = os.path.join(DATA_PATH, dir_name)
-    opencv_path = os.path.join(data_path, "opencv_output")
-    image_path = os.path.join(data_path, "images")
-    n_images = len(os.listdir(image_path))
-    uploaded_time = os.path.getctime(data_path)
-    uploaded_time = convert_time(datetime.fromtimestamp(uploaded_time))
+    state = get_state(data_path)
+    n_images = state["upload"]["nImages"]
+    uploaded_time = get_time_from_timestamp(state["createdAt"])
+
+    # 업로드 중인 데이터
+    if state["upload"]["uploading"]:
+        return uploaded_time, n_images, {
+            "status": DATA_STATUS["UPLOADING"],
+            "data": {"startedAt": uploaded_time}
+        }
+
+    step1 = state["step1"]
     # 정합 전인 데이터
-    # data_path에 opencv_output이라는 폴더가 존재하지 않으면 정합 전
-    if not os.path.exists(opencv_path):
-        return convert_time(uploaded_time), n_images, {
+    if step1["status"] == DATA_STATUS["READY"]:
+        return uploaded_time, n_images, {
             "status": DATA_STATUS["READY"],
             "data": {"uploadedAt": uploaded_time}
         }
 
     # 정합 에러 데이터
-    # data_path에 opencv_output이 존재하고, 그 폴더에 error.txt가 존재하면 정합 에러
-    if os.path.exists(os.path.join(data_path, "opencv_output", "error.txt")):
-        # 에러 로그를 읽어서 반환
-        with open(os.path.join(data_path, "opencv_output", "error.txt"), "r") as f:
-            error_log = f.read()
-        return convert_time(uploaded_time), n_images, {
+    if step1["status"] == DATA_STATUS["ERROR"]:
+        return uploaded_time, n_images, {
             "status": DATA_STATUS["ERROR"],
-            "data": {"errorLog": error_log}
+            "data": {"errorLog": step1["errorLog"]}
         }
 
-    # 정합 중 혹은 완료 데이터
-    n_cluster = 0
-    n_completed = 0
-    current_cluster = 0
-    uploaded_time = os.path.getctime(os.path.join(opencv_path))
-    uploaded_time = convert_time(datetime.fromtimestamp(uploaded_time))
-    # data_path에 opencv_output이 존재하지만, opencv_output에 c로 시작하는 폴더가 존재하면 정합 중
-    for opencv_file in os.listdir(opencv_path):
-        if opencv_file.startswith("c_"):
-            n_cluster = int(opencv_file.split('_')[1].split('.')[0])
-
-        if opencv_file.startswith("opencv_"):
-            n_completed += 1
-            if current_cluster < int(opencv_file.split('_')[1].split('.')[0]):
-                current_cluster = int(opencv_file.split('_')[1].split('.')[0])
-
-    if n_cluster == 0:
-        return convert_time(uploaded_time), n_images, {
-            "status": DATA_STATUS["ONPROGRESS"],
-            "data": {"startedAt": uploaded_time}
-        }
+    started_at = get_time_from_timestamp(step1["startedAt"])
     # 정합이 완료된 경우
-    if n_completed == n_cluster or "flag.txt" in os.listdir(opencv_path):
-        return convert_time(uploaded_time), n_images, {
+    if step1["status"] == DATA_STATUS["DONE"]:
+        return started_at, n_images, {
             "status": DATA_STATUS["DONE"],
             "data": {"dataPath": data_path}
         }
-    # 정합 실패
-    elif n_completed < n_cluster and "flag.txt" in os.listdir(opencv_path):
-        return convert_time(uploaded_time), n_images, {
-            "status": DATA_STATUS["ERROR"],
-            "data": {"errorLog": "Stitching failed partially"}
-        }
-    # 정합 중
-    else:
-        return convert_time(uploaded_time), n_images, {
+    # 클러스터링 전
+    if step1["nCluster"] == 0:
+        return started_at, n_images, {
             "status": DATA_STATUS["ONPROGRESS"],
-            "data": {"startedAt": uploaded_time, "nCluster": n_cluster, "currentCluster": current_cluster}
+            "data": {"startedAt": started_at}
         }
+    # 정합 중
+    return started_at, n_images, {
+        "status": DATA_STATUS["ONPROGRESS"],
+        "data": {"startedAt": started_at, "nCluster": step1["nCluster"], "currentCluster": step1["currentCluster"]}
+    }
 
 
 def get_data_status_step2(dir_name: str) -> dict:
     """
-
-    :param dir_name:
-    :return:
+    ODM 작업 상태는 poller가 조회한 값만 사용하므로 ODM 서버에 요청하지 않습니다.
+    ODM 작업이 없는 데이터는 작업 없이 READY를 반환하고, 작업은 업로드 또는 step 2 정합 요청 때 만듭니다.
+    :param dir_name: 데이터 폴더 이름
+    :return: 데이터 상태
     """
     uuid = get_uuid_by_name(dir_name)
     uploaded_time = get_time_from_timestamp(os.path.getctime(os.path.join(DATA_PATH, dir_name)))
     uploaded_time = convert_time(uploaded_time)
-    if uuid is None:
-        response = requests.post(f"{SERVER_INFO['ODM_URL']}/task/new/init", )
-        uuid = response.json()["uuid"]
 
-        data_path = os.path.join(DATA_PATH, dir_name)
-
-        # data_path에 uuid_{uuid}.txt 파일 생성
-        with open(os.path.join(data_path, f"uuid_{uuid}.txt"), "w") as f:
-            f.write(f"Task is created in {datetime.now()}")
-
-    if "uploading.txt" in os.listdir(os.path.join(DATA_PATH, dir_name)):
-        uploaded_time = os.path.getctime(os.path.join(DATA_PATH, dir_name))
-        uploaded_time = datetime.fromtimestamp(uploaded_time)
+    state = get_state(os.path.join(DATA_PATH, dir_name))
+    if state["upload"]["uploading"]:
         return {
             "status": DATA_STATUS["UPLOADING"],
-            "data": {"startedAt": convert_time(uploaded_time)}
+            "data": {"startedAt": get_time_from_timestamp(state["createdAt"])}
         }
 
-    # step2_uploading이라는 파일이 존재하면, OnProgress
-    if "step2_uploading" in os.listdir(os.path.join(DATA_PATH, dir_name)):
-        started_at = get_time_from_timestamp(os.path.getctime(os.path.join(DATA_PATH, dir_name, "step2_uploading")))
+    # ODM으로 이미지를 전송 중이면 OnProgress
+    if state["step2"]["uploading"]:
+        started_at = get_time_from_timestamp(state["step2"]["startedAt"])
         return {
             "status": DATA_STATUS["UPLOADING"],
             "data": {"startedAt": started_at, "uuid": uuid}
         }
-    response = requests.get(f"{SERVER_INFO["ODM_URL"]}/task/{uuid}/info")
-    print(f"{SERVER_INFO['ODM_URL']}/task/{uuid}/info")
-    if response.status_code != 200:
+
+    # ODM 작업이 아직 없음
+    if uuid is None:
+        return {
+            "status": DATA_STATUS["READY"],
+            "data": {"startedAt": "uploading", "uuid": None, "updatedAt": None, "age": None}
+        }
+
+    # ODM 작업 상태는 백그라운드 poller가 조회한 값을 사용함
+    entry = odm_poller.get(uuid)
+    if entry is None:
+        odm_poller.register(uuid)
+        return {
+            "status": DATA_STATUS["READY"],
+            "data": {"startedAt": "uploading", "uuid": uuid, "updatedAt": None, "age": None}
+        }
+    status = get_status_from_task_info(uuid, entry["statusCode"], entry["info"], uploaded_time)
+    # 조회 시각과 경과 시간(초)을 함께 반환
+    status["data"]["updatedAt"] = get_time_from_timestamp(entry["updatedAt"])
+    status["data"]["age"] = round(time.time() - entry["updatedAt"], 1)
+    return status
+
+
+def get_status_from_task_info(uuid: str, status_code: int, response_json: dict, uploaded_time: str) -> dict:
+    """
+    NodeODM의 /task/{uuid}/info 응답을 데이터 상태로 변환합니다.
+    :param uuid: ODM 작업 uuid
+    :param status_code: HTTP 응답 코드
+    :param response_json: 응답 내용
+    :param uploaded_time: 데이터 업로드 시각
+    :return: 데이터 상태
+    """
+    if status_code != 200:
         return {
             "status": DATA_STATUS["ERROR"],
             "data": {"errorLog": "Data not found", "uuid": uuid}
         }
 
-    response_json = response.json()
-    print(response_json)
-    if response.status_code == 200:
+    if status_code == 200:
         # result에 error라는 key가 있을 경우, 준비중
-        if "error" in response.json():
+        if "error" in response_json:
             return {
                 "status": DATA_STATUS["READY"],
                 "data": {"startedAt": "uploading", "uuid": uuid}
@@ -1,10 +1,23 @@
 import argparse
+import json
+import multiprocessing
 import os
 import shutil
 import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 
 import cv2
-from src.stitcher_step1.src.metadata.gps import align_images, plotClusteredPoints, getClusteredIndicesByNumber
+from src.stitcher_step1.src.cluster_pool import init_worker, share_images, stitch_cluster
+from src.stitcher_step1.src.img_io import INGEST_WORKERS, MAX_IN_FLIGHT, MemoryTracker, link_image, load_images, \
+    read_image, release_images
+from src.stitcher_step1.src.cluster import DEFAULT_CLUSTER_METHOD, get_clusters
+from src.stitcher_step1.src.image_cache import IMAGE_CACHE_ENABLED, ImageCache, get_cache_megapixels
+from src.stitcher_step1.src.matching import DEFAULT_MATCHING_MODE, DEFAULT_MATCHING_RADIUS, DEFAULT_NEIGHBORS, \
+    get_matching_mask
+from src.stitcher_step1.src.metadata.gps import align_images, plotClusteredPoints
+from src.stitcher_step1.src.metadata.index import load_index
+from src.stitcher_step1.src.profile import DEFAULT_PROFILE, get_profile
+from src.state import DATA_STATUS, update_state
 
 ROT = {
     '0': "NO ROTATION",
@@ -13,10 +26,24 @@ ROT = {
 }
 
 OPENCV_DIR_NAME = "opencv_output"
-
-
-async def stitch_run(input_path: str, divide_threshold: int = 80, scans: int = 1, pano_conf: float = 1.0):
-    print(f"Stitching {input_path} with pano_conf={pano_conf}, scans={scans}")
+REPORT_FILE_NAME = "report.json"
+# 클러스터별 이미지 목록, 각 이미지의 원본 경로와 회전 여부를 기록함
+CLUSTER_MANIFEST_NAME = "clusters.json"
+
+# 클러스터 정합 프로세스 수와 프로세스당 OpenCV 스레드 수
+STITCH_WORKERS = max(1, (os.cpu_count() or 1) // 4)
+CV_THREADS = max(1, (os.cpu_count() or 1) // STITCH_WORKERS)
+
+
+async def stitch_run(input_path: str, divide_threshold: int = 80, scans: int = 1, pano_conf: float = 1.0,
+                     ingest_workers: int = INGEST_WORKERS, max_in_flight: int = MAX_IN_FLIGHT,
+                     profile: str = DEFAULT_PROFILE, stitch_workers: int = STITCH_WORKERS,
+                     cv_threads: int = CV_THREADS, cluster_method: str = DEFAULT_CLUSTER_METHOD,
+                     overlap: float = 0.0, matching: str = DEFAULT_MATCHING_MODE, neighbors: int = DEFAULT_NEIGHBORS,
+                     radius: float = DEFAULT_MATCHING_RADIUS, feature_cache: bool = True,
+                     image_cache: bool = IMAGE_CACHE_ENABLED, tiles: bool = True):
+    print(f"Stitching {input_path} with pano_conf={pano_conf}, scans={scans}, profile={profile}, "
+          f"cluster={cluster_method}, overlap={overlap}, matching={matching}")
     output_path = os.path.join(input_path, OPENCV_DIR_NAME)
     shutil.rmtree(output_path, ignore_errors=True)
     # output_path가 존재하는지 출력 true or false
@@ -26,54 +53,173 @@ async def stitch_run(input_path: str, divide_threshold: int = 80, scans: int = 1
     flag_path = os.path.join(output_path, f"c_{n_cluster}.txt")
     with open(flag_path, "w") as f:
         f.write("")
+    update_state(input_path, "step1", status=DATA_STATUS["ONPROGRESS"], nCluster=n_cluster, nCompleted=0,
+                 currentCluster=0, errorLog=None, startedAt=time.time(), finishedAt=None)
 
     try:
-        stitch(input_path=input_path, pano_conf=pano_conf, scans=scans, n_cluster=n_cluster)
+        stitch(input_path=input_path, pano_conf=pano_conf, scans=scans, n_cluster=n_cluster,
+               ingest_workers=ingest_workers, max_in_flight=max_in_flight, profile=profile,
+               stitch_workers=stitch_workers, cv_threads=cv_threads, cluster_method=cluster_method,
+               divide_threshold=divide_threshold, overlap=overlap, matching=matching, neighbors=neighbors,
+               radius=radius, feature_cache=feature_cache, image_cache=image_cache, tiles=tiles)
     except Exception as e:
         log_path = os.path.join(output_path, "error.txt")
         with open(log_path, "w") as f:
             f.write(str(e))
-
-
-def stitch(input_path: str, pano_conf: float = 1.0, scans: int = 1, n_cluster: int = 1):
+        update_state(input_path, "step1", status=DATA_STATUS["ERROR"], errorLog=str(e), finishedAt=time.time())
+        # 작업 큐가 작업을 failed로 기록하도록 다시 던짐
+        raise
+
+
+def stitch(input_path: str, pano_conf: float = 1.0, scans: int = 1, n_cluster: int = 1,
+           ingest_workers: int = INGEST_WORKERS, max_in_flight: int = MAX_IN_FLIGHT, profile: str = DEFAULT_PROFILE,
+           stitch_workers: int = STITCH_WORKERS, cv_threads: int = CV_THREADS,
+           cluster_method: str = DEFAULT_CLUSTER_METHOD, divide_threshold: int = 80, overlap: float = 0.0,
+           matching: str = DEFAULT_MATCHING_MODE, neighbors: int = DEFAULT_NEIGHBORS,
+           radius: float = DEFAULT_MATCHING_RADIUS, feature_cache: bool = True,
+           image_cache: bool = IMAGE_CACHE_ENABLED, tiles: bool = True):
+    stitch_profile = get_profile(profile)
+    # 디코딩한 이미지를 memory map 캐시에서 읽고, 합성 해상도로 줄여서 저장함
+    decoded_cache = ImageCache(max_megapixels=get_cache_megapixels(stitch_profile)) if image_cache else None
     image_path = os.path.join(input_path, "images")
-    images, image_names, coordinates = align_images(dir_path=image_path)
-    clustered_indices = getClusteredIndicesByNumber(coordinates, n_clusters=n_cluster)
+    tracker = MemoryTracker()
+    # 이미지는 클러스터를 정합할 때만 디코딩하고, 정합이 끝나면 해제함
+    handles, image_names, coordinates = align_images(dir_path=image_path, workers=ingest_workers,
+                                                     max_in_flight=max_in_flight, lazy=True, tracker=tracker)
+    clustered_indices = get_clusters(coordinates, method=cluster_method, n_cluster=n_cluster,
+                                     max_size=divide_threshold, overlap=overlap)
     output_base = os.path.join(input_path, OPENCV_DIR_NAME)
     os.makedirs(output_base, exist_ok=True)
+    # 공간 분할은 클러스터 수가 미리 계산한 값과 다를 수 있으므로 실제 클러스터 수로 갱신함
+    if len(clustered_indices) != n_cluster:
+        cluster_flag_path = os.path.join(output_base, f"c_{n_cluster}.txt")
+        if os.path.exists(cluster_flag_path):
+            os.replace(cluster_flag_path, os.path.join(output_base, f"c_{len(clustered_indices)}.txt"))
+        n_cluster = len(clustered_indices)
+        update_state(input_path, "step1", nCluster=n_cluster)
 
     plotClusteredPoints(coordinates, clustered_indices, output_path=os.path.join(output_base, "clustered.png"))
+    manifest = write_cluster_manifest(output_base, clustered_indices, handles, image_names)
+    content_hashes = {name: entry.get("sha256") for name, entry in load_index(image_path).items()}
+
+    cluster_times = [0.0] * len(clustered_indices)
+    # 클러스터는 서로 독립적이므로 프로세스 풀에서 병렬로 정합함
+    # 공유 메모리에 올라간 클러스터 수는 워커 수로 제한함
+    executor = ProcessPoolExecutor(max_workers=stitch_workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=init_worker, initargs=(cv_threads,))
+    running = {}
+    try:
+        for idx, clustered_index in enumerate(clustered_indices):
+            while len(running) >= stitch_workers:
+                _wait_clusters(input_path, running, cluster_times, tracker, n_cluster)
+
+            clustered_handles = [handles[i] for i in clustered_index]
+            clustered_images = load_images(clustered_handles, workers=ingest_workers, max_in_flight=max_in_flight,
+                                           cache=decoded_cache)
+            # 원본과 같은 이미지는 link로 두고, 회전된 이미지만 파일로 씀
+            # 캐시의 이미지는 합성 해상도로 줄어 있으므로 원본 해상도로 다시 디코딩함
+            for entry, image in zip(manifest[idx]["images"], clustered_images):
+                if entry["rotation"] != 0:
+                    if decoded_cache is not None:
+                        image = read_image(entry["path"], rotated=True)
+                    cv2.imwrite(os.path.join(output_base, entry["file"]), image)
+
+            shm, layout = share_images(clustered_images)
+            tracker.add(shm.size, len(clustered_images))
+            del clustered_images
+            release_images(clustered_handles)
+
+            # GPS 좌표상 이웃한 이미지 쌍만 매칭함 (matching이 all이면 None)
+            matching_mask = get_matching_mask([coordinates[i] for i in clustered_index], matching, neighbors, radius)
+            # 특징점은 캐시에서 읽고, 없으면 워커가 계산하여 캐시에 저장함
+            # 캐시 키인 이미지 내용 hash는 인덱스의 값을 넘겨서 워커가 원본을 다시 읽지 않도록 함
+            feature_args = ([handle.path for handle in clustered_handles],
+                            [handle.rotated for handle in clustered_handles],
+                            [content_hashes.get(os.path.basename(handle.path)) for handle in clustered_handles]) \
+                if feature_cache else (None, None, None)
+            future = executor.submit(stitch_cluster, idx, shm.name, layout, stitch_profile, scans, pano_conf,
+                                     output_base, matching_mask, *feature_args, tiles)
+            running[future] = (shm, len(layout))
+
+        while running:
+            _wait_clusters(input_path, running, cluster_times, tracker, n_cluster)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        for shm, n_images in running.values():
+            tracker.remove(shm.size, n_images)
+            shm.unlink()
+
+    print(f"Peak decoded image memory : {tracker.peak_bytes / 1024 / 1024:.1f} MB ({tracker.peak_images} images)")
+    with open(os.path.join(output_base, REPORT_FILE_NAME), "w") as f:
+        json.dump({"profile": stitch_profile, "scans": scans, "panoConf": pano_conf, "clusterMethod": cluster_method,
+                   "overlap": overlap, "matching": matching, "imageCache": image_cache, "tiles": tiles,
+                   "clusters": clustered_indices, "clusterTimes": cluster_times, "memory": tracker.to_dict()}, f)
+    file = open(os.path.join(output_base, "flag.txt"), "w")
+    file.write("1")
+    file.close()
+    update_state(input_path, "step1", status=DATA_STATUS["DONE"], finishedAt=time.time())
 
-    for idx, clustered_index in enumerate(clustered_indices):
-        clustered_images = [images[i] for i in clustered_index]
-        clustered_image_names = [image_names[i] for i in clustered_index]
-        cluster_output_base = os.path.join(output_base, f"cluster_{idx}")
-        os.makedirs(cluster_output_base, exist_ok=True)
-
-        for _idx, image_name in enumerate(clustered_image_names):
-            cv2.imwrite(os.path.join(cluster_output_base, f"{_idx}_{image_name.split('\\')[-1]}"),
-                        clustered_images[_idx])
-
-        if scans == 1:
-            stitcher = cv2.Stitcher.create(mode=cv2.STITCHER_SCANS)
-        else:
-            stitcher = cv2.Stitcher.create(mode=cv2.STITCHER_PANORAMA)
-
-        stitcher.setPanoConfidenceThresh(pano_conf)
 
+def write_cluster_manifest(output_base: str, clustered_indices: list[list[int]], handles: list,
+                           image_names: list[str]) -> list[dict]:
+    """
+    Write cluster manifest and link images which are not rotated into cluster_{idx} folders
+    :param output_base: output directory
+    :param clustered_indices: list of image indices of each cluster
+    :param handles: image handles of aligned images
+    :param image_names: names of aligned images
+    :return: manifest, list of {"cluster", "images": [{"index", "name", "path", "rotation", "file"}]}
+    """
+    manifest = []
+    for idx, clustered_index in enumerate(clustered_indices):
+        cluster_dir_name = f"cluster_{idx}"
+        os.makedirs(os.path.join(output_base, cluster_dir_name), exist_ok=True)
+        images = []
+        for _idx, i in enumerate(clustered_index):
+            image_name = os.path.basename(image_names[i].replace('\\', '/'))
+            entry = {"index": _idx, "name": image_name, "path": os.path.abspath(handles[i].path),
+                     "rotation": 180 if handles[i].rotated else 0,
+                     "file": f"{cluster_dir_name}/{_idx}_{image_name}"}
+            if entry["rotation"] == 0:
+                link_image(entry["path"], os.path.join(output_base, entry["file"]))
+            images.append(entry)
+        manifest.append({"cluster": idx, "images": images})
+    with open(os.path.join(output_base, CLUSTER_MANIFEST_NAME), "w") as f:
+        json.dump({"clusters": manifest}, f)
+    return manifest
+
+
+def _wait_clusters(input_path: str, running: dict, cluster_times: list[float], tracker: MemoryTracker,
+                   n_cluster: int):
+    """
+    Wait until at least one running cluster is finished, free its shared memory and check the result
+    :param input_path: path of the dataset, progress is written to its state
+    :param running: dict of {future: (shared memory, number of images)}
+    :param cluster_times: elapsed time of each cluster
+    :param tracker: memory tracker
+    :param n_cluster: number of clusters
+    """
+    done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+    for future in done:
+        shm, n_images = running.pop(future)
+        tracker.remove(shm.size, n_images)
+        shm.unlink()
         try:
-            status, stitched = stitcher.stitch(clustered_images)
+            idx, status, elapsed, error = future.result()
         except Exception as e:
             raise Exception(f"Stitching step 1 failed | n_cluster : {n_cluster} | Error : {e}")
-
-        if status == cv2.Stitcher_OK:
-            cv2.imwrite(os.path.join(output_base, f"opencv_{idx}.jpg"), stitched)
-        else:
+        if error is not None:
+            raise Exception(f"Stitching step 1 failed | n_cluster : {n_cluster} | Error : {error}")
+        cluster_times[idx] = elapsed
+        if status != cv2.Stitcher_OK:
             print("Stitching failed. Error code: ", status)
             raise Exception(f"Stitching step 1 failed | n_cluster : {n_cluster}")
-    file = open(os.path.join(output_base, "flag.txt"), "w")
-    file.write("1")
-    file.close()
+
+        def update_progress(state):
+            state["step1"]["nCompleted"] += 1
+            state["step1"]["currentCluster"] = max(state["step1"]["currentCluster"], idx)
+
+        update_state(input_path, updater=update_progress)
 
 
 def main():
@@ -0,0 +1,135 @@
+import math
+
+import numpy as np
+
+from src.stitcher_step1.src.metadata.gps import getClusteredIndicesByNumber
+
+EARTH_RADIUS = 6378137.0
+
+CLUSTER_METHODS = {
+    "sequential": "촬영 순서대로 같은 수의 이미지씩 나눔 (기존 방식)",
+    "kdtree": "GPS 좌표를 긴 축 방향으로 반복해서 나누는 k-d 트리 분할",
+    "grid": "GPS 좌표를 분위수 기준의 격자로 나누는 분할",
+}
+DEFAULT_CLUSTER_METHOD = "sequential"
+
+"""
+    정합할 클러스터를 나누는 방법을 정의합니다.
+    sequential은 촬영 순서대로 자르므로 지그재그 비행에서는 길고 가는 띠 모양 클러스터가 생깁니다.
+    kdtree와 grid는 GPS 좌표를 미터 단위 평면 좌표로 바꾼 뒤 공간적으로 나누므로 정사각형에 가까운 클러스터가 되며,
+    모든 클러스터의 크기는 max_size 이하로 거의 같습니다.
+    overlap(미터)을 주면 다른 클러스터의 이미지 중 클러스터와 overlap 이내에 있는 이미지를 함께 넣어,
+    이웃한 클러스터가 경계 이미지를 공유하도록 합니다. 이 경우 클러스터 크기는 max_size보다 커질 수 있습니다.
+    클러스터 안의 인덱스는 촬영 순서대로 정렬되어 있습니다.
+"""
+
+
+def to_local_xy(coordinates: list[tuple]) -> np.ndarray:
+    """
+    Project (latitude, longitude) to local plane coordinates in meters around their center
+    :param coordinates: list of (latitude, longitude)
+    :return: array of shape (n, 2), (east, north)
+    """
+    points = np.asarray(coordinates, dtype=np.float64)[:, :2]
+    lat0 = math.radians(points[:, 0].mean())
+    lat, lon = np.radians(points[:, 0]), np.radians(points[:, 1])
+    x = (lon - lon.mean()) * math.cos(lat0) * EARTH_RADIUS
+    y = (lat - lat.mean()) * EARTH_RADIUS
+    return np.stack([x, y], axis=1)
+
+
+def cluster_kdtree(xy: np.ndarray, max_size: int) -> list[np.ndarray]:
+    """
+    Split points along the longer extent until every cluster has at most max_size points.
+    the number of leaves is ceil(n / max_size) and each split keeps the leaves balanced
+    :param xy: points of shape (n, 2)
+    :param max_size: maximum number of points in a cluster
+    :return: list of index arrays
+    """
+    clusters = []
+    stack = [(np.arange(len(xy)), max(1, math.ceil(len(xy) / max_size)))]
+    while stack:
+        indices, n_leaves = stack.pop()
+        if n_leaves <= 1:
+            clusters.append(indices)
+            continue
+        points = xy[indices]
+        axis = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+        order = indices[np.argsort(points[:, axis], kind="stable")]
+        n_left_leaves = n_leaves // 2
+        n_left = round(len(indices) * n_left_leaves / n_leaves)
+        stack.append((order[n_left:], n_leaves - n_left_leaves))
+        stack.append((order[:n_left], n_left_leaves))
+    return clusters
+
+
+def cluster_grid(xy: np.ndarray, max_size: int) -> list[np.ndarray]:
+    """
+    Split points into columns by x quantiles, then each column into cells by y quantiles.
+    the number of columns and rows follows the aspect ratio of the area
+    :param xy: points of shape (n, 2)
+    :param max_size: maximum number of points in a cluster
+    :return: list of index arrays
+    """
+    n_cells = max(1, math.ceil(len(xy) / max_size))
+    width, height = np.maximum(xy.max(axis=0) - xy.min(axis=0), 1e-6)
+    n_columns = min(n_cells, max(1, round(math.sqrt(n_cells * width / height))))
+
+    clusters = []
+    for column in np.array_split(np.argsort(xy[:, 0], kind="stable"), n_columns):
+        n_rows = max(1, math.ceil(len(column) / max_size))
+        order = column[np.argsort(xy[column, 1], kind="stable")]
+        clusters.extend(cell for cell in np.array_split(order, n_rows) if len(cell) > 0)
+    return clusters
+
+
+def add_overlap(xy: np.ndarray, clusters: list[np.ndarray], overlap: float) -> list[np.ndarray]:
+    """
+    Add points of other clusters which are within overlap meters from any point of the cluster
+    :param xy: points of shape (n, 2)
+    :param clusters: list of index arrays
+    :param overlap: margin in meters
+    :return: list of index arrays
+    """
+    if overlap <= 0 or len(clusters) <= 1:
+        return clusters
+    result = []
+    for indices in clusters:
+        members = xy[indices]
+        # 클러스터의 영역을 overlap만큼 넓힌 범위 안의 점만 거리를 계산함
+        low, high = members.min(axis=0) - overlap, members.max(axis=0) + overlap
+        candidates = np.where(np.all((xy >= low) & (xy <= high), axis=1))[0]
+        candidates = np.setdiff1d(candidates, indices)
+        if len(candidates) > 0:
+            distances = np.linalg.norm(xy[candidates, np.newaxis] - members[np.newaxis], axis=2).min(axis=1)
+            indices = np.concatenate([indices, candidates[distances <= overlap]])
+        result.append(indices)
+    return result
+
+
+def get_clusters(coordinates: list[tuple], method: str = DEFAULT_CLUSTER_METHOD, n_cluster: int = 1,
+                 max_size: int = 80, overlap: float = 0.0) -> list[list[int]]:
+    """
+    Cluster images by method
+    :param coordinates: list of (latitude, longitude) sorted by time
+    :param method: one of CLUSTER_METHODS
+    :param n_cluster: number of clusters, used by sequential
+    :param max_size: maximum number of images in a cluster except overlap, used by kdtree and grid
+    :param overlap: margin in meters shared by neighbouring clusters
+    :return: list of list of indices, sorted by time in each cluster
+    """
+    if method not in CLUSTER_METHODS:
+        raise ValueError(f"Invalid cluster method : {method}, available : {list(CLUSTER_METHODS.keys())}")
+    if method == "sequential" and overlap <= 0:
+        return getClusteredIndicesByNumber(coordinates, n_clusters=n_cluster)
+
+    xy = to_local_xy(coordinates)
+    if method == "sequential":
+        clusters = [np.array(indices, dtype=np.int64) for indices in
+                    getClusteredIndicesByNumber(coordinates, n_clusters=n_cluster)]
+    elif method == "kdtree":
+        clusters = cluster_kdtree(xy, max_size)
+    else:
+        clusters = cluster_grid(xy, max_size)
+    clusters = add_overlap(xy, clusters, overlap)
+    return [sorted(int(i) for i in indices) for indices in clusters if len(indices) > 0]
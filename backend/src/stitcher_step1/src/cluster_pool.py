@@ -0,0 +1,112 @@
+import os
+import time
+from multiprocessing.shared_memory import SharedMemory
+
+import cv2
+import numpy as np
+
+from src.stitcher_step1.src.detailed import stitch_images
+from src.stitcher_step1.src.feature_cache import get_features
+from src.stitcher_step1.src.tiles import build_tiles
+
+"""
+    클러스터 정합을 프로세스 풀에서 실행하기 위한 함수들을 정의합니다.
+    부모 프로세스는 클러스터의 이미지를 하나의 공유 메모리 블록에 복사하고, 워커는 pickle 없이 그 블록을 그대로 참조합니다.
+    워커는 정합이 끝나는 즉시 opencv_{idx}.jpg를 저장하므로 진행 상황은 기존과 같이 표시됩니다.
+    타일 피라미드도 결과를 다시 디코딩하지 않도록 워커가 메모리에 있는 결과로 바로 만듭니다.
+"""
+
+
+def share_images(images: list) -> tuple[SharedMemory, list[tuple]]:
+    """
+    Copy images into one shared memory block
+    :param images: decoded images
+    :return: shared memory, layout of each image (shape, dtype, offset)
+    """
+    total_bytes = sum(image.nbytes for image in images)
+    shm = SharedMemory(create=True, size=max(1, total_bytes))
+    layout = []
+    offset = 0
+    for image in images:
+        view = np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf, offset=offset)
+        view[...] = image
+        layout.append((image.shape, image.dtype.str, offset))
+        offset += image.nbytes
+        del view
+    return shm, layout
+
+
+def attach_images(shm_name: str, layout: list[tuple]) -> tuple[SharedMemory, list[np.ndarray]]:
+    """
+    Attach shared memory created by share_images and get images without copying
+    :param shm_name: name of shared memory
+    :param layout: layout from share_images
+    :return: shared memory, images which are views of the shared memory
+    """
+    # spawn으로 생성된 워커는 부모의 resource tracker를 공유하므로, 해제(unlink)는 부모 프로세스가 담당함
+    shm = SharedMemory(name=shm_name)
+    images = [np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+              for shape, dtype, offset in layout]
+    return shm, images
+
+
+def init_worker(cv_threads: int):
+    """
+    Initialize worker process, limit number of OpenCV threads of the worker
+    :param cv_threads: number of OpenCV threads per worker
+    """
+    cv2.setNumThreads(cv_threads)
+
+
+def stitch_cluster(idx: int, shm_name: str, layout: list[tuple], profile: dict, scans: int, pano_conf: float,
+                   output_base: str, matching_mask: np.ndarray = None, image_paths: list[str] = None,
+                   rotated: list[bool] = None, content_hashes: list[str] = None,
+                   tiles: bool = True) -> tuple[int, int, float, str | None]:
+    """
+    Stitch one cluster in a worker process and save opencv_{idx}.jpg
+    :param idx: cluster index
+    :param shm_name: name of shared memory holding images of the cluster
+    :param layout: layout from share_images
+    :param profile: stitching profile
+    :param scans: 1 for scans mode, otherwise panorama mode
+    :param pano_conf: panorama confidence
+    :param output_base: output directory
+    :param matching_mask: N x N uint8 matrix, non-zero for pairs to be matched, every pair if None
+    :param image_paths: original image paths, features are read from the feature cache if given
+    :param rotated: whether each image is rotated 180 degree, used with image_paths
+    :param content_hashes: sha256 of each image from the metadata index, used with image_paths
+    :param tiles: build tile pyramid of the stitched image
+    :return: cluster index, status, elapsed time, error message
+    """
+    start_time = time.time()
+    shm, images = attach_images(shm_name, layout)
+    status, error = cv2.Stitcher_ERR_NEED_MORE_IMGS, None
+    try:
+        features = None
+        if image_paths is not None:
+            features, n_hits = get_features(images, image_paths, rotated, profile, content_hashes)
+            print(f"Cluster {idx} : {n_hits}/{len(images)} features are read from the cache")
+        status, stitched = stitch_images(images, profile, scans=scans, pano_conf=pano_conf, features=features,
+                                         matching_mask=matching_mask)
+        if status == cv2.Stitcher_OK:
+            stitched_path = os.path.join(output_base, f"opencv_{idx}.jpg")
+            # 서버가 타일을 만들면서 쓰는 중인 파일을 읽지 않도록 임시 파일에 쓰고 교체함
+            success, encoded = cv2.imencode(".jpg", stitched)
+            if not success:
+                raise RuntimeError(f"Failed to encode opencv_{idx}.jpg")
+            tmp_path = f"{stitched_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(encoded)
+            os.replace(tmp_path, stitched_path)
+            if tiles:
+                try:
+                    build_tiles(stitched, stitched_path)
+                except Exception as e:
+                    # 타일은 요청될 때 다시 만들 수 있으므로 정합 실패로 처리하지 않음
+                    print(f"Cluster {idx} : failed to build tiles | {e}")
+    except Exception as e:
+        # 예외의 traceback이 공유 메모리의 view를 참조하지 않도록 메시지만 반환함
+        error = str(e)
+    del images
+    shm.close()
+    return idx, status, time.time() - start_time, error
@@ -0,0 +1,281 @@
+import math
+
+import cv2
+import numpy as np
+
+"""
+    cv2.Stitcher를 단계별로 풀어 쓴 정합 파이프라인입니다. (OpenCV의 stitching_detailed 예제 기반)
+    특징점 검출기, seam finder, blender, 노출 보정과 각 단계의 해상도를 프로파일로 지정할 수 있습니다.
+    반환 값은 cv2.Stitcher.stitch와 같이 (status, 결과 이미지)입니다.
+"""
+
+WARP_TYPE = {
+    1: "affine",
+    0: "spherical",
+}
+
+SEAM_FINDERS = {
+    "no": lambda: cv2.detail.SeamFinder_createDefault(cv2.detail.SeamFinder_NO),
+    "voronoi": lambda: cv2.detail.SeamFinder_createDefault(cv2.detail.SeamFinder_VORONOI_SEAM),
+    "gc_color": lambda: cv2.detail_GraphCutSeamFinder("COST_COLOR"),
+    "dp_color": lambda: cv2.detail_DpSeamFinder("COLOR"),
+}
+
+EXPOSURE_COMPENSATORS = {
+    "no": cv2.detail.ExposureCompensator_NO,
+    "gain": cv2.detail.ExposureCompensator_GAIN,
+    "gain_blocks": cv2.detail.ExposureCompensator_GAIN_BLOCKS,
+    "channels": cv2.detail.ExposureCompensator_CHANNELS,
+    "channels_blocks": cv2.detail.ExposureCompensator_CHANNELS_BLOCKS,
+}
+
+MATCH_CONF = {
+    "orb": 0.3,
+    "akaze": 0.3,
+    "sift": 0.65,
+}
+
+BLEND_STRENGTH = 5
+
+
+def create_finder(profile: dict):
+    """
+    Create feature detector of the profile
+    :param profile: stitching profile
+    :return: cv2.Feature2D
+    """
+    if profile["features"] == "orb":
+        return cv2.ORB.create(nfeatures=profile.get("n_features", 500))
+    if profile["features"] == "sift":
+        return cv2.SIFT.create(nfeatures=profile.get("n_features", 0))
+    if profile["features"] == "akaze":
+        return cv2.AKAZE.create()
+    raise ValueError(f"Invalid features : {profile['features']}")
+
+
+def create_matcher(profile: dict, scans: int = 1):
+    """
+    Create feature matcher, affine matcher for scans mode
+    :param profile: stitching profile
+    :param scans: 1 for scans mode, otherwise panorama mode
+    :return: cv2.detail.FeaturesMatcher
+    """
+    match_conf = MATCH_CONF[profile["features"]]
+    if scans == 1:
+        return cv2.detail_AffineBestOf2NearestMatcher(False, False, match_conf)
+    return cv2.detail_BestOf2NearestMatcher(False, match_conf)
+
+
+def get_scale(resol: float, image_area: int) -> float:
+    """
+    Get scale of image for given resolution in megapixel, 1.0 if resol is negative
+    :param resol: resolution in megapixel
+    :param image_area: number of pixels of the original image
+    :return: scale
+    """
+    if resol < 0:
+        return 1.0
+    return min(1.0, math.sqrt(resol * 1e6 / image_area))
+
+
+def compute_features(images: list, finder, work_scale: float) -> list:
+    """
+    Detect features of images resized by work_scale
+    :param images: images
+    :param finder: feature detector
+    :param work_scale: scale for registration
+    :return: list of cv2.detail.ImageFeatures
+    """
+    features = []
+    for idx, image in enumerate(images):
+        if work_scale < 1.0:
+            image = cv2.resize(image, dsize=None, fx=work_scale, fy=work_scale, interpolation=cv2.INTER_LINEAR_EXACT)
+        feature = cv2.detail.computeImageFeatures2(finder, image)
+        feature.img_idx = idx
+        features.append(feature)
+    return features
+
+
+def match_features(matcher, features: list, matching_mask: np.ndarray = None) -> list:
+    """
+    Match features of every image pair, only pairs marked in matching_mask if given
+    :param matcher: feature matcher
+    :param features: list of cv2.detail.ImageFeatures
+    :param matching_mask: N x N uint8 matrix, non-zero for pairs to be matched
+    :return: list of cv2.detail.MatchesInfo
+    """
+    if matching_mask is None:
+        pairwise_matches = matcher.apply2(features)
+    else:
+        pairwise_matches = matcher.apply2(features, cv2.UMat(matching_mask.astype(np.uint8)))
+    matcher.collectGarbage()
+    return pairwise_matches
+
+
+def subset_matches(pairwise_matches: list, indices: list[int], n_images: int) -> list:
+    """
+    Keep matches between the given images and renumber them, same as cv2.detail.leaveBiggestComponent does
+    :param pairwise_matches: list of cv2.detail.MatchesInfo of n_images x n_images pairs
+    :param indices: indices of images to keep
+    :param n_images: number of images matched
+    :return: list of cv2.detail.MatchesInfo of len(indices) x len(indices) pairs
+    """
+    subset = []
+    for i, src in enumerate(indices):
+        for j, dst in enumerate(indices):
+            matches_info = pairwise_matches[src * n_images + dst]
+            matches_info.src_img_idx = i
+            matches_info.dst_img_idx = j
+            subset.append(matches_info)
+    return subset
+
+
+def create_blender(profile: dict, corners: list, sizes: list):
+    dst_sz = cv2.detail.resultRoi(corners=corners, sizes=sizes)
+    blend_width = np.sqrt(dst_sz[2] * dst_sz[3]) * BLEND_STRENGTH / 100
+    if profile["blender"] == "no" or blend_width < 1:
+        blender = cv2.detail.Blender_createDefault(cv2.detail.Blender_NO)
+    elif profile["blender"] == "multiband":
+        blender = cv2.detail_MultiBandBlender()
+        blender.setNumBands(int(np.log(blend_width) / np.log(2.) - 1.))
+    elif profile["blender"] == "feather":
+        blender = cv2.detail_FeatherBlender()
+        blender.setSharpness(1. / blend_width)
+    else:
+        raise ValueError(f"Invalid blender : {profile['blender']}")
+    blender.prepare(dst_sz)
+    return blender
+
+
+def stitch_images(images: list, profile: dict, scans: int = 1, pano_conf: float = 1.0,
+                  features: list = None, matching_mask: np.ndarray = None) -> tuple[int, np.ndarray | None]:
+    """
+    Stitch images with the detailed pipeline configured by profile
+    :param images: images to stitch
+    :param profile: stitching profile
+    :param scans: 1 for scans mode (affine), otherwise panorama mode
+    :param pano_conf: confidence threshold to keep images in the panorama
+    :param features: precomputed features at registration scale, computed if None
+    :param matching_mask: N x N uint8 matrix, non-zero for pairs to be matched
+    :return: status (cv2.Stitcher_*), stitched image
+    """
+    if len(images) < 2:
+        return cv2.Stitcher_ERR_NEED_MORE_IMGS, None
+
+    image_area = images[0].shape[0] * images[0].shape[1]
+    work_scale = get_scale(profile["registration_resol"], image_area)
+    seam_scale = get_scale(profile["seam_estimation_resol"], image_area)
+    compose_scale = get_scale(profile["compositing_resol"], image_area)
+    seam_work_aspect = seam_scale / work_scale
+
+    # 특징점 검출 및 매칭
+    if features is None:
+        features = compute_features(images, create_finder(profile), work_scale)
+    pairwise_matches = match_features(create_matcher(profile, scans), features, matching_mask)
+
+    # 가장 큰 연결 요소의 이미지만 남김
+    indices = cv2.detail.leaveBiggestComponent(features, pairwise_matches, pano_conf)
+    indices = [int(i) for i in np.array(indices).flatten()]
+    if len(indices) < 2:
+        return cv2.Stitcher_ERR_NEED_MORE_IMGS, None
+    if len(indices) < len(images):
+        # 남은 이미지 쌍의 매칭 결과만 골라서 번호를 다시 매김 (다시 매칭하지 않음)
+        pairwise_matches = subset_matches(pairwise_matches, indices, len(features))
+        features = [features[i] for i in indices]
+        for idx, feature in enumerate(features):
+            feature.img_idx = idx
+    images = [images[i] for i in indices]
+    full_img_sizes = [(image.shape[1], image.shape[0]) for image in images]
+
+    # 카메라 파라미터 추정 및 보정
+    if scans == 1:
+        estimator = cv2.detail_AffineBasedEstimator()
+        adjuster = cv2.detail_BundleAdjusterAffinePartial()
+    else:
+        estimator = cv2.detail_HomographyBasedEstimator()
+        adjuster = cv2.detail_BundleAdjusterRay()
+    success, cameras = estimator.apply(features, pairwise_matches, None)
+    if not success:
+        return cv2.Stitcher_ERR_HOMOGRAPHY_EST_FAIL, None
+    for camera in cameras:
+        camera.R = camera.R.astype(np.float32)
+
+    adjuster.setConfThresh(pano_conf)
+    success, cameras = adjuster.apply(features, pairwise_matches, cameras)
+    if not success:
+        return cv2.Stitcher_ERR_CAMERA_PARAMS_ADJUST_FAIL, None
+
+    focals = sorted([camera.focal for camera in cameras])
+    if len(focals) % 2 == 1:
+        warped_image_scale = focals[len(focals) // 2]
+    else:
+        warped_image_scale = (focals[len(focals) // 2] + focals[len(focals) // 2 - 1]) / 2
+
+    if scans != 1:
+        rmats = [np.copy(camera.R) for camera in cameras]
+        rmats = cv2.detail.waveCorrect(rmats, cv2.detail.WAVE_CORRECT_HORIZ)
+        for idx, camera in enumerate(cameras):
+            camera.R = rmats[idx]
+
+    # seam 탐색 해상도에서 이미지 와핑
+    warp_type = WARP_TYPE[1 if scans == 1 else 0]
+    warper = cv2.PyRotationWarper(warp_type, warped_image_scale * seam_work_aspect)
+    corners, masks_warped, images_warped, sizes = [], [], [], []
+    for idx, image in enumerate(images):
+        seam_image = cv2.resize(image, dsize=None, fx=seam_scale, fy=seam_scale,
+                                interpolation=cv2.INTER_LINEAR_EXACT)
+        K = cameras[idx].K().astype(np.float32)
+        K[0, 0] *= seam_work_aspect
+        K[0, 2] *= seam_work_aspect
+        K[1, 1] *= seam_work_aspect
+        K[1, 2] *= seam_work_aspect
+        corner, image_wp = warper.warp(seam_image, K, cameras[idx].R, cv2.INTER_LINEAR, cv2.BORDER_REFLECT)
+        corners.append(corner)
+        sizes.append((image_wp.shape[1], image_wp.shape[0]))
+        images_warped.append(image_wp)
+        mask = 255 * np.ones((seam_image.shape[0], seam_image.shape[1]), np.uint8)
+        _, mask_wp = warper.warp(mask, K, cameras[idx].R, cv2.INTER_NEAREST, cv2.BORDER_CONSTANT)
+        masks_warped.append(mask_wp)
+
+    # panorama 모드는 cv2.Stitcher(PANORAMA)와 같이 노출 보정을 함
+    compensator_name = profile["exposure_compensator"] if scans == 1 else profile["panorama_exposure_compensator"]
+    compensator = cv2.detail.ExposureCompensator_createDefault(EXPOSURE_COMPENSATORS[compensator_name])
+    compensator.feed(corners=corners, images=images_warped, masks=masks_warped)
+
+    seam_finder = SEAM_FINDERS[profile["seam_finder"]]()
+    images_warped_f = [image_wp.astype(np.float32) for image_wp in images_warped]
+    masks_warped = seam_finder.find(images_warped_f, corners, masks_warped)
+    del images_warped, images_warped_f
+
+    # 합성 해상도에서 이미지 와핑 및 블렌딩
+    compose_work_aspect = compose_scale / work_scale
+    warped_image_scale *= compose_work_aspect
+    warper = cv2.PyRotationWarper(warp_type, warped_image_scale)
+    corners, sizes = [], []
+    for idx, camera in enumerate(cameras):
+        camera.focal *= compose_work_aspect
+        camera.ppx *= compose_work_aspect
+        camera.ppy *= compose_work_aspect
+        size = (int(round(full_img_sizes[idx][0] * compose_scale)), int(round(full_img_sizes[idx][1] * compose_scale)))
+        roi = warper.warpRoi(size, camera.K().astype(np.float32), camera.R)
+        corners.append(roi[0:2])
+        sizes.append(roi[2:4])
+
+    blender = create_blender(profile, corners, sizes)
+    for idx, image in enumerate(images):
+        if compose_scale < 1.0:
+            image = cv2.resize(image, dsize=None, fx=compose_scale, fy=compose_scale,
+                               interpolation=cv2.INTER_LINEAR_EXACT)
+        K = cameras[idx].K().astype(np.float32)
+        corner, image_warped = warper.warp(image, K, cameras[idx].R, cv2.INTER_LINEAR, cv2.BORDER_REFLECT)
+        mask = 255 * np.ones((image.shape[0], image.shape[1]), np.uint8)
+        _, mask_warped = warper.warp(mask, K, cameras[idx].R, cv2.INTER_NEAREST, cv2.BORDER_CONSTANT)
+        compensator.apply(idx, corners[idx], image_warped, mask_warped)
+        dilated_mask = cv2.dilate(masks_warped[idx], None)
+        seam_mask = cv2.resize(dilated_mask, (mask_warped.shape[1], mask_warped.shape[0]), 0, 0,
+                               cv2.INTER_LINEAR_EXACT)
+        mask_warped = cv2.bitwise_and(seam_mask, mask_warped)
+        blender.feed(cv2.UMat(image_warped.astype(np.int16)), mask_warped, corners[idx])
+
+    result, _ = blender.blend(None, None)
+    return cv2.Stitcher_OK, cv2.convertScaleAbs(result)
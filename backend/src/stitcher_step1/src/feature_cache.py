@@ -0,0 +1,234 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from src.file_cache import get_content_hash
+from src.stitcher_step1.src.detailed import create_finder, get_scale
+from src.stitcher_step1.src.profile import DEFAULT_PROFILE, PROFILES, get_profile
+
+FEATURE_DIR_NAME = "features"
+FEATURE_CACHE_VERSION = 1
+# 업로드/수신된 이미지의 특징점을 항상 미리 계산할 프로파일
+FEATURE_CACHE_PROFILES = [DEFAULT_PROFILE]
+# 데이터별로 요청된 프로파일 목록, {데이터 폴더}/features/profiles.json
+FEATURE_PROFILES_FILE_NAME = "profiles.json"
+# 백그라운드에서 특징점을 계산하는 스레드 수
+FEATURE_WORKERS = 2
+
+"""
+    이미지별 특징점(keypoints, descriptors)을 디스크에 캐시합니다.
+    캐시 파일은 {데이터 폴더}/features/{이미지 내용 sha256}_{검출기 설정 hash}.npz 이며,
+    이미지 내용과 검출기 설정(features, n_features, registration_resol)이 같으면 다시 계산하지 않습니다.
+    이미지 내용 sha256은 메타데이터 인덱스에 저장된 값을 받아서 사용하므로, 캐시를 확인할 때 원본 파일을 다시 읽지 않습니다.
+    특징점은 회전하지 않은 원본 이미지 기준으로 저장하고, 180도 회전된 이미지에는 좌표와 방향을 뒤집어 사용합니다.
+    업로드(save_file, 업로드 세션)와 listener.py 수신 직후 schedule_features로 백그라운드에서 미리 계산하며,
+    캐시에 없는 특징점은 정합 중에 계산하여 저장합니다.
+    미리 계산하는 프로파일은 FEATURE_CACHE_PROFILES와 데이터에 요청된 프로파일입니다.
+    step 1 정합 요청과 업로드 세션 생성 시 지정한 profiles가 profiles.json에 기록되므로,
+    이후 추가로 업로드되는 이미지는 그 프로파일로도 미리 계산됩니다.
+    npz 파일 구성
+    - keypoints: (N, 7) float32, x, y, size, angle, response, octave, class_id
+    - descriptors: (N, D) 검출기의 descriptor
+    - img_size: (width, height), registration 해상도로 줄인 이미지의 크기
+"""
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_settings_key(profile: dict) -> str:
+    settings = {"version": FEATURE_CACHE_VERSION, "features": profile["features"],
+                "n_features": profile.get("n_features"), "registration_resol": profile["registration_resol"]}
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def get_cache_path(image_path: str, profile: dict, content_hash: str = None) -> str:
+    """
+    Cache path of the image, features folder is next to the images folder
+    :param image_path: {data folder}/images/{image name}
+    :param profile: stitching profile
+    :param content_hash: sha256 of the image, computed from the file if None
+    :return: cache path
+    """
+    content_hash = content_hash or get_content_hash(image_path)
+    return os.path.join(get_data_path(image_path), FEATURE_DIR_NAME,
+                        f"{content_hash}_{get_settings_key(profile)}.npz")
+
+
+def features_to_arrays(feature) -> dict:
+    keypoints = np.array([(kp.pt[0], kp.pt[1], kp.size, kp.angle, kp.response, kp.octave, kp.class_id)
+                          for kp in feature.keypoints], dtype=np.float32).reshape(-1, 7)
+    descriptors = feature.descriptors
+    if isinstance(descriptors, cv2.UMat):
+        descriptors = descriptors.get()
+    return {"keypoints": keypoints, "descriptors": np.asarray(descriptors),
+            "img_size": np.array(feature.img_size, dtype=np.int64)}
+
+
+def arrays_to_features(arrays: dict, img_idx: int = 0):
+    """
+    Build cv2.detail.ImageFeatures from arrays
+    """
+    # ImageFeatures를 직접 생성하면 descriptors를 설정할 수 없으므로, 작은 이미지로 만든 객체의 값을 바꿔서 사용함
+    feature = cv2.detail.computeImageFeatures2(cv2.ORB.create(), np.zeros((10, 10), np.uint8))
+    feature.keypoints = tuple(cv2.KeyPoint(x=float(x), y=float(y), size=float(size), angle=float(angle),
+                                           response=float(response), octave=int(octave), class_id=int(class_id))
+                              for x, y, size, angle, response, octave, class_id in arrays["keypoints"])
+    feature.descriptors = cv2.UMat(np.ascontiguousarray(arrays["descriptors"]))
+    feature.img_size = tuple(int(v) for v in arrays["img_size"])
+    feature.img_idx = img_idx
+    return feature
+
+
+def rotate_arrays(arrays: dict) -> dict:
+    """
+    Rotate keypoints 180 degree in the image of img_size
+    """
+    width, height = arrays["img_size"]
+    keypoints = arrays["keypoints"].copy()
+    keypoints[:, 0] = width - 1 - keypoints[:, 0]
+    keypoints[:, 1] = height - 1 - keypoints[:, 1]
+    keypoints[:, 3] = np.where(keypoints[:, 3] >= 0, (keypoints[:, 3] + 180) % 360, keypoints[:, 3])
+    return {"keypoints": keypoints, "descriptors": arrays["descriptors"], "img_size": arrays["img_size"]}
+
+
+def load_cached(cache_path: str) -> dict | None:
+    try:
+        with np.load(cache_path) as data:
+            return {"keypoints": data["keypoints"], "descriptors": data["descriptors"], "img_size": data["img_size"]}
+    except (FileNotFoundError, ValueError, KeyError, OSError):
+        return None
+
+
+def save_cached(cache_path: str, arrays: dict):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, cache_path)
+
+
+def compute_arrays(image: np.ndarray, profile: dict, finder=None) -> dict:
+    """
+    Detect features of image at registration resolution of the profile
+    """
+    work_scale = get_scale(profile["registration_resol"], image.shape[0] * image.shape[1])
+    if work_scale < 1.0:
+        image = cv2.resize(image, dsize=None, fx=work_scale, fy=work_scale, interpolation=cv2.INTER_LINEAR_EXACT)
+    feature = cv2.detail.computeImageFeatures2(finder or create_finder(profile), image)
+    return features_to_arrays(feature)
+
+
+def get_features(images: list, image_paths: list[str], rotated: list[bool], profile: dict,
+                 content_hashes: list[str] = None) -> tuple[list, int]:
+    """
+    Get features of decoded images from the cache, compute and save missing ones
+    :param images: decoded (and rotated) images
+    :param image_paths: original image paths
+    :param rotated: whether each image is rotated 180 degree
+    :param profile: stitching profile
+    :param content_hashes: sha256 of each image from the metadata index, None (or None items) to compute
+    :return: list of cv2.detail.ImageFeatures, number of cache hits
+    """
+    content_hashes = content_hashes or [None] * len(image_paths)
+    finder = create_finder(profile)
+    features = []
+    n_hits = 0
+    for idx, (image, image_path, is_rotated) in enumerate(zip(images, image_paths, rotated)):
+        cache_path = get_cache_path(image_path, profile, content_hashes[idx])
+        arrays = load_cached(cache_path)
+        if arrays is not None:
+            n_hits += 1
+            if is_rotated:
+                arrays = rotate_arrays(arrays)
+        else:
+            arrays = compute_arrays(image, profile, finder)
+            # 캐시는 회전하지 않은 이미지 기준으로 저장함
+            save_cached(cache_path, rotate_arrays(arrays) if is_rotated else arrays)
+        features.append(arrays_to_features(arrays, idx))
+    return features, n_hits
+
+
+def get_data_path(image_path: str) -> str:
+    return os.path.dirname(os.path.dirname(os.path.abspath(image_path)))
+
+
+def get_feature_profiles(data_path: str) -> list[str]:
+    """
+    Profiles whose features are precomputed for the dataset
+    :param data_path: path of the dataset
+    :return: FEATURE_CACHE_PROFILES and profiles requested for the dataset
+    """
+    try:
+        with open(os.path.join(data_path, FEATURE_DIR_NAME, FEATURE_PROFILES_FILE_NAME), "r") as f:
+            requested = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        requested = []
+    return list(dict.fromkeys(name for name in FEATURE_CACHE_PROFILES + requested if name in PROFILES))
+
+
+def add_feature_profiles(data_path: str, profiles: list[str]):
+    """
+    Record profiles requested for the dataset, their features are precomputed for images uploaded later
+    :param data_path: path of the dataset
+    :param profiles: profile names
+    """
+    for name in profiles:
+        if name not in PROFILES:
+            raise ValueError(f"Invalid profile : {name}, available profiles : {list(PROFILES.keys())}")
+    with _executor_lock:
+        current = get_feature_profiles(data_path)
+        if all(name in current for name in profiles):
+            return
+        feature_dir = os.path.join(data_path, FEATURE_DIR_NAME)
+        os.makedirs(feature_dir, exist_ok=True)
+        profiles_path = os.path.join(feature_dir, FEATURE_PROFILES_FILE_NAME)
+        with open(f"{profiles_path}.tmp", "w") as f:
+            json.dump([name for name in dict.fromkeys(current + profiles) if name not in FEATURE_CACHE_PROFILES], f)
+        os.replace(f"{profiles_path}.tmp", profiles_path)
+
+
+def cache_image_features(image_path: str, profiles: list[str] = None):
+    """
+    Compute and save features of the image for each profile if not cached
+    :param image_path: image path
+    :param profiles: profile names, profiles of the dataset (get_feature_profiles) if None
+    """
+    image = None
+    # 이미지 내용 hash는 프로파일마다 다시 계산하지 않음
+    content_hash = get_content_hash(image_path)
+    for name in profiles or get_feature_profiles(get_data_path(image_path)):
+        profile = get_profile(name)
+        cache_path = get_cache_path(image_path, profile, content_hash)
+        if os.path.exists(cache_path):
+            continue
+        if image is None:
+            image = cv2.imread(image_path)
+            if image is None:
+                return
+        save_cached(cache_path, compute_arrays(image, profile))
+
+
+def _cache_image_features_safe(image_path: str):
+    try:
+        cache_image_features(image_path)
+    except Exception as e:
+        print(f"Feature cache failed: {image_path} | {e}")
+
+
+def schedule_features(image_paths: list[str]):
+    """
+    Compute features of images in background threads
+    :param image_paths: image paths
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=FEATURE_WORKERS, thread_name_prefix="feature-cache")
+    for image_path in image_paths:
+        _executor.submit(_cache_image_features_safe, str(image_path))
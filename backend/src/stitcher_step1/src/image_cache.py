@@ -0,0 +1,83 @@
+import hashlib
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from src.file_cache import CacheDirectory
+
+IMAGE_CACHE_DIR = "./image_cache"
+# 캐시 전체 크기 제한, 넘으면 가장 오래 사용하지 않은 이미지부터 삭제함
+IMAGE_CACHE_BUDGET = 8 * 1024 * 1024 * 1024
+IMAGE_CACHE_ENABLED = False
+
+"""
+    디코딩한 이미지를 raw 배열(.npy)로 저장하고, 다시 사용할 때는 디코딩 대신 memory map으로 엽니다.
+    키는 이미지 경로, 크기, 수정 시각, 회전 여부, 축소 해상도이므로 이미지가 바뀌면 새로 캐시합니다.
+    캐시는 모든 데이터셋이 공유하며, /api/reset 이후 다시 정합할 때도 사용됩니다.
+    max_megapixels를 주면 그 해상도로 줄여서 저장합니다. (원본 해상도로 합성하지 않는 프로파일에서 사용)
+    파일의 수정 시각을 마지막 사용 시각으로 사용하여, 전체 크기가 budget을 넘으면 오래된 것부터 삭제합니다.
+"""
+
+
+class ImageCache:
+    def __init__(self, cache_dir: str = IMAGE_CACHE_DIR, budget: int = IMAGE_CACHE_BUDGET,
+                 max_megapixels: float = None):
+        """
+        :param cache_dir: directory of cached arrays
+        :param budget: maximum total bytes of cached arrays
+        :param max_megapixels: downscale images larger than this resolution, None to keep original resolution
+        """
+        self.cache_dir = cache_dir
+        self.budget = budget
+        self.max_megapixels = max_megapixels
+        self.directory = CacheDirectory(cache_dir, budget, ".npy")
+
+    def _get_cache_path(self, image_path: str, rotated: bool) -> str:
+        stat = os.stat(image_path)
+        key = f"{os.path.abspath(image_path)}|{stat.st_size}|{stat.st_mtime_ns}|{rotated}|{self.max_megapixels}"
+        return os.path.join(self.cache_dir, f"{hashlib.sha1(key.encode()).hexdigest()}.npy")
+
+    def get(self, image_path: str, rotated: bool = False) -> np.ndarray | None:
+        """
+        Map cached image
+        :return: read-only memory-mapped image, None if not cached
+        """
+        cache_path = self._get_cache_path(image_path, rotated)
+        try:
+            image = np.load(cache_path, mmap_mode="r")
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        # 마지막 사용 시각 갱신
+        self.directory.touch(cache_path)
+        return image
+
+    def put(self, image_path: str, rotated: bool, image: np.ndarray) -> np.ndarray:
+        """
+        Save decoded image, downscale it if max_megapixels is set
+        :return: image to use, downscaled if needed
+        """
+        if self.max_megapixels is not None:
+            scale = (self.max_megapixels * 1e6 / (image.shape[0] * image.shape[1])) ** 0.5
+            if scale < 1.0:
+                image = cv2.resize(image, dsize=None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        if image.nbytes > self.budget:
+            return image
+
+        cache_path = self._get_cache_path(image_path, rotated)
+        tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, image)
+        os.replace(tmp_path, cache_path)
+        self.directory.add_bytes(os.path.getsize(cache_path))
+        return image
+
+
+def get_cache_megapixels(profile: dict) -> float | None:
+    """
+    Resolution of cached images for the profile, None if the profile composes at original resolution
+    """
+    if profile["compositing_resol"] < 0:
+        return None
+    return max(profile["compositing_resol"], profile["registration_resol"])
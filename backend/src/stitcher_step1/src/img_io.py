@@ -1,5 +1,16 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+import cv2
+
+INGEST_WORKERS = os.cpu_count() or 1
+MAX_IN_FLIGHT = INGEST_WORKERS * 2
+# 작은 것부터 시도하는 JPEG 축소 디코딩 옵션
+REDUCED_FLAGS = [cv2.IMREAD_REDUCED_COLOR_8, cv2.IMREAD_REDUCED_COLOR_4, cv2.IMREAD_REDUCED_COLOR_2]
+
 
 def make_output_name() -> str:
     return f"{datetime.now().strftime('%Y%m%d%H%M%S')}"
@@ -7,3 +18,163 @@ def make_output_name() -> str:
 
 def get_file_name(path: str) -> str:
     return path.split("/")[-1]
+
+
+def link_image(source: str, destination: str):
+    """
+    Link source to destination without copying, hard link if possible, otherwise symbolic link
+    :param source: existing file
+    :param destination: path of the link, replaced if it exists
+    """
+    if os.path.lexists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        # 다른 파일 시스템이거나 hard link를 지원하지 않는 경우
+        os.symlink(os.path.abspath(source), destination)
+
+
+def read_image(image_path: str, rotated: bool = False, cache=None):
+    """
+    Decode image and rotate 180 degree if needed
+    :param image_path: image path
+    :param rotated: rotate image 180 degree
+    :param cache: ImageCache of decoded images, None to always decode
+    :return: decoded image, memory-mapped read-only image if it is cached
+    """
+    if cache is not None:
+        image = cache.get(image_path, rotated)
+        if image is not None:
+            return image
+    image = cv2.imread(image_path)
+    if rotated:
+        image = cv2.rotate(image, cv2.ROTATE_180)
+    if cache is not None and image is not None:
+        image = cache.put(image_path, rotated, image)
+    return image
+
+
+def read_reduced(image_path: str, rotated: bool = False, min_width: float = 0, min_long_side: float = 0):
+    """
+    Decode image at the smallest JPEG reduction (1/8, 1/4, 1/2) which is still larger than the given sizes
+    :param image_path: image path
+    :param rotated: rotate image 180 degree
+    :param min_width: minimum width of the decoded image
+    :param min_long_side: minimum width or height of the decoded image
+    :return: decoded image, None if the image cannot be decoded
+    """
+    image = None
+    for flag in REDUCED_FLAGS:
+        image = cv2.imread(image_path, flag)
+        if image is None or (image.shape[1] >= min_width and max(image.shape[:2]) >= min_long_side):
+            break
+        image = None
+    if image is None:
+        image = cv2.imread(image_path)
+    if image is not None and rotated:
+        image = cv2.rotate(image, cv2.ROTATE_180)
+    return image
+
+
+def iter_read_images(image_paths: list[str], rotated: list[bool], workers: int = INGEST_WORKERS,
+                     max_in_flight: int = MAX_IN_FLIGHT, cache=None):
+    """
+    Decode images with a worker pool and yield them in the order of image_paths.
+    At most max_in_flight images are decoded ahead of the consumer.
+    :param image_paths: image paths
+    :param rotated: rotate flag of each image
+    :param workers: number of decode workers
+    :param max_in_flight: maximum number of decoded images waiting for the consumer
+    :param cache: ImageCache of decoded images, None to always decode
+    :return: generator of decoded images
+    """
+    max_in_flight = max(1, max_in_flight)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = deque()
+        next_index = 0
+        while next_index < len(image_paths) or pending:
+            while next_index < len(image_paths) and len(pending) < max_in_flight:
+                pending.append(executor.submit(read_image, image_paths[next_index], rotated[next_index], cache))
+                next_index += 1
+            yield pending.popleft().result()
+
+
+class MemoryTracker:
+    """
+    Track bytes of decoded images currently held and their high-water mark
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current_bytes = 0
+        self.peak_bytes = 0
+        self.current_images = 0
+        self.peak_images = 0
+
+    def add(self, n_bytes: int, n_images: int = 1):
+        with self.lock:
+            self.current_bytes += n_bytes
+            self.current_images += n_images
+            self.peak_bytes = max(self.peak_bytes, self.current_bytes)
+            self.peak_images = max(self.peak_images, self.current_images)
+
+    def remove(self, n_bytes: int, n_images: int = 1):
+        with self.lock:
+            self.current_bytes -= n_bytes
+            self.current_images -= n_images
+
+    def to_dict(self) -> dict:
+        return {"peakImageBytes": self.peak_bytes, "peakImages": self.peak_images}
+
+
+class ImageHandle:
+    """
+    Image which is decoded only when it is needed and can be released after use
+    """
+
+    def __init__(self, path: str, rotated: bool = False, tracker: MemoryTracker = None):
+        self.path = path
+        self.rotated = rotated
+        self.tracker = tracker
+        self.image = None
+
+    def set_image(self, image):
+        if self.image is not None:
+            self.release()
+        self.image = image
+        if self.tracker is not None and image is not None:
+            self.tracker.add(image.nbytes)
+
+    def load(self):
+        if self.image is None:
+            self.set_image(read_image(self.path, self.rotated))
+        return self.image
+
+    def release(self):
+        if self.tracker is not None and self.image is not None:
+            self.tracker.remove(self.image.nbytes)
+        self.image = None
+
+
+def load_images(handles: list[ImageHandle], workers: int = INGEST_WORKERS, max_in_flight: int = MAX_IN_FLIGHT,
+                cache=None):
+    """
+    Decode images of handles which are not loaded yet, with a worker pool
+    :param handles: image handles
+    :param workers: number of decode workers
+    :param max_in_flight: maximum number of decoded images waiting in the pipeline
+    :param cache: ImageCache of decoded images, None to always decode
+    :return: decoded images in the order of handles
+    """
+    targets = [handle for handle in handles if handle.image is None]
+    decoded = iter_read_images([handle.path for handle in targets], [handle.rotated for handle in targets],
+                               workers=workers, max_in_flight=max_in_flight, cache=cache)
+    for handle, image in zip(targets, decoded):
+        handle.set_image(image)
+    return [handle.image for handle in handles]
+
+
+def release_images(handles: list[ImageHandle]):
+    for handle in handles:
+        handle.release()
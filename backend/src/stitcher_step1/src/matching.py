@@ -0,0 +1,55 @@
+import numpy as np
+
+from src.stitcher_step1.src.cluster import to_local_xy
+
+MATCHING_MODES = {
+    "all": "모든 이미지 쌍의 특징점을 매칭함 (기존 방식)",
+    "knn": "GPS 좌표상 가장 가까운 neighbors개의 이미지와만 매칭함",
+    "radius": "GPS 좌표상 radius(미터) 이내의 이미지와만 매칭함",
+}
+DEFAULT_MATCHING_MODE = "all"
+DEFAULT_NEIGHBORS = 8
+DEFAULT_MATCHING_RADIUS = 50.0
+
+"""
+    특징점 매칭할 이미지 쌍을 GPS 좌표로 제한하는 matching mask를 만듭니다.
+    모든 쌍을 매칭하면 비용이 클러스터 크기의 제곱으로 늘어나지만, 이웃한 이미지와만 매칭하면 선형으로 늘어납니다.
+    mask는 대칭이며, GPS 오차로 그래프가 끊어지지 않도록 촬영 순서상 바로 다음 이미지와는 항상 매칭합니다.
+"""
+
+
+def get_matching_mask(coordinates: list[tuple], mode: str = DEFAULT_MATCHING_MODE,
+                      neighbors: int = DEFAULT_NEIGHBORS, radius: float = DEFAULT_MATCHING_RADIUS) -> np.ndarray | None:
+    """
+    Get matching mask of images in a cluster
+    :param coordinates: list of (latitude, longitude) of the images, sorted by time
+    :param mode: one of MATCHING_MODES
+    :param neighbors: number of nearest images matched with each image, used by knn
+    :param radius: distance in meters, used by radius
+    :return: N x N uint8 matrix, non-zero for pairs to be matched, None if every pair is matched
+    """
+    if mode not in MATCHING_MODES:
+        raise ValueError(f"Invalid matching mode : {mode}, available : {list(MATCHING_MODES.keys())}")
+    n_images = len(coordinates)
+    if mode == "all" or n_images < 2:
+        return None
+
+    xy = to_local_xy(coordinates)
+    distances = np.linalg.norm(xy[:, np.newaxis] - xy[np.newaxis], axis=2)
+    if mode == "knn":
+        if neighbors >= n_images - 1:
+            return None
+        mask = np.zeros((n_images, n_images), dtype=bool)
+        # 자기 자신을 제외한 가장 가까운 neighbors개, GPS 좌표가 같은 이미지가 있으면 거리 0이 여러 개이므로 대각선을 제외함
+        np.fill_diagonal(distances, np.inf)
+        nearest = np.argsort(distances, axis=1, kind="stable")[:, :neighbors]
+        mask[np.arange(n_images)[:, np.newaxis], nearest] = True
+    else:
+        mask = distances <= radius
+
+    mask |= mask.T
+    consecutive = np.arange(n_images - 1)
+    mask[consecutive, consecutive + 1] = True
+    mask[consecutive + 1, consecutive] = True
+    np.fill_diagonal(mask, False)
+    return mask.astype(np.uint8)
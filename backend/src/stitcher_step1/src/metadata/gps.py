@@ -1,11 +1,12 @@
 import math
 import os
-import cv2
 import matplotlib.pyplot as plt
 from cv2 import Mat
 from numpy import ndarray
 from tqdm import tqdm
 
+from src.stitcher_step1.src.img_io import INGEST_WORKERS, MAX_IN_FLIGHT, ImageHandle, MemoryTracker, \
+    iter_read_images
 from src.stitcher_step1.src.metadata.exif import get_geotagging
 from src.stitcher_step1.src.metadata.time_read import get_exif_data, sort_names_by_date_time
 
@@ -315,27 +316,42 @@ def plotClusteredPoints(points: list[tuple], clustered_indices: list[list[int]],
         plt.show()
 
 
-def align_images(dir_path: str = None, image_paths: list[str] = None) -> tuple[
-    list[Mat | ndarray], list[str] | None, list[tuple]]:
+def align_images(dir_path: str = None, image_paths: list[str] = None, workers: int = INGEST_WORKERS,
+                 max_in_flight: int = MAX_IN_FLIGHT, lazy: bool = False, tracker: MemoryTracker = None) -> tuple[
+    list[Mat | ndarray | ImageHandle], list[str] | None, list[tuple]]:
     """
     Align images from directory or image paths. rotate images if needed, discard images if needed, and return and save aligned images
     :param dir_path:
     :param image_paths:
+    :param workers: number of workers for metadata extraction and decoding
+    :param max_in_flight: maximum number of decoded images waiting in the pipeline
+    :param lazy: return ImageHandle which is decoded later instead of decoded image
+    :param tracker: memory tracker of the handles, used only if lazy is True
     :return: aligned images, aligned image paths
     """
+    from src.stitcher_step1.src.metadata.index import get_metadata, update_index
+
+    # EXIF는 메타데이터 인덱스에서 읽고, 새로 추가되거나 변경된 이미지만 파싱함
     if dir_path is not None:
-        image_names = os.listdir(dir_path)
+        # 폴더 전체를 갱신하면서 삭제된 이미지의 항목도 정리
+        entries = update_index(dir_path, workers=workers)
+        image_names = [image_name for image_name in os.listdir(dir_path) if image_name in entries]
         image_paths = [os.path.join(dir_path, image_name) for image_name in image_names]
+        metadata = {image_path: entries[os.path.basename(image_path)] for image_path in image_paths}
     elif image_paths is None:
         raise Exception("dir_path and image_paths are None")
+    else:
+        metadata = dict(zip(image_paths, get_metadata(image_paths, workers)))
 
-    image_paths = sort_names_by_date_time(image_paths)
+    image_paths = sort_names_by_date_time(image_paths, [metadata[path]["dateTime"] for path in image_paths])
 
     coordinates = []
     images = []
 
     for image_path in tqdm(image_paths, desc="reading image coordinates"):
-        coordinates.append(get_gps_from_image(img_path=image_path)[:2])
+        if metadata[image_path]["lat"] is None:
+            raise ValueError("No GPS data found")
+        coordinates.append((metadata[image_path]["lat"], metadata[image_path]["lon"]))
 
     angles = get_angles(coordinates)
     rotate = determine_rotation_angles(angles)
@@ -343,17 +359,20 @@ def align_images(dir_path: str = None, image_paths: list[str] = None) -> tuple[
     discard_index = []
 
     # 계산된 회전값에 따라 이미지를 회전하거나 버림
-    for i in tqdm(range(len(image_paths)), desc="refine images"):
-        if rotate[i] == NORMAL:
-            image = cv2.imread(image_paths[i])
-            images.append(image)
-        elif rotate[i] == ROTATED:
-            image = cv2.imread(image_paths[i])
-            image = cv2.rotate(image, cv2.ROTATE_180)
-            images.append(image)
-        else:
+    for i in range(len(image_paths)):
+        if rotate[i] == DISCARD:
             discard_index.append(i)
 
+    kept_index = [i for i in range(len(image_paths)) if rotate[i] != DISCARD]
+    if lazy:
+        images = [ImageHandle(image_paths[i], rotate[i] == ROTATED, tracker) for i in kept_index]
+    else:
+        decoded = iter_read_images([image_paths[i] for i in kept_index],
+                                   [rotate[i] == ROTATED for i in kept_index],
+                                   workers=workers, max_in_flight=max_in_flight)
+        for image in tqdm(decoded, total=len(kept_index), desc="refine images"):
+            images.append(image)
+
     # 불필요한 이미지 제거
     for i in list(reversed(discard_index)):
         del image_paths[i]
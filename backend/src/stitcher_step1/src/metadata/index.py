@@ -0,0 +1,215 @@
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import exifread
+from PIL import Image
+
+from src.file_cache import get_content_hash
+from src.stitcher_step1.src.metadata.exif import get_geotagging
+from src.stitcher_step1.src.metadata.gps import get_coordinates, get_altitude
+
+INDEX_FILE_NAME = "metadata_index.json"
+INDEX_VERSION = 2
+
+_index_locks = {}
+_index_locks_guard = threading.Lock()
+
+"""
+    데이터셋마다 이미지의 EXIF 메타데이터를 캐싱하는 인덱스 파일을 관리합니다.
+    인덱스는 images 폴더와 같은 위치({데이터 폴더}/metadata_index.json)에 저장되며,
+    각 이미지는 파일 이름을 키로 가지고, 파일 크기와 수정 시간이 같으면 다시 파싱하지 않습니다.
+    sha256은 특징점 캐시의 키로 사용되므로, 정합할 때마다 이미지 전체를 다시 읽지 않도록 함께 저장합니다.
+    {
+        "version": 2,
+        "images": {
+            "IMG_0001.JPG": {
+                "size": 1234, "mtime": 1700000000.0, "dateTime": "2024:05:01 10:00:00",
+                "lat": 37.5, "lon": 127.0, "alt": 100.0,
+                "width": 4000, "height": 3000, "orientation": 1, "sha256": "..."
+            }
+        }
+    }
+"""
+
+
+def get_index_path(image_dir: str) -> str:
+    """
+    Get path of the metadata index of the dataset which owns image_dir
+    :param image_dir: images directory of the dataset
+    :return: path of the index file
+    """
+    return os.path.join(os.path.dirname(os.path.normpath(image_dir)), INDEX_FILE_NAME)
+
+
+def _get_lock(index_path: str) -> threading.Lock:
+    with _index_locks_guard:
+        if index_path not in _index_locks:
+            _index_locks[index_path] = threading.Lock()
+        return _index_locks[index_path]
+
+
+def _get_tag_value(tags, *keys):
+    for key in keys:
+        if key in tags:
+            value = tags[key].values
+            return value[0] if isinstance(value, list) and value else value
+    return None
+
+
+def read_image_metadata(img_path: str) -> dict:
+    """
+    Parse EXIF of the image once and return every value used by Step 1
+    :param img_path: image path
+    :return: metadata entry of the index (without size and mtime)
+    """
+    with open(img_path, 'rb') as f:
+        tags = exifread.process_file(f, details=False)
+
+    date_time = str(tags['Image DateTime']) if 'Image DateTime' in tags else None
+
+    lat, lon, alt = None, None, None
+    try:
+        geotags = get_geotagging(tags)
+        lat, lon = get_coordinates(geotags)
+        alt = get_altitude(geotags)
+    except (KeyError, ValueError):
+        pass
+
+    width = _get_tag_value(tags, 'EXIF ExifImageWidth', 'Image ImageWidth')
+    height = _get_tag_value(tags, 'EXIF ExifImageLength', 'Image ImageLength')
+    if width is None or height is None:
+        # JPEG 헤더만 읽어서 크기를 얻음
+        try:
+            with Image.open(img_path) as image:
+                width, height = image.size
+        except OSError:
+            width, height = None, None
+    orientation = _get_tag_value(tags, 'Image Orientation')
+
+    return {
+        "dateTime": date_time,
+        "lat": lat,
+        "lon": lon,
+        "alt": alt,
+        "width": int(width) if width is not None else None,
+        "height": int(height) if height is not None else None,
+        "orientation": int(orientation) if orientation is not None else 1,
+        "sha256": get_content_hash(img_path),
+    }
+
+
+def load_index(image_dir: str) -> dict:
+    """
+    Load index entries of the dataset. return empty dict if the index does not exist or is broken
+    :param image_dir: images directory of the dataset
+    :return: dict of {image name: entry}
+    """
+    index_path = get_index_path(image_dir)
+    try:
+        with open(index_path, "r") as f:
+            index = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    if index.get("version") != INDEX_VERSION:
+        return {}
+    return index.get("images", {})
+
+
+def save_index(image_dir: str, entries: dict) -> None:
+    """
+    Save index entries atomically, write to temporary file and replace
+    :param image_dir: images directory of the dataset
+    :param entries: dict of {image name: entry}
+    """
+    index_path = get_index_path(image_dir)
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"version": INDEX_VERSION, "images": entries}, f)
+    os.replace(tmp_path, index_path)
+
+
+def _is_fresh(entry: dict, stat: os.stat_result) -> bool:
+    return entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime
+
+
+def _read_image_metadata_list(img_paths: list[str], workers: int) -> list[dict]:
+    if workers <= 1 or len(img_paths) <= 1:
+        return [read_image_metadata(img_path) for img_path in img_paths]
+    # EXIF 파싱은 순수 파이썬이라 GIL에 묶이므로 프로세스 풀을 사용함
+    with ProcessPoolExecutor(max_workers=min(workers, len(img_paths))) as executor:
+        return list(executor.map(read_image_metadata, img_paths, chunksize=max(1, len(img_paths) // (workers * 4))))
+
+
+def update_index(image_dir: str, image_names: list[str] = None, workers: int = 1) -> dict:
+    """
+    Update index incrementally. Only new or modified images are parsed.
+    If image_names is None, every image in image_dir is checked and entries of removed images are thrown away
+    :param image_dir: images directory of the dataset
+    :param image_names: names of images to update, None for whole directory
+    :param workers: number of processes used to parse new images
+    :return: dict of {image name: entry}
+    """
+    index_path = get_index_path(image_dir)
+    with _get_lock(index_path):
+        entries = load_index(image_dir)
+        changed = False
+
+        if image_names is None:
+            image_names = os.listdir(image_dir)
+            for name in list(entries.keys()):
+                if name not in image_names:
+                    del entries[name]
+                    changed = True
+
+        stale = []
+        for name in image_names:
+            img_path = os.path.join(image_dir, name)
+            try:
+                stat = os.stat(img_path)
+            except FileNotFoundError:
+                if entries.pop(name, None) is not None:
+                    changed = True
+                continue
+            if name in entries and _is_fresh(entries[name], stat):
+                continue
+            stale.append((name, stat))
+
+        parsed = _read_image_metadata_list([os.path.join(image_dir, name) for name, _ in stale], workers)
+        for (name, stat), entry in zip(stale, parsed):
+            entry["size"] = stat.st_size
+            entry["mtime"] = stat.st_mtime
+            entries[name] = entry
+            changed = True
+
+        if changed:
+            save_index(image_dir, entries)
+        return entries
+
+
+def get_metadata(image_paths: list[str], workers: int = 1) -> list[dict]:
+    """
+    Get metadata of images through the index of their directories
+    :param image_paths: image paths
+    :param workers: number of processes used to parse new images
+    :return: metadata entries in the same order with image_paths
+    """
+    names_by_dir = {}
+    for image_path in image_paths:
+        image_dir, name = os.path.split(image_path)
+        names_by_dir.setdefault(image_dir, []).append(name)
+
+    entries_by_dir = {image_dir: update_index(image_dir, names, workers) for image_dir, names in names_by_dir.items()}
+    return [entries_by_dir[os.path.dirname(image_path)][os.path.basename(image_path)] for image_path in image_paths]
+
+
+def count_indexed_images(image_dir: str) -> int | None:
+    """
+    Get number of images recorded in the index, None if the index does not exist
+    :param image_dir: images directory of the dataset
+    :return: number of indexed images
+    """
+    if not os.path.exists(get_index_path(image_dir)):
+        return None
+    return len(load_index(image_dir))
@@ -10,8 +10,19 @@ def time_to_seconds(time: str) -> int:
     return int(time.split(' ')[1].replace(':', ''))
 
 
-def sort_names_by_date_time(names: list[str]) -> list[str]:
-    exif_list = list(map(lambda x: get_date_time(get_exif_data(img_path=x)), names))
+def sort_names_by_date_time(names: list[str], date_times: list[str] = None) -> list[str]:
+    """
+    sort image paths by date time. if date_times is None, read them from exif of each image
+    :param names: image paths
+    :param date_times: date time of each image, e.g. from metadata index
+    :return: sorted image paths
+    """
+    if date_times is None:
+        exif_list = list(map(lambda x: get_date_time(get_exif_data(img_path=x)), names))
+    else:
+        if None in date_times:
+            raise KeyError('Image DateTime')
+        exif_list = date_times
     combined = list(zip(names, exif_list))
     combined.sort(key=lambda x: time_to_seconds(x[1]))
     print(f"sorted names: {list(map(lambda x: x[0], combined))}")
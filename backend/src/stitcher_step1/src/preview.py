@@ -0,0 +1,178 @@
+import json
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from src.stitcher_step1.src.cluster import EARTH_RADIUS, to_local_xy
+from src.stitcher_step1.src.img_io import INGEST_WORKERS, read_reduced
+from src.stitcher_step1.src.metadata.gps import align_images, get_angles, get_standard_angle
+from src.stitcher_step1.src.metadata.index import load_index
+
+PREVIEW_DIR_NAME = "preview"
+PREVIEW_FILE_NAME = "preview.jpg"
+PREVIEW_INFO_FILE_NAME = "preview.json"
+# 미리보기 이미지의 긴 변 최대 픽셀 수
+PREVIEW_MAX_SIZE = 4096
+# 카메라의 가로 화각(도), 8.8mm 렌즈와 1인치 센서 기준
+PREVIEW_FOV = 73.7
+# 이미지 위쪽 방향과 비행 방향 사이의 각도(도, 시계 방향)
+PREVIEW_HEADING_OFFSET = 0.0
+PREVIEW_JPEG_QUALITY = 85
+# 지면 고도를 지정하지 않았을 때, 중앙값보다 이만큼(미터) 낮은 촬영 고도가 있으면 최저 고도를 지면으로 봄 (이착륙 중 촬영)
+PREVIEW_MIN_HEIGHT = 10.0
+# 최저 고도로 지면을 알 수 없을 때 가정하는 비행 높이(미터)
+PREVIEW_FLIGHT_HEIGHT = 100.0
+
+"""
+    특징점 매칭 없이 GPS 좌표와 고도만으로 이미지를 배치한 미리보기 모자이크를 만듭니다.
+    align_images의 좌표와 회전(180도) 결정을 그대로 사용하므로, 회전된 이미지는 모두 같은 방향을 향합니다.
+    각 이미지의 지상 촬영 범위는 (고도 - ground_altitude)와 가로 화각(fov)으로 계산하고,
+    EXIF의 GPS 고도는 해발 고도이므로 ground_altitude를 지정하지 않으면 촬영 고도로부터 추정합니다. (estimate_ground_altitude)
+    이미지 위쪽은 기준 비행 방향에서 heading_offset만큼 돌린 방향으로 놓습니다.
+    JPEG는 필요한 크기에 맞춰 1/2, 1/4, 1/8로 줄여서 디코딩하므로 수백 장도 수 초 안에 만들어집니다.
+    결과는 {데이터 폴더}/preview/preview.jpg와 preview.json에 저장됩니다.
+    {
+        "width": 4096, "height": 2048, "metersPerPixel": 0.12, "nImages": 300, "createdAt": ...,
+        "groundAltitude": 35.2, "groundAltitudeEstimated": true,
+        "bounds": {"south": 37.49, "west": 126.99, "north": 37.51, "east": 127.01}
+    }
+"""
+
+def get_preview_dir(data_path: str) -> str:
+    return os.path.join(data_path, PREVIEW_DIR_NAME)
+
+
+def paste_image(canvas: np.ndarray, image: np.ndarray, center: tuple[float, float], scale: float, bearing: float):
+    """
+    Paste image on canvas, rotated so that its top points to bearing
+    :param canvas: preview canvas
+    :param image: decoded image
+    :param center: position of the image center on the canvas (x, y)
+    :param scale: canvas pixels per image pixel
+    :param bearing: direction of the image top in degrees, clockwise from north (canvas top)
+    """
+    height, width = image.shape[:2]
+    cos, sin = math.cos(math.radians(bearing)) * scale, math.sin(math.radians(bearing)) * scale
+    matrix = np.array([[cos, -sin, 0.0], [sin, cos, 0.0]])
+    matrix[:, 2] = np.array(center) - matrix[:, :2] @ np.array([(width - 1) / 2, (height - 1) / 2])
+
+    corners = np.array([[0, 0, 1], [width, 0, 1], [0, height, 1], [width, height, 1]], dtype=np.float64)
+    projected = corners @ matrix.T
+    left, top = np.floor(projected.min(axis=0)).astype(int)
+    right, bottom = np.ceil(projected.max(axis=0)).astype(int)
+    left, top = max(left, 0), max(top, 0)
+    right, bottom = min(right, canvas.shape[1]), min(bottom, canvas.shape[0])
+    if right <= left or bottom <= top:
+        return
+
+    # 캔버스 전체가 아닌 이미지가 놓이는 영역만 변환함
+    matrix[:, 2] -= (left, top)
+    size = (right - left, bottom - top)
+    warped = cv2.warpAffine(image, matrix, size, flags=cv2.INTER_LINEAR)
+    mask = cv2.warpAffine(np.full((height, width), 255, np.uint8), matrix, size, flags=cv2.INTER_NEAREST)
+    roi = canvas[top:bottom, left:right]
+    roi[mask > 0] = warped[mask > 0]
+
+
+def estimate_ground_altitude(altitudes: list[float]) -> float:
+    """
+    Estimate altitude of the ground from GPS altitudes above sea level
+    :param altitudes: GPS altitudes of the images
+    :return: the lowest altitude if images are taken near the ground, otherwise median - PREVIEW_FLIGHT_HEIGHT
+    """
+    median = float(np.median(altitudes))
+    lowest = float(min(altitudes))
+    if median - lowest >= PREVIEW_MIN_HEIGHT:
+        return lowest
+    return median - PREVIEW_FLIGHT_HEIGHT
+
+
+def make_preview(data_path: str, fov: float = PREVIEW_FOV, heading_offset: float = PREVIEW_HEADING_OFFSET,
+                 ground_altitude: float = None, max_size: int = PREVIEW_MAX_SIZE,
+                 workers: int = INGEST_WORKERS) -> dict:
+    """
+    Place downscaled images on a canvas by their GPS footprint without feature matching
+    :param data_path: path of the dataset
+    :param fov: horizontal field of view of the camera in degrees
+    :param heading_offset: angle from the flight direction to the image top in degrees, clockwise
+    :param ground_altitude: altitude of the ground above sea level in meters, subtracted from the GPS altitude.
+                            estimated from the GPS altitudes if None
+    :param max_size: maximum width or height of the preview in pixels
+    :param workers: number of decode workers
+    :return: preview info, also saved in preview.json
+    """
+    if max_size <= 0:
+        raise ValueError(f"Invalid max_size : {max_size}")
+    if not 0 < fov < 180:
+        raise ValueError(f"Invalid fov : {fov}")
+    image_dir = os.path.join(data_path, "images")
+    handles, image_paths, coordinates = align_images(dir_path=image_dir, workers=workers, lazy=True)
+    if not handles:
+        raise ValueError("No images to preview")
+    entries = load_index(image_dir)
+    metadata = [entries[os.path.basename(image_path)] for image_path in image_paths]
+
+    # 회전된 이미지는 기준 방향으로 맞춰져 있으므로 모든 이미지가 같은 방향을 향함
+    # get_angles의 각도는 방위각 + 180도
+    standard = get_standard_angle(get_angles(coordinates)) if len(coordinates) > 1 else 180
+    bearing = (standard + 180 + heading_offset) % 360
+
+    altitudes = [entry["alt"] for entry in metadata if entry["alt"] is not None]
+    estimated = ground_altitude is None
+    if estimated:
+        ground_altitude = estimate_ground_altitude(altitudes) if altitudes else 0.0
+    default_height = max(float(np.median(altitudes)) - ground_altitude, 1.0) if altitudes else 100.0
+    ground_widths = []
+    for entry in metadata:
+        height = entry["alt"] - ground_altitude if entry["alt"] is not None else default_height
+        ground_widths.append(2 * max(height, 1.0) * math.tan(math.radians(fov) / 2))
+
+    xy = to_local_xy(coordinates) if len(coordinates) > 1 else np.zeros((1, 2))
+    # 이미지가 어느 방향으로 놓이든 들어가도록 대각선 길이의 절반만큼 여유를 둠
+    margins = np.array([ground_width / 2 * math.hypot(1, (entry["height"] or 1) / (entry["width"] or 1))
+                        for ground_width, entry in zip(ground_widths, metadata)])
+    low = (xy - margins[:, np.newaxis]).min(axis=0)
+    high = (xy + margins[:, np.newaxis]).max(axis=0)
+    # 원본보다 해상도가 높아지지 않도록 원본 이미지의 지상 해상도를 하한으로 사용함
+    source_resolution = min(ground_width / (entry["width"] or 1)
+                            for ground_width, entry in zip(ground_widths, metadata))
+    meters_per_pixel = max(float((high - low).max()) / max_size, source_resolution)
+    canvas_width, canvas_height = (np.ceil((high - low) / meters_per_pixel).astype(int) + 1).tolist()
+    canvas = np.zeros((canvas_height, canvas_width, 3), np.uint8)
+
+    target_widths = [ground_width / meters_per_pixel for ground_width in ground_widths]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        decoded = executor.map(read_reduced, [handle.path for handle in handles],
+                               [handle.rotated for handle in handles], target_widths)
+        # 촬영 순서대로 덮어씀
+        for image, point, target_width in zip(decoded, xy, target_widths):
+            if image is None:
+                continue
+            center = ((point[0] - low[0]) / meters_per_pixel, (high[1] - point[1]) / meters_per_pixel)
+            paste_image(canvas, image, center, target_width / image.shape[1], bearing)
+
+    preview_dir = get_preview_dir(data_path)
+    os.makedirs(preview_dir, exist_ok=True)
+    tmp_path = os.path.join(preview_dir, f"tmp_{PREVIEW_FILE_NAME}")
+    cv2.imwrite(tmp_path, canvas, [cv2.IMWRITE_JPEG_QUALITY, PREVIEW_JPEG_QUALITY])
+    os.replace(tmp_path, os.path.join(preview_dir, PREVIEW_FILE_NAME))
+
+    # to_local_xy의 역변환으로 캔버스 경계의 위경도를 계산함
+    points = np.asarray(coordinates, dtype=np.float64)
+    lat_center, lon_center = points[:, 0].mean(), points[:, 1].mean()
+    lat_scale = math.degrees(1 / EARTH_RADIUS)
+    lon_scale = lat_scale / math.cos(math.radians(lat_center))
+    info = {
+        "width": canvas_width, "height": canvas_height, "metersPerPixel": meters_per_pixel,
+        "nImages": len(handles), "createdAt": time.time(),
+        "groundAltitude": ground_altitude, "groundAltitudeEstimated": estimated,
+        "bounds": {"south": float(lat_center + low[1] * lat_scale), "west": float(lon_center + low[0] * lon_scale),
+                   "north": float(lat_center + high[1] * lat_scale), "east": float(lon_center + high[0] * lon_scale)},
+    }
+    with open(os.path.join(preview_dir, PREVIEW_INFO_FILE_NAME), "w") as f:
+        json.dump(info, f)
+    return info
@@ -0,0 +1,62 @@
+"""
+    정합 품질/속도 프로파일을 정의합니다.
+    resolution 값의 단위는 megapixel이며, compositing_resol이 -1이면 원본 해상도로 합성합니다.
+    노출 보정은 모드별로 지정합니다. exposure_compensator는 scans 모드(scans == 1),
+    panorama_exposure_compensator는 panorama 모드에 사용합니다.
+    preview: 빠른 확인용, 낮은 해상도로 합성하고 seam 탐색을 생략함
+    balanced: 중간 해상도로 합성
+    full: 원본 해상도로 합성, 모드별로 cv2.Stitcher(SCANS), cv2.Stitcher(PANORAMA)의 기본 노출 보정과 같음
+"""
+
+PROFILES = {
+    "preview": {
+        "registration_resol": 0.3,
+        "seam_estimation_resol": 0.05,
+        "compositing_resol": 0.3,
+        "features": "orb",
+        "n_features": 500,
+        "seam_finder": "no",
+        "blender": "feather",
+        "exposure_compensator": "no",
+        "panorama_exposure_compensator": "gain",
+    },
+    "balanced": {
+        "registration_resol": 0.5,
+        "seam_estimation_resol": 0.1,
+        "compositing_resol": 2.0,
+        "features": "orb",
+        "n_features": 500,
+        "seam_finder": "dp_color",
+        "blender": "multiband",
+        "exposure_compensator": "no",
+        "panorama_exposure_compensator": "gain_blocks",
+    },
+    "full": {
+        "registration_resol": 0.6,
+        "seam_estimation_resol": 0.1,
+        "compositing_resol": -1,
+        "features": "orb",
+        "n_features": 500,
+        "seam_finder": "gc_color",
+        "blender": "multiband",
+        "exposure_compensator": "no",
+        "panorama_exposure_compensator": "gain_blocks",
+    },
+}
+
+DEFAULT_PROFILE = "full"
+
+
+def get_profile(name: str = None) -> dict:
+    """
+    Get stitching profile by name
+    :param name: profile name, DEFAULT_PROFILE if None
+    :return: copy of the profile settings including its name
+    """
+    if name is None:
+        name = DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Invalid profile : {name}, available profiles : {list(PROFILES.keys())}")
+    profile = dict(PROFILES[name])
+    profile["name"] = name
+    return profile
@@ -0,0 +1,123 @@
+import os
+import shutil
+import threading
+
+import cv2
+import numpy as np
+
+TILE_SIZE = 256
+TILE_FORMAT = "jpg"
+TILE_JPEG_QUALITY = 85
+
+"""
+    정합 결과(opencv_{idx}.jpg)를 Deep Zoom(DZI) 형식의 타일 피라미드로 만듭니다.
+    {이미지 이름}.dzi에는 크기와 타일 정보가, {이미지 이름}_files/{level}/{col}_{row}.jpg에는 타일이 저장되므로
+    OpenSeadragon 등의 뷰어가 보이는 영역의 타일만 받아서 확대/이동할 수 있습니다.
+    level은 0(1x1 픽셀)부터 max_level(원본 크기)까지이며, 한 level 내려갈 때마다 가로 세로가 절반이 됩니다.
+    타일은 클러스터 정합 직후 워커가 메모리의 결과로 미리 만들고,
+    없거나 원본보다 오래된 경우 처음 요청될 때 한 번 만들어서 저장합니다.
+    피라미드는 임시 폴더에 만든 뒤 {이미지 이름}_files로 이름을 바꾸고, .dzi 파일은 그 다음 마지막에 쓰므로
+    .dzi가 있으면 피라미드가 완성된 것이며, 만드는 중인 타일 폴더를 다른 요청이 지우지 않습니다.
+"""
+
+DZI_TEMPLATE = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" TileSize="{tile_size}" Overlap="0" '
+                'Format="{format}"><Size Width="{width}" Height="{height}"/></Image>\n')
+
+_tile_locks = {}
+_tile_locks_guard = threading.Lock()
+
+
+def _get_lock(image_path: str) -> threading.Lock:
+    with _tile_locks_guard:
+        if image_path not in _tile_locks:
+            _tile_locks[image_path] = threading.Lock()
+        return _tile_locks[image_path]
+
+
+def get_dzi_path(image_path: str) -> str:
+    return f"{os.path.splitext(image_path)[0]}.dzi"
+
+
+def get_tiles_dir(image_path: str) -> str:
+    return f"{os.path.splitext(image_path)[0]}_files"
+
+
+def get_max_level(width: int, height: int) -> int:
+    return int(np.ceil(np.log2(max(width, height, 1))))
+
+
+def build_tiles(image: np.ndarray, image_path: str, tile_size: int = TILE_SIZE):
+    """
+    Build tile pyramid of the decoded image next to image_path
+    :param image: decoded image
+    :param image_path: path of the stitched image, e.g. opencv_output/opencv_0.jpg
+    :param tile_size: width and height of each tile
+    """
+    dzi_path = get_dzi_path(image_path)
+    tiles_dir = get_tiles_dir(image_path)
+    # 워커 프로세스와 서버가 동시에 만들 수 있으므로 각자 다른 임시 폴더를 사용함
+    suffix = f"{os.getpid()}.{threading.get_ident()}"
+    tmp_dir = f"{tiles_dir}.{suffix}.tmp"
+    old_dir = f"{tiles_dir}.{suffix}.old"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    height, width = image.shape[:2]
+    max_level = get_max_level(width, height)
+    level_image = image
+    for level in range(max_level, -1, -1):
+        level_dir = os.path.join(tmp_dir, str(level))
+        os.makedirs(level_dir, exist_ok=True)
+        level_height, level_width = level_image.shape[:2]
+        for row, top in enumerate(range(0, level_height, tile_size)):
+            for col, left in enumerate(range(0, level_width, tile_size)):
+                tile = level_image[top:top + tile_size, left:left + tile_size]
+                cv2.imwrite(os.path.join(level_dir, f"{col}_{row}.{TILE_FORMAT}"), tile,
+                            [cv2.IMWRITE_JPEG_QUALITY, TILE_JPEG_QUALITY])
+        if level > 0:
+            # ceil로 줄여야 level별 크기가 DZI 규칙(ceil(width / 2^(max_level - level)))과 같음
+            level_image = cv2.resize(level_image, ((level_width + 1) // 2, (level_height + 1) // 2),
+                                     interpolation=cv2.INTER_AREA)
+
+    if os.path.exists(dzi_path):
+        os.remove(dzi_path)
+    try:
+        if os.path.exists(tiles_dir):
+            os.rename(tiles_dir, old_dir)
+        os.rename(tmp_dir, tiles_dir)
+    except OSError:
+        # 다른 요청이 먼저 피라미드를 옮겨 놓은 경우, 그 요청이 .dzi를 씀
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return
+    finally:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    tmp_path = f"{dzi_path}.{suffix}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(DZI_TEMPLATE.format(tile_size=tile_size, format=TILE_FORMAT, width=width, height=height))
+    os.replace(tmp_path, dzi_path)
+
+
+def is_tiled(image_path: str) -> bool:
+    dzi_path = get_dzi_path(image_path)
+    return os.path.exists(dzi_path) and os.path.getmtime(dzi_path) >= os.path.getmtime(image_path)
+
+
+def ensure_tiles(image_path: str) -> bool:
+    """
+    Build tile pyramid of image_path if it does not exist or is older than the image
+    :param image_path: path of the stitched image
+    :return: False if the image does not exist
+    """
+    if not os.path.exists(image_path):
+        return False
+    if is_tiled(image_path):
+        return True
+    # 같은 이미지의 타일 요청이 동시에 와도 한 번만 만듦
+    with _get_lock(image_path):
+        if not is_tiled(image_path):
+            image = cv2.imread(image_path)
+            if image is None:
+                return False
+            build_tiles(image, image_path)
+    return True
@@ -0,0 +1,138 @@
+import base64
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from src.file_cache import CacheDirectory, get_content_hash
+from src.stitcher_step1.src.img_io import read_reduced
+
+THUMBNAIL_DIR = "./thumbnail_cache"
+# 썸네일 긴 변의 기본 픽셀 수와 허용 범위
+THUMBNAIL_SIZE = 256
+MIN_THUMBNAIL_SIZE = 32
+MAX_THUMBNAIL_SIZE = 1024
+THUMBNAIL_JPEG_QUALITY = 75
+# 썸네일 캐시 전체 크기 제한, 넘으면 가장 오래 사용하지 않은 썸네일부터 삭제함
+THUMBNAIL_BUDGET = 512 * 1024 * 1024
+THUMBNAIL_WORKERS = 4
+# 한 번에 반환하는 썸네일 수
+THUMBNAIL_PAGE_SIZE = 50
+MAX_THUMBNAIL_PAGE_SIZE = 200
+# 썸네일을 만들 폴더, {데이터 폴더}/{폴더 이름}
+THUMBNAIL_KINDS = {"images": "images", "outputs": "opencv_output"}
+THUMBNAIL_SUFFIXES = {".jpg", ".jpeg", ".png", ".tif", ".tiff"}
+
+"""
+    입력 이미지(images)와 정합 결과(opencv_output)의 썸네일을 만들고 캐시합니다.
+    캐시 파일은 {THUMBNAIL_DIR}/{이미지 내용 sha256}_{크기}.jpg 이므로, 내용이 같은 이미지는 데이터셋이 달라도 공유합니다.
+    이미지 내용의 hash는 (경로, 크기, 수정 시각)이 같으면 메모리에 저장된 값을 다시 사용합니다.
+    JPEG는 썸네일 크기에 맞춰 1/2, 1/4, 1/8로 줄여서 디코딩하므로 원본 전체를 디코딩하지 않습니다.
+    파일의 접근 시각(atime)을 마지막 사용 시각으로 사용하여, 전체 크기가 THUMBNAIL_BUDGET을 넘으면 오래된 것부터 삭제합니다.
+"""
+
+_lock = threading.Lock()
+_directory = None
+_executor = None
+
+
+def get_directory() -> CacheDirectory:
+    global _directory
+    with _lock:
+        if _directory is None:
+            _directory = CacheDirectory(THUMBNAIL_DIR, THUMBNAIL_BUDGET, ".jpg", use_atime=True)
+        return _directory
+
+
+def clamp_size(size: int) -> int:
+    return min(max(int(size), MIN_THUMBNAIL_SIZE), MAX_THUMBNAIL_SIZE)
+
+
+def make_thumbnail(image_path: str, size: int) -> bytes | None:
+    """
+    Decode image at the smallest JPEG reduction which is still larger than size and encode thumbnail
+    :param image_path: image path
+    :param size: maximum width or height of the thumbnail
+    :return: encoded JPEG, None if the image cannot be decoded
+    """
+    image = read_reduced(image_path, min_long_side=size)
+    if image is None:
+        return None
+    scale = size / max(image.shape[:2])
+    if scale < 1.0:
+        image = cv2.resize(image, dsize=None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    success, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_JPEG_QUALITY])
+    return encoded.tobytes() if success else None
+
+
+def get_thumbnail(image_path: str, size: int = THUMBNAIL_SIZE) -> str | None:
+    """
+    Get cached thumbnail of the image, create it if it is not cached
+    :param image_path: image path
+    :param size: maximum width or height of the thumbnail
+    :return: path of the cached thumbnail, None if the image does not exist or cannot be decoded
+    """
+    if not os.path.isfile(image_path):
+        return None
+    try:
+        content_hash = get_content_hash(image_path)
+    except FileNotFoundError:
+        return None
+    directory = get_directory()
+    thumbnail_path = os.path.join(THUMBNAIL_DIR, f"{content_hash}_{size}.jpg")
+    # 마지막 사용 시각(atime)만 갱신, 수정 시각은 ETag에 사용되므로 유지함
+    if directory.touch(thumbnail_path):
+        return thumbnail_path
+
+    encoded = make_thumbnail(image_path, size)
+    if encoded is None:
+        return None
+    tmp_path = f"{thumbnail_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(encoded)
+    os.replace(tmp_path, thumbnail_path)
+    directory.add_bytes(len(encoded))
+    return thumbnail_path
+
+
+def list_thumbnail_images(data_path: str, kind: str) -> list[str]:
+    """
+    List images of the dataset which can have thumbnails, sorted by name
+    :param data_path: path of the dataset
+    :param kind: one of THUMBNAIL_KINDS
+    :return: image paths
+    """
+    image_dir = os.path.join(data_path, THUMBNAIL_KINDS[kind])
+    if not os.path.isdir(image_dir):
+        return []
+    return [os.path.join(image_dir, name) for name in sorted(os.listdir(image_dir))
+            if os.path.splitext(name)[1].lower() in THUMBNAIL_SUFFIXES
+            and os.path.isfile(os.path.join(image_dir, name))]
+
+
+def get_thumbnails(image_paths: list[str], size: int = THUMBNAIL_SIZE, inline: bool = False) -> list[dict]:
+    """
+    Get thumbnails of images in parallel
+    :param image_paths: image paths
+    :param size: maximum width or height of the thumbnails
+    :param inline: include base64 encoded thumbnails
+    :return: list of {"name", "available", "data"(if inline)}
+    """
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix="thumbnail")
+    items = []
+    for image_path, thumbnail_path in zip(image_paths, _executor.map(get_thumbnail, image_paths,
+                                                                     [size] * len(image_paths))):
+        item = {"name": os.path.basename(image_path), "available": thumbnail_path is not None}
+        if inline and thumbnail_path is not None:
+            try:
+                with open(thumbnail_path, "rb") as f:
+                    item["data"] = f"data:image/jpeg;base64,{base64.b64encode(f.read()).decode()}"
+            except FileNotFoundError:
+                # 반환하기 전에 다른 요청이 캐시를 비운 경우
+                item["available"] = False
+        items.append(item)
+    return items
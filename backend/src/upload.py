@@ -0,0 +1,366 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid as uuid_lib
+
+# 업로드 파일을 디스크에 쓰는 단위
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# 쓰는 중인 파일을 두는 폴더, images 폴더에는 완성된 파일만 나타남
+UPLOAD_TMP_DIR_NAME = "upload_tmp"
+# 이어받기 업로드 세션의 chunk 크기 (클라이언트가 범위 안에서 지정 가능)
+SESSION_CHUNK_SIZE = 4 * 1024 * 1024
+MIN_SESSION_CHUNK_SIZE = 256 * 1024
+MAX_SESSION_CHUNK_SIZE = 16 * 1024 * 1024
+SESSION_FILE_NAME = "session.json"
+SHA256_LENGTH = 64
+# 마지막 chunk를 받은 뒤(updatedAt) 이 시간(초)이 지난 미완료 세션은 삭제함
+SESSION_TTL = 24 * 60 * 60
+# 완료된 세션은 완료 요청을 다시 보낼 수 있는 동안만 남겨둠(finalizedAt 기준, 초)
+FINALIZED_SESSION_TTL = 60 * 60
+# 만료된 세션을 찾는 주기(초)
+SESSION_SWEEP_INTERVAL = 10 * 60
+
+"""
+    업로드된 파일을 저장하는 함수들을 정의합니다.
+    파일은 UPLOAD_CHUNK_SIZE 단위로 임시 파일에 쓴 뒤 images 폴더로 이름을 바꾸므로,
+    메모리에는 chunk 하나만 올라가고 images 폴더에는 완전한 파일만 존재합니다.
+    이 함수들은 블로킹 함수이므로 FastAPI 핸들러에서는 asyncio.to_thread로 호출합니다.
+
+    연결이 자주 끊기는 환경을 위해 이어받기 업로드 세션을 제공합니다.
+    1. 세션 생성: 올릴 파일 목록(이름, 크기, sha256)을 등록하고, 파일마다 크기만큼의 임시 파일을 만듭니다.
+       sha256은 모든 파일에 필수입니다.
+    2. chunk 업로드: 파일의 offset 위치에 chunk를 씁니다. offset은 chunkSize의 배수여야 합니다.
+    3. 조회: 파일마다 아직 받지 못한 chunk 번호를 반환하므로, 클라이언트는 빠진 chunk만 다시 보냅니다.
+    4. 완료: 모든 chunk를 받았으면 sha256을 검증하고 images 폴더로 옮깁니다.
+       검증에 실패한 파일은 모든 chunk를 다시 받아야 합니다.
+    세션은 {데이터 폴더}/upload_tmp/{세션 id}/session.json에 저장되어 서버가 재시작되어도 유지됩니다.
+    완료된 세션은 session.json에 finalizedAt을 기록하여 남겨두므로, 응답을 받지 못한 클라이언트가 완료를 다시 요청하거나
+    늦게 도착한 chunk를 보내면 SessionFinalizedError(409)를 받습니다.
+    세션은 클라이언트가 삭제(DELETE)할 수 있으며, 삭제되지 않은 세션은 백그라운드 스레드가 SESSION_SWEEP_INTERVAL마다
+    미완료 세션은 updatedAt이 SESSION_TTL, 완료된 세션은 finalizedAt이 FINALIZED_SESSION_TTL보다 오래되면 삭제합니다.
+    세션이 아닌 업로드(write_upload)가 서버 종료로 남긴 .part 파일도 SESSION_TTL이 지나면 삭제합니다.
+    {
+        "sessionId": "...", "id": "데이터 이름", "chunkSize": 4194304, "createdAt": ..., "updatedAt": ...,
+        "finalizedAt": None,
+        "files": [{"name": "a.jpg", "size": 15000000, "sha256": "...", "nChunks": 4, "received": [0, 2]}]
+    }
+"""
+
+
+def get_upload_tmp_dir(data_path: str) -> str:
+    tmp_dir = os.path.join(data_path, UPLOAD_TMP_DIR_NAME)
+    os.makedirs(tmp_dir, exist_ok=True)
+    return tmp_dir
+
+
+def write_upload(source, file_location: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> bool:
+    """
+    Copy uploaded file to file_location chunk by chunk through a temporary file
+    :param source: readable binary file object, e.g. UploadFile.file
+    :param file_location: final path of the file, its parent is the images folder
+    :param chunk_size: bytes copied at once
+    :return: True if the file is new, False if an existing file is overwritten
+    """
+    data_path = os.path.dirname(os.path.dirname(file_location))
+    tmp_path = os.path.join(get_upload_tmp_dir(data_path), f"{uuid_lib.uuid4().hex}.part")
+    try:
+        with open(tmp_path, "wb") as f:
+            shutil.copyfileobj(source, f, chunk_size)
+        is_new = not os.path.exists(file_location)
+        os.replace(tmp_path, file_location)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return is_new
+
+
+class SessionFinalizedError(Exception):
+    pass
+
+
+_session_locks = {}
+_session_locks_guard = threading.Lock()
+_sweeper = None
+
+
+def _get_session_lock(session_id: str) -> threading.Lock:
+    with _session_locks_guard:
+        if session_id not in _session_locks:
+            _session_locks[session_id] = threading.Lock()
+        return _session_locks[session_id]
+
+
+class UploadSession:
+    def __init__(self, data_path: str, session: dict):
+        self.data_path = data_path
+        self.session = session
+        self.session_dir = os.path.join(data_path, UPLOAD_TMP_DIR_NAME, session["sessionId"])
+        self.lock = _get_session_lock(session["sessionId"])
+
+    @classmethod
+    def create(cls, data_path: str, data_id: str, files: list[dict], chunk_size: int = SESSION_CHUNK_SIZE):
+        """
+        Create upload session and preallocate temporary file of each file
+        :param data_path: path of the dataset
+        :param data_id: name of the dataset
+        :param files: list of {"name", "size", "sha256"}
+        :param chunk_size: bytes of each chunk
+        :return: upload session
+        """
+        if not MIN_SESSION_CHUNK_SIZE <= chunk_size <= MAX_SESSION_CHUNK_SIZE:
+            raise ValueError(f"chunkSize should be between {MIN_SESSION_CHUNK_SIZE} and {MAX_SESSION_CHUNK_SIZE}")
+        if not files:
+            raise ValueError("files should not be empty")
+        session_files = []
+        for file in files:
+            name, size = file.get("name"), file.get("size")
+            if not name or os.path.basename(name) != name or name.startswith("."):
+                raise ValueError(f"Invalid file name : {name}")
+            if not isinstance(size, int) or size < 0:
+                raise ValueError(f"Invalid file size : {name}")
+            sha256 = file.get("sha256")
+            if not isinstance(sha256, str) or len(sha256) != SHA256_LENGTH \
+                    or any(c not in "0123456789abcdefABCDEF" for c in sha256):
+                raise ValueError(f"Invalid sha256 : {name}")
+            session_files.append({"name": name, "size": size, "sha256": sha256.lower(),
+                                  "nChunks": max(1, -(-size // chunk_size)), "received": []})
+        if len({file["name"] for file in session_files}) != len(session_files):
+            raise ValueError("Duplicated file name")
+
+        now = time.time()
+        session = cls(data_path, {"sessionId": uuid_lib.uuid4().hex, "id": data_id, "chunkSize": chunk_size,
+                                  "createdAt": now, "updatedAt": now, "finalizedAt": None,
+                                  "files": session_files})
+        os.makedirs(session.session_dir, exist_ok=True)
+        for idx, file in enumerate(session_files):
+            with open(session._part_path(idx), "wb") as f:
+                f.truncate(file["size"])
+        session._save()
+        return session
+
+    @classmethod
+    def load(cls, data_path: str, session_id: str):
+        """
+        Load upload session
+        :return: upload session, None if the session does not exist
+        """
+        if not session_id.isalnum():
+            return None
+        try:
+            with open(os.path.join(data_path, UPLOAD_TMP_DIR_NAME, session_id, SESSION_FILE_NAME), "r") as f:
+                return cls(data_path, json.load(f))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def delete(self):
+        """
+        Remove the session and its temporary files, received chunks are thrown away
+        """
+        with self.lock:
+            shutil.rmtree(self.session_dir, ignore_errors=True)
+        with _session_locks_guard:
+            _session_locks.pop(self.session["sessionId"], None)
+
+    def is_expired(self, now: float = None) -> bool:
+        now = now or time.time()
+        if self.session.get("finalizedAt") is not None:
+            return now - self.session["finalizedAt"] > FINALIZED_SESSION_TTL
+        return now - self.session["updatedAt"] > SESSION_TTL
+
+    def _part_path(self, file_idx: int) -> str:
+        return os.path.join(self.session_dir, f"{file_idx}.part")
+
+    def _save(self):
+        self.session["updatedAt"] = time.time()
+        session_path = os.path.join(self.session_dir, SESSION_FILE_NAME)
+        tmp_path = f"{session_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.session, f)
+        os.replace(tmp_path, session_path)
+
+    def _find_file(self, name: str) -> tuple[int, dict]:
+        for idx, file in enumerate(self.session["files"]):
+            if file["name"] == name:
+                return idx, file
+        raise ValueError(f"File is not in the session : {name}")
+
+    def write_chunk(self, name: str, offset: int, data: bytes) -> dict:
+        """
+        Write chunk at offset of the file
+        :param name: file name
+        :param offset: byte offset, multiple of chunkSize
+        :param data: chunk, chunkSize bytes except the last chunk of the file
+        :return: progress of the session
+        :raise FileNotFoundError: if the session is deleted
+        :raise SessionFinalizedError: if the session is already finalized
+        """
+        file_idx, file = self._find_file(name)
+        chunk_size = self.session["chunkSize"]
+        if offset < 0 or offset % chunk_size != 0 or (offset >= file["size"] and file["size"] > 0):
+            raise ValueError(f"Invalid offset : {offset}")
+        chunk_idx = offset // chunk_size
+        if len(data) != min(chunk_size, file["size"] - offset):
+            raise ValueError(f"Invalid chunk length : {len(data)}, expected {min(chunk_size, file['size'] - offset)}")
+
+        # 완료 처리가 임시 파일을 images 폴더로 옮긴 뒤에 쓰지 않도록 lock 안에서 씀
+        with self.lock:
+            self._reload()
+            with open(self._part_path(file_idx), "r+b") as f:
+                f.seek(offset)
+                f.write(data)
+            file = self.session["files"][file_idx]
+            if chunk_idx not in file["received"]:
+                file["received"].append(chunk_idx)
+                file["received"].sort()
+                self._save()
+        return self.progress()
+
+    def _reload(self):
+        """
+        Reload the session saved by other requests, call it with the lock
+        :raise FileNotFoundError: if the session is deleted
+        :raise SessionFinalizedError: if the session is already finalized
+        """
+        loaded = UploadSession.load(self.data_path, self.session["sessionId"])
+        if loaded is None:
+            raise FileNotFoundError(f"Session not found : {self.session['sessionId']}")
+        self.session = loaded.session
+        if self.session.get("finalizedAt") is not None:
+            raise SessionFinalizedError(f"Session is already finalized : {self.session['sessionId']}")
+
+    def missing_chunks(self) -> dict:
+        """
+        :return: dict of {file name: list of chunk indices not received}
+        """
+        missing = {}
+        for file in self.session["files"]:
+            received = set(file["received"])
+            chunks = [idx for idx in range(file["nChunks"]) if idx not in received]
+            if chunks:
+                missing[file["name"]] = chunks
+        return missing
+
+    def progress(self) -> dict:
+        missing = self.missing_chunks()
+        return {
+            "sessionId": self.session["sessionId"],
+            "chunkSize": self.session["chunkSize"],
+            "files": [{"name": file["name"], "size": file["size"], "nChunks": file["nChunks"]}
+                      for file in self.session["files"]],
+            "missing": missing,
+            "complete": not missing,
+            "finalized": self.session.get("finalizedAt") is not None,
+        }
+
+    def finalize(self, image_dir: str, checksums: dict = None) -> tuple[list[str], list[str], dict]:
+        """
+        Verify sha256 of received files and move them to image_dir
+        :param image_dir: images folder of the dataset
+        :param checksums: dict of {file name: sha256}, overrides sha256 given at creation
+        :return: moved file names, newly created file names, dict of {file name: error}.
+                 Nothing is moved if there is any error
+        :raise ValueError: if sha256 of a file is not given
+        :raise FileNotFoundError: if the session is deleted
+        :raise SessionFinalizedError: if the session is already finalized
+        """
+        checksums = checksums or {}
+        with self.lock:
+            self._reload()
+            errors = {name: "Missing chunks" for name in self.missing_chunks()}
+            if errors:
+                return [], [], errors
+
+            missing_checksums = [file["name"] for file in self.session["files"]
+                                 if not checksums.get(file["name"], file["sha256"])]
+            if missing_checksums:
+                raise ValueError(f"Missing sha256 : {', '.join(missing_checksums)}")
+            for idx, file in enumerate(self.session["files"]):
+                expected = checksums.get(file["name"], file["sha256"])
+                sha256 = hashlib.sha256()
+                with open(self._part_path(idx), "rb") as f:
+                    for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+                        sha256.update(chunk)
+                if sha256.hexdigest() != expected.lower():
+                    # 잘못 받은 파일은 처음부터 다시 받음
+                    file["received"] = []
+                    errors[file["name"]] = "Checksum mismatch"
+            if errors:
+                self._save()
+                return [], [], errors
+
+            os.makedirs(image_dir, exist_ok=True)
+            names, new_names = [], []
+            for idx, file in enumerate(self.session["files"]):
+                file_location = os.path.join(image_dir, file["name"])
+                if not os.path.exists(file_location):
+                    new_names.append(file["name"])
+                os.replace(self._part_path(idx), file_location)
+                names.append(file["name"])
+            # 완료를 다시 요청한 클라이언트가 완료 여부를 알 수 있도록 세션 파일은 남겨둠
+            self.session["finalizedAt"] = time.time()
+            self._save()
+            return names, new_names, {}
+
+
+def sweep_sessions(data_dir: str, now: float = None) -> list[str]:
+    """
+    Remove expired upload sessions and leftover temporary files of every dataset
+    :param data_dir: directory of datasets
+    :param now: current time, time.time() if None
+    :return: ids of removed sessions
+    """
+    now = now or time.time()
+    removed = []
+    if not os.path.isdir(data_dir):
+        return removed
+    for data_name in os.listdir(data_dir):
+        data_path = os.path.join(data_dir, data_name)
+        tmp_dir = os.path.join(data_path, UPLOAD_TMP_DIR_NAME)
+        if not os.path.isdir(tmp_dir):
+            continue
+        for name in os.listdir(tmp_dir):
+            path = os.path.join(tmp_dir, name)
+            try:
+                if os.path.isdir(path):
+                    session = UploadSession.load(data_path, name)
+                    if session is not None:
+                        if session.is_expired(now):
+                            session.delete()
+                            removed.append(name)
+                    elif now - os.path.getmtime(path) > SESSION_TTL:
+                        # session.json을 쓰기 전에 서버가 종료된 세션
+                        shutil.rmtree(path, ignore_errors=True)
+                elif name.endswith(".part") and now - os.path.getmtime(path) > SESSION_TTL:
+                    os.remove(path)
+            except FileNotFoundError:
+                # 다른 요청이 먼저 삭제한 경우
+                continue
+    return removed
+
+
+def _sweep_loop(data_dir: str):
+    while True:
+        try:
+            removed = sweep_sessions(data_dir)
+            if removed:
+                print(f"Expired upload sessions are removed: {removed}")
+        except Exception as e:
+            print(f"Upload session sweep failed: {e}")
+        time.sleep(SESSION_SWEEP_INTERVAL)
+
+
+def start_session_sweeper(data_dir: str):
+    """
+    Start background thread which removes expired upload sessions every SESSION_SWEEP_INTERVAL
+    :param data_dir: directory of datasets
+    """
+    global _sweeper
+    with _session_locks_guard:
+        if _sweeper is not None:
+            return
+        _sweeper = threading.Thread(target=_sweep_loop, args=(data_dir,), daemon=True)
+        _sweeper.start()
@@ -0,0 +1,71 @@
+import os
+import zipfile
+
+# 원본 파일을 읽어서 zip으로 내보내는 단위
+ZIP_CHUNK_SIZE = 1024 * 1024
+# 이미 압축된 형식은 다시 압축하지 않고 그대로(stored) 저장함
+STORED_SUFFIXES = {".jpg", ".jpeg", ".png", ".tif", ".tiff"}
+
+"""
+    파일들을 임시 zip 파일 없이 바로 zip 스트림으로 내보냅니다.
+    zipfile은 seek할 수 없는 출력에는 각 항목 뒤에 data descriptor를 쓰므로, 출력 버퍼에 쓰인 내용을
+    ZIP_CHUNK_SIZE 단위로 바로 내보낼 수 있고 메모리 사용량은 파일 크기와 관계없이 일정합니다.
+    JPEG, PNG 등 이미 압축된 이미지는 stored로, 로그와 json 등은 deflate로 저장합니다.
+"""
+
+
+class _StreamBuffer:
+    """
+    Write-only file object for zipfile, written bytes are taken out by drain
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """
+        Yield bytes written so far, nothing if empty
+        """
+        if self.chunks:
+            data = b"".join(self.chunks)
+            self.chunks = []
+            yield data
+
+
+def iter_zip(files: list[tuple[str, str]], chunk_size: int = ZIP_CHUNK_SIZE):
+    """
+    Build zip archive of files on the fly
+    :param files: list of (name in the archive, file path)
+    :param chunk_size: bytes read from a file at once
+    :return: generator of bytes of the archive
+    """
+    buffer = _StreamBuffer()
+    # tell만 있고 seek가 없으므로 zipfile은 data descriptor를 사용함
+    with zipfile.ZipFile(buffer, mode="w", allowZip64=True) as archive:
+        for arcname, path in files:
+            try:
+                info = zipfile.ZipInfo.from_file(path, arcname)
+                source = open(path, "rb")
+            except FileNotFoundError:
+                # 목록을 만든 뒤 삭제된 파일은 건너뜀
+                continue
+            info.compress_type = zipfile.ZIP_STORED if os.path.splitext(path)[1].lower() in STORED_SUFFIXES \
+                else zipfile.ZIP_DEFLATED
+            with source, archive.open(info, mode="w") as destination:
+                for chunk in iter(lambda: source.read(chunk_size), b""):
+                    destination.write(chunk)
+                    yield from buffer.drain()
+            yield from buffer.drain()
+    yield from buffer.drain()
@@ -2,85 +2,191 @@ import socket
 import json
 import struct
 import os
+import sys
+import threading
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+# 동시에 처리하는 연결 수, 초과한 연결은 listen backlog에서 대기함
+MAX_CONNECTIONS = 32
+# 동시에 디스크에 쓰는 연결 수
+MAX_DISK_WRITERS = 8
+LISTEN_BACKLOG = 128
+# 응답이 없는 클라이언트가 연결을 계속 점유하지 않도록 recv timeout(초)을 둠
+CLIENT_TIMEOUT = 60
+# 세션에서 확인 응답 없이 보낼 수 있는 파일 수
+SESSION_WINDOW = 16
+MAX_SESSION_WINDOW = 256
+# 연결마다 한 번 할당하여 재사용하는 수신 버퍼, 버퍼가 찰 때마다 한 번에 디스크에 씀
+RECV_BUFFER_SIZE = 1024 * 1024
+# 진행률 출력 주기(초)
+PROGRESS_INTERVAL = 1.0
+# 파일을 모두 받은 뒤 저장 경로로 호출하는 함수, --features로 실행하면 특징점 캐시를 백그라운드에서 채움
+file_saved_hook = None
+
+"""
+    드론/지상국에서 TCP로 전송하는 이미지를 받아 저장합니다.
+    accept 루프는 연결을 받기만 하고, 각 연결은 최대 MAX_CONNECTIONS개의 스레드 풀에서 처리합니다.
+    디스크 쓰기는 MAX_DISK_WRITERS개로 제한하여 연결이 많아도 디스크에 동시에 쓰는 양을 조절합니다.
+    수신은 연결마다 미리 할당한 버퍼에 recv_into로 바로 받아 RECV_BUFFER_SIZE 단위로 디스크에 씁니다.
+    --benchmark로 실행하면 로컬 송신 클라이언트로 수신 속도(MB/s)를 측정합니다.
+    프로토콜 (연결당 파일 하나)
+    1. 클라이언트: 메타데이터 길이 (4바이트, big endian) + 메타데이터 JSON {"fileName", "fileSize", "folderName"}
+    2. 서버: OK
+    3. 클라이언트: 파일 내용 (fileSize 바이트)
+    4. 서버: OK
+    세션 프로토콜 (연결당 여러 파일), 첫 메타데이터의 type이 session이면 세션으로 처리함
+    1. 클라이언트: 메타데이터 JSON {"type": "session", "folderName", "window", "fileCount"(선택)}
+    2. 서버: OK + window (4바이트), 서버가 허용한 window
+    3. 클라이언트: 파일마다 메타데이터 JSON {"fileName", "fileSize"} + 파일 내용을 응답을 기다리지 않고 연속으로 보냄
+       확인 응답을 받지 못한 파일이 window개가 되면 응답을 기다림
+    4. 서버: window의 절반만큼 받을 때마다 A + 지금까지 받은 파일 수 (4바이트)
+    5. 클라이언트: 길이가 0인 메타데이터 (4바이트 0)로 세션을 끝냄
+    6. 서버: M + manifest 길이 (4바이트) + manifest JSON {"folderName", "received", "totalBytes", "files", "complete"}
+"""
+
 
 def ensure_directory(directory):
     if not os.path.exists(directory):
-        os.makedirs(directory)
+        # 여러 연결이 같은 폴더를 동시에 만들 수 있음
+        os.makedirs(directory, exist_ok=True)
         print(f"Created directory: {directory}")
 
 
 # tcp_server.py
 
-def receive_file(client_socket, base_dir="datasets"):
-    try:
-        # 메타데이터 길이 수신 (4바이트)
-        metadata_length_bytes = client_socket.recv(4)
-        if not metadata_length_bytes:
+def recv_exact(client_socket, view):
+    """
+    Receive exactly len(view) bytes into view
+    :param view: writable memoryview
+    :return: number of received bytes, less than len(view) if the connection is closed
+    """
+    n_received = 0
+    while n_received < len(view):
+        n = client_socket.recv_into(view[n_received:])
+        if n == 0:
+            break
+        n_received += n
+    return n_received
+
+
+def write_exact(f, view):
+    """
+    Write every byte of view, unbuffered file may write fewer bytes than given
+    :param f: file opened with buffering=0
+    :param view: memoryview to write
+    """
+    n_written = 0
+    while n_written < len(view):
+        n_written += f.write(view[n_written:])
+
+
+def receive_metadata(client_socket):
+    """
+    Receive length-prefixed JSON metadata
+    :return: metadata, {} if the length is 0 (end of session), None if failed
+    """
+    # 메타데이터 길이 수신 (4바이트)
+    metadata_length_bytes = bytearray(4)
+    n_received = recv_exact(client_socket, memoryview(metadata_length_bytes))
+    if n_received != 4:
+        if n_received == 0:
             print("Failed to receive metadata length")
-            return False
+        else:
+            print(f"Incomplete metadata length received: {n_received}/4")
+        return None
 
-        metadata_size = struct.unpack('!I', metadata_length_bytes)[0]
-        print(f"Expected metadata size: {metadata_size}")
+    metadata_size = struct.unpack('!I', metadata_length_bytes)[0]
+    if metadata_size == 0:
+        return {}
 
-        # 메타데이터 수신
-        metadata_bytes = b''
-        remaining = metadata_size
+    # 메타데이터 수신
+    metadata_bytes = bytearray(metadata_size)
+    n_received = recv_exact(client_socket, memoryview(metadata_bytes))
+    if n_received != metadata_size:
+        print(f"Incomplete metadata received: {n_received}/{metadata_size}")
+        return None
+
+    try:
+        metadata = json.loads(metadata_bytes.decode('utf-8'))
+        print(f"Parsed metadata: {metadata}")
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        print(f"JSON parsing error: {e}")
+        return None
+    return metadata
 
-        while remaining > 0:
-            chunk = client_socket.recv(remaining)
-            if not chunk:
+
+def get_save_path(base_dir, folder_name, file_name):
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"{timestamp}_{file_name}"
+
+    # 최종 저장 디렉토리 설정 (base_dir/folder_name)
+    save_dir = os.path.join(base_dir, folder_name, "images")
+
+    # 저장 디렉토리 생성
+    ensure_directory(save_dir)
+    return os.path.join(save_dir, filename)
+
+
+def receive_body(client_socket, save_path, file_size, disk_writers=None, show_progress=True, buffer=None):
+    """
+    Receive file_size bytes and save them to save_path
+    :param buffer: reusable receive buffer, allocated if None
+    :return: number of received bytes
+    """
+    if buffer is None:
+        buffer = bytearray(RECV_BUFFER_SIZE)
+    view = memoryview(buffer)
+    total_received = 0
+    last_progress = time.monotonic()
+
+    with open(save_path, 'wb', buffering=0) as f:
+        while total_received < file_size:
+            # 버퍼를 채운 뒤 한 번에 씀
+            n_filled = recv_exact(client_socket, view[:min(len(view), file_size - total_received)])
+            if n_filled == 0:
                 break
-            metadata_bytes += chunk
-            remaining -= len(chunk)
+            if disk_writers is None:
+                write_exact(f, view[:n_filled])
+            else:
+                with disk_writers:
+                    write_exact(f, view[:n_filled])
+            total_received += n_filled
+            now = time.monotonic()
+            if show_progress and now - last_progress >= PROGRESS_INTERVAL:
+                last_progress = now
+                progress = (total_received / file_size) * 100
+                print(f"Progress: {progress:.1f}% ({total_received}/{file_size}) -> {save_path}")
 
-        if len(metadata_bytes) != metadata_size:
-            print(f"Incomplete metadata received: {len(metadata_bytes)}/{metadata_size}")
-            return False
+    print(f"File saved: {save_path}")
+    return total_received
 
-        metadata_json = metadata_bytes.decode('utf-8')
-        print(f"Received metadata: {metadata_json}")
 
-        try:
-            metadata = json.loads(metadata_json)
-            print(f"Parsed metadata: {metadata}")
-        except json.JSONDecodeError as e:
-            print(f"JSON parsing error: {e}")
+def receive_file(client_socket, base_dir="datasets", disk_writers=None):
+    try:
+        # 세션의 모든 파일이 같은 버퍼를 사용함
+        buffer = bytearray(RECV_BUFFER_SIZE)
+        metadata = receive_metadata(client_socket)
+        if not metadata:
             return False
 
+        # 여러 파일을 하나의 연결로 받는 세션
+        if metadata.get('type') == 'session':
+            return receive_session(client_socket, metadata, base_dir, disk_writers, buffer)
+
         # 메타데이터 수신 확인 송신
         client_socket.send(b'OK')
 
         # 파일 저장 경로 설정
         folder_name = metadata.get('folderName', time.strftime("%Y%m%d_%H%M%S"))
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{timestamp}_{metadata['fileName']}"
-
-        # 최종 저장 디렉토리 설정 (base_dir/folder_name)
-        save_dir = os.path.join(base_dir, folder_name, "images")
-        save_path = os.path.join(save_dir, filename)
-
-        # 저장 디렉토리 생성
-        ensure_directory(save_dir)
+        save_path = get_save_path(base_dir, folder_name, metadata['fileName'])
 
         # 파일 수신 및 저장
-        total_received = 0
-        file_size = metadata['fileSize']
-
-        with open(save_path, 'wb') as f:
-            while total_received < file_size:
-                chunk = client_socket.recv(min(32768, file_size - total_received))
-                if not chunk:
-                    break
-                f.write(chunk)
-                total_received += len(chunk)
-                progress = (total_received / file_size) * 100
-                print(f"\rProgress: {progress:.1f}% ({total_received}/{file_size}) -> {save_path}", end='')
-
-        print(f"\nFile saved: {save_path}")
+        n_bytes = receive_body(client_socket, save_path, metadata['fileSize'], disk_writers, buffer=buffer)
+        if n_bytes == metadata['fileSize']:
+            notify_file_saved(save_path)
 
         # 파일 수신 완료 확인 송신
         client_socket.send(b'OK')
@@ -92,33 +198,225 @@ def receive_file(client_socket, base_dir="datasets"):
         return False
 
 
-def start_server(host='0.0.0.0', port=9999, base_dir='datasets'):
+def receive_session(client_socket, session, base_dir="datasets", disk_writers=None, buffer=None):
+    """
+    Receive many files over one connection, see the protocol above
+    :param session: session metadata {"type": "session", "folderName", "window", "fileCount"}
+    :return: True if the session is finished and the manifest is sent
+    """
+    window = max(1, min(int(session.get('window', SESSION_WINDOW)), MAX_SESSION_WINDOW))
+    ack_every = max(1, window // 2)
+    folder_name = session.get('folderName', time.strftime("%Y%m%d_%H%M%S"))
+    client_socket.sendall(b'OK' + struct.pack('!I', window))
+
+    received = []
+    n_unacked = 0
+    while True:
+        metadata = receive_metadata(client_socket)
+        if metadata is None:
+            print(f"Session of {folder_name} is closed before the end, {len(received)} files received")
+            return False
+        # 길이가 0인 메타데이터는 세션의 끝
+        if not metadata:
+            break
+
+        save_path = get_save_path(base_dir, folder_name, metadata['fileName'])
+        n_bytes = receive_body(client_socket, save_path, metadata['fileSize'], disk_writers, show_progress=False,
+                               buffer=buffer)
+        if n_bytes != metadata['fileSize']:
+            print(f"Incomplete file received: {n_bytes}/{metadata['fileSize']} -> {save_path}")
+            return False
+        notify_file_saved(save_path)
+        received.append({"fileName": metadata['fileName'], "savedAs": os.path.basename(save_path),
+                         "fileSize": n_bytes})
+
+        # 파일마다 기다리지 않도록 window의 절반마다 누적 개수로 확인 응답함
+        n_unacked += 1
+        if n_unacked >= ack_every:
+            client_socket.sendall(b'A' + struct.pack('!I', len(received)))
+            n_unacked = 0
+
+    manifest = {"folderName": folder_name, "received": len(received),
+                "totalBytes": sum(file['fileSize'] for file in received), "files": received}
+    if 'fileCount' in session:
+        manifest["complete"] = len(received) == session['fileCount']
+    manifest_bytes = json.dumps(manifest).encode('utf-8')
+    client_socket.sendall(b'M' + struct.pack('!I', len(manifest_bytes)) + manifest_bytes)
+    print(f"Session of {folder_name} is finished, {len(received)} files received")
+    return True
+
+
+def notify_file_saved(save_path):
+    if file_saved_hook is None:
+        return
+    try:
+        file_saved_hook(save_path)
+    except Exception as e:
+        print(f"File saved hook failed: {save_path} | {e}")
+
+
+def load_feature_hook():
+    """
+    Load feature cache of the backend, which computes features of saved images in background threads
+    :return: hook function, None if the backend cannot be loaded
+    """
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+    try:
+        from src.stitcher_step1.src.feature_cache import schedule_features
+    except ImportError as e:
+        print(f"Feature cache is disabled: {e}")
+        return None
+    return lambda save_path: schedule_features([save_path])
+
+
+def handle_client(client_socket, addr, base_dir, disk_writers, connections):
+    try:
+        client_socket.settimeout(CLIENT_TIMEOUT)
+        receive_file(client_socket, base_dir, disk_writers)
+    except Exception as e:
+        print(f"Error handling client {addr}: {e}")
+    finally:
+        client_socket.close()
+        connections.release()
+
+
+def create_server_socket(host, port):
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     server_socket.bind((host, port))
-    server_socket.listen(5)
+    server_socket.listen(LISTEN_BACKLOG)
+    return server_socket
+
+
+def serve(server_socket, base_dir='datasets', max_connections=MAX_CONNECTIONS, max_disk_writers=MAX_DISK_WRITERS):
+    connections = threading.BoundedSemaphore(max_connections)
+    disk_writers = threading.BoundedSemaphore(max_disk_writers)
+    executor = ThreadPoolExecutor(max_workers=max_connections)
+    try:
+        while True:
+            # 처리 중인 연결이 가득 차면 자리가 날 때까지 accept하지 않음
+            connections.acquire()
+            try:
+                client_socket, addr = server_socket.accept()
+            except BaseException:
+                connections.release()
+                raise
+            print(f"Connected by {addr}")
+            executor.submit(handle_client, client_socket, addr, base_dir, disk_writers, connections)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def start_server(host='0.0.0.0', port=9999, base_dir='datasets', max_connections=MAX_CONNECTIONS,
+                 max_disk_writers=MAX_DISK_WRITERS):
+    server_socket = create_server_socket(host, port)
 
     # 기본 저장 디렉토리 생성
     ensure_directory(base_dir)
     print(f"Server listening on {host}:{port}")
     print(f"Base directory for received files: {base_dir}")
+    print(f"Max connections: {max_connections}, max disk writers: {max_disk_writers}")
 
     try:
+        serve(server_socket, base_dir, max_connections, max_disk_writers)
+    except KeyboardInterrupt:
+        print("\nServer shutting down...")
+    finally:
+        server_socket.close()
+
+
+def send_file(host, port, folder_name, file_name, data):
+    """
+    Send one file with the single file protocol, used by the benchmark
+    """
+    with socket.create_connection((host, port)) as sock:
+        metadata = json.dumps({"fileName": file_name, "fileSize": len(data), "folderName": folder_name}).encode()
+        sock.sendall(struct.pack('!I', len(metadata)) + metadata)
+        if sock.recv(2) != b'OK':
+            raise Exception("Metadata is not acknowledged")
+        sock.sendall(data)
+        if sock.recv(2) != b'OK':
+            raise Exception("File is not acknowledged")
+
+
+def send_session(host, port, folder_name, files, window=SESSION_WINDOW):
+    """
+    Send files with the session protocol, used by the benchmark
+    :param files: list of (file name, data)
+    :return: manifest
+    """
+    def recv_bytes(sock, size):
+        data = bytearray(size)
+        if recv_exact(sock, memoryview(data)) != size:
+            raise Exception("Connection is closed")
+        return bytes(data)
+
+    with socket.create_connection((host, port)) as sock:
+        metadata = json.dumps({"type": "session", "folderName": folder_name, "window": window,
+                               "fileCount": len(files)}).encode()
+        sock.sendall(struct.pack('!I', len(metadata)) + metadata)
+        if recv_bytes(sock, 2) != b'OK':
+            raise Exception("Session is not acknowledged")
+        window = struct.unpack('!I', recv_bytes(sock, 4))[0]
+
+        n_acked = 0
+        for idx, (file_name, data) in enumerate(files):
+            while idx - n_acked >= window:
+                if recv_bytes(sock, 1) != b'A':
+                    raise Exception("Unexpected response")
+                n_acked = struct.unpack('!I', recv_bytes(sock, 4))[0]
+            metadata = json.dumps({"fileName": file_name, "fileSize": len(data)}).encode()
+            sock.sendall(struct.pack('!I', len(metadata)) + metadata)
+            sock.sendall(data)
+        sock.sendall(struct.pack('!I', 0))
+
         while True:
-            client_socket, addr = server_socket.accept()
-            print(f"\nConnected by {addr}")
+            frame_type = recv_bytes(sock, 1)
+            value = struct.unpack('!I', recv_bytes(sock, 4))[0]
+            if frame_type == b'M':
+                return json.loads(recv_bytes(sock, value))
 
-            try:
-                receive_file(client_socket, base_dir)
-            except Exception as e:
-                print(f"Error handling client: {e}")
-            finally:
-                client_socket.close()
 
-    except KeyboardInterrupt:
-        print("\nServer shutting down...")
+def run_benchmark(n_files=200, file_size_mb=4.0, n_clients=4, base_dir=None, max_connections=MAX_CONNECTIONS,
+                  max_disk_writers=MAX_DISK_WRITERS):
+    """
+    Start the server on a local port and measure receive throughput of both protocols
+    """
+    import shutil
+    import tempfile
+
+    temp_dir = None
+    if base_dir is None:
+        base_dir = temp_dir = tempfile.mkdtemp(prefix="listener_benchmark_")
+    server_socket = create_server_socket('127.0.0.1', 0)
+    port = server_socket.getsockname()[1]
+    threading.Thread(target=serve, args=(server_socket, base_dir, max_connections, max_disk_writers),
+                     daemon=True).start()
+
+    data = os.urandom(int(file_size_mb * 1024 * 1024))
+    total_mb = n_files * len(data) / 1024 / 1024
+    results = {}
+    try:
+        with ThreadPoolExecutor(max_workers=n_clients) as executor:
+            start_time = time.time()
+            list(executor.map(lambda idx: send_file('127.0.0.1', port, "benchmark_single", f"{idx}.bin", data),
+                              range(n_files)))
+            results["single"] = time.time() - start_time
+
+            start_time = time.time()
+            files = [(f"{idx}.bin", data) for idx in range(n_files)]
+            list(executor.map(lambda client: send_session('127.0.0.1', port, f"benchmark_session_{client}",
+                                                          files[client::n_clients]), range(n_clients)))
+            results["session"] = time.time() - start_time
     finally:
         server_socket.close()
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    print(f"Benchmark: {n_files} files x {file_size_mb} MB, {n_clients} clients")
+    for protocol, elapsed in results.items():
+        print(f"{protocol:>8} : {total_mb / elapsed:.1f} MB/s ({elapsed:.2f}s)")
+    return results
 
 
 if __name__ == "__main__":
@@ -128,9 +426,27 @@ if __name__ == "__main__":
     parser.add_argument('--port', type=int, default=9999, help='Port to listen on')
     parser.add_argument('--host', type=str, default='0.0.0.0', help='Host to bind to')
     parser.add_argument('--dir', type=str, default='datasets', help='Base directory to save files')
+    parser.add_argument('--max-connections', type=int, default=MAX_CONNECTIONS,
+                        help='Maximum number of clients served at once')
+    parser.add_argument('--max-writers', type=int, default=MAX_DISK_WRITERS,
+                        help='Maximum number of clients writing to disk at once')
+    parser.add_argument('--features', action='store_true',
+                        help='Compute stitching features of received images in background (needs backend packages)')
+    parser.add_argument('--benchmark', action='store_true', help='Measure receive throughput with local senders')
+    parser.add_argument('--bench-files', type=int, default=200, help='Number of files sent in the benchmark')
+    parser.add_argument('--bench-size', type=float, default=4.0, help='File size (MB) in the benchmark')
+    parser.add_argument('--bench-clients', type=int, default=4, help='Number of senders in the benchmark')
 
     args = parser.parse_args()
 
+    if args.features:
+        file_saved_hook = load_feature_hook()
+
+    if args.benchmark:
+        run_benchmark(args.bench_files, args.bench_size, args.bench_clients, max_connections=args.max_connections,
+                      max_disk_writers=args.max_writers)
+        exit(0)
+
     print(f"Starting server...")
     print(f"Base directory: {args.dir}")
-    start_server(args.host, args.port, args.dir)
\ No newline at end of file
+    start_server(args.host, args.port, args.dir, args.max_connections, args.max_writers)